@@ -0,0 +1,4 @@
+"""Performance benchmarks for the backend.
+
+Run from the ``backend`` folder, e.g. ``python -m benchmarks.scheduler``.
+"""
@@ -0,0 +1,183 @@
+"""Parity, latency and memory of the inference backends.
+
+Converts a Keras model to TFLite (``float32``, ``float16`` and ``int8``, see
+``convert_model.py``) in a temporary folder. Each variant, and the Keras original,
+then runs in a fresh interpreter over the same preprocessed windows:
+
+- windows: the sample recording, tiled to ``--minutes`` like
+  ``benchmarks.reclassify``, plus synthetic devices with an AF-like rhythm, cut
+  every ``--stride`` samples on every channel; the int8 calibration uses separate
+  synthetic windows
+- parity against Keras: label agreement and max/mean absolute difference of the
+  confidence
+- latency: p50/p99 of live-path calls (one device, 3 channels) and of
+  ``--batch``-window calls (scheduler, reclassify)
+- memory: peak RSS of the process once the backend is loaded (runtime import
+  included) and after the run
+
+``--tflite`` adds already converted models to the comparison.
+
+Usage (from ``backend``):
+    python -m benchmarks.backends --model ../models/model.keras
+    python -m benchmarks.backends --model ../models/model.keras --tflite ../models/model_int8.tflite
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy
+import pandas
+
+from benchmarks.report import summarize
+from benchmarks.synthetic import SyntheticDevice
+from convert_model import tile_recording
+from infer import WINDOW_SIZE, preprocess_windows
+
+SAMPLE = Path(__file__).resolve().parents[2] / "data" / "2025-11-17T02-01-41Z_ppg.csv"
+
+
+def sample_windows(minutes: float, stride: int, synthetic_devices: int = 4, seed: int = 0) -> numpy.ndarray:
+    """Raw (N, 250) windows: the tiled sample recording plus synthetic devices, every channel."""
+    from reclassify import windows_of
+
+    sample = pandas.read_csv(SAMPLE, index_col=0)
+    n = int(minutes * 60 * 25)
+    values = tile_recording(sample.to_numpy().T, n).astype(numpy.float32)
+    timestamps = int(sample.index[0]) + 40 * numpy.arange(n, dtype=numpy.int64)
+    recordings = [(timestamps, values)]
+    for i in range(synthetic_devices):
+        device = SyntheticDevice(f"parity-{i}", seed=seed + i, af_probability=0.5 if i % 2 else 0.0)
+        recordings.append(device.read(n))
+    windows = [windows_of(ts, vals.astype(numpy.float32), stride)[1].reshape(-1, WINDOW_SIZE)
+               for ts, vals in recordings]
+    return numpy.concatenate(windows)
+
+
+def rss_mb() -> float:
+    """Peak RSS of this process in MB.
+
+    ``VmHWM`` restarts at ``exec``, unlike ``ru_maxrss`` which a child inherits from
+    the parent at ``fork`` (here, a parent that has TensorFlow loaded for the conversion).
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_worker(model: str, backend: str, windows_path: str, out_path: str, iterations: int, batch: int) -> dict:
+    """Loads one backend in this process and times it (the ``--worker`` side)."""
+    from infer import Inferer
+
+    windows = numpy.load(windows_path)
+    baseline = rss_mb()
+    start = time.perf_counter()
+    inferer = Inferer(model, backend=backend)
+    load_seconds = time.perf_counter() - start
+    loaded = rss_mb()
+
+    predictions = numpy.concatenate([inferer.predict(windows[i:i + batch]) for i in range(0, windows.shape[0], batch)])
+    numpy.save(out_path, predictions)
+
+    live, batched = [], []
+    for i in range(iterations):
+        chunk = windows[(3 * i) % (windows.shape[0] - 3):][:3]
+        start = time.perf_counter()
+        inferer.predict(chunk)
+        live.append(time.perf_counter() - start)
+    for i in range(max(3, iterations // 10)):
+        start = time.perf_counter()
+        inferer.predict(windows[:batch])
+        batched.append(time.perf_counter() - start)
+
+    return {"load_seconds": load_seconds, "baseline_rss_mb": baseline, "loaded_rss_mb": loaded,
+            "final_rss_mb": rss_mb(), "live": summarize(live, 3), "batched": summarize(batched, batch)}
+
+
+def measure(model: str, backend: str, windows_path: str, iterations: int, batch: int) -> tuple[dict, numpy.ndarray]:
+    """Runs ``run_worker`` in a fresh interpreter and returns its report and predictions."""
+    with tempfile.TemporaryDirectory() as folder:
+        out_path = os.path.join(folder, "predictions.npy")
+        out = subprocess.run([sys.executable, "-m", "benchmarks.backends", "--worker", model, "--backend", backend,
+                              "--windows", windows_path, "--out", out_path, "--iterations", str(iterations),
+                              "--batch", str(batch)],
+                             capture_output=True, text=True, cwd=Path(__file__).resolve().parents[1])
+        for line in out.stdout.splitlines():
+            if line.startswith("RESULT "):
+                return json.loads(line[len("RESULT "):]), numpy.load(out_path)
+    raise RuntimeError(f"{backend} worker failed on {model}:\n{out.stderr[-2000:]}")
+
+
+def parity(predictions: numpy.ndarray, reference: numpy.ndarray) -> dict:
+    confidence = numpy.max(predictions, axis=1)
+    reference_confidence = numpy.max(reference, axis=1)
+    difference = numpy.abs(confidence - reference_confidence)
+    return {
+        "label_agreement": float(numpy.mean(numpy.argmax(predictions, axis=1) == numpy.argmax(reference, axis=1))),
+        "max_confidence_diff": float(difference.max()),
+        "mean_confidence_diff": float(difference.mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Keras model (the reference)")
+    parser.add_argument("--tflite", nargs="*", default=[], help="extra .tflite models to compare")
+    parser.add_argument("--minutes", type=float, default=2.0, help="minutes per recording")
+    parser.add_argument("--stride", type=int, default=25, help="samples between windows")
+    parser.add_argument("--iterations", type=int, default=300, help="timed live-path calls")
+    parser.add_argument("--batch", type=int, default=64, help="windows per batched call")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--windows", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print("RESULT " + json.dumps(run_worker(args.worker, args.backend, args.windows, args.out,
+                                                args.iterations, args.batch)))
+        return
+    if not args.model:
+        parser.error("--model is required")
+
+    from convert_model import convert
+
+    windows = preprocess_windows(sample_windows(args.minutes, args.stride)).astype(numpy.float32)
+    calibration = preprocess_windows(sample_windows(0.5, WINDOW_SIZE, seed=100))
+    print(f"{windows.shape[0]} windows ({args.minutes:g} min per recording, stride {args.stride}); "
+          f"{calibration.shape[0]} calibration windows")
+
+    with tempfile.TemporaryDirectory(prefix="ppg-backends-") as folder:
+        windows_path = os.path.join(folder, "windows.npy")
+        numpy.save(windows_path, windows)
+        variants = [("keras", args.model, "keras")]
+        for quantize in ("none", "float16", "int8"):
+            path = convert(args.model, Path(folder) / f"model_{quantize}.tflite", quantize, calibration)
+            variants.append((f"tflite {'float32' if quantize == 'none' else quantize}", str(path), "tflite"))
+        variants += [(Path(path).name, path, "tflite") for path in args.tflite]
+
+        print(f"\n{'variant':<18} {'size KB':>8} {'load s':>7} {'RSS MB':>7} {'live p50 ms':>12} {'live p99 ms':>12} "
+              f"{'batch p50 ms':>13} {'agree':>7} {'max dconf':>10}")
+        reference = None
+        for name, path, backend in variants:
+            report, predictions = measure(path, backend, windows_path, args.iterations, args.batch)
+            if reference is None:
+                reference = predictions
+            check = parity(predictions, reference)
+            print(f"{name:<18} {os.path.getsize(path) / 1024:>8.1f} {report['load_seconds']:>7.2f} "
+                  f"{report['loaded_rss_mb']:>7.0f} {report['live']['p50_ms']:>12.3f} {report['live']['p99_ms']:>12.3f} "
+                  f"{report['batched']['p50_ms']:>13.3f} {check['label_agreement']:>7.2%} "
+                  f"{check['max_confidence_diff']:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
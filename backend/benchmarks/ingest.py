@@ -0,0 +1,88 @@
+"""Per-request CPU of JSON vs. binary ingestion.
+
+For batches of 25, 250 and 2,500 samples (override with ``--sizes``) this measures
+the CPU time (``time.process_time``) needed to turn a request body into arrays:
+
+- ``json + loop``: ``json.loads`` + the previous pure-Python delta loop + DataFrame
+- ``json``: ``json.loads`` + ``ppg_dict_to_arrays`` (vectorized delta decoding)
+- ``binary``: ``decode_ppg_binary`` on the packed body (absolute and delta forms)
+
+Bodies are built from the sample recording; JSON bodies use the ``*_DELTA`` keys
+the devices send. Body sizes are reported too.
+
+Usage (from ``backend``):
+    python -m benchmarks.ingest --iterations 2000
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+import numpy
+import pandas
+
+from data import ppg_dict_to_arrays, decode_ppg_binary, encode_ppg_binary
+
+SAMPLE = Path(__file__).resolve().parents[2] / "data" / "2025-11-17T02-01-41Z_ppg.csv"
+COLUMNS = ["RED", "IR", "GREEN"]
+
+
+def make_batch(size: int) -> tuple[numpy.ndarray, numpy.ndarray]:
+    sample = pandas.read_csv(SAMPLE, index_col=0)
+    values = numpy.resize(numpy.concatenate([sample.to_numpy(), sample.to_numpy()[::-1]]), (size, len(COLUMNS)))
+    timestamps = int(sample.index[0]) + 40 * numpy.arange(size, dtype=numpy.int64)
+    return timestamps, values.T.astype(numpy.int64)
+
+
+def json_body(timestamps: numpy.ndarray, values: numpy.ndarray) -> bytes:
+    payload = {"TIMESTAMP_DELTA": numpy.diff(timestamps, prepend=0).tolist()}
+    for name, channel in zip(COLUMNS, values):
+        payload[f"{name}_DELTA"] = numpy.diff(channel, prepend=0).tolist()
+    return json.dumps(payload).encode()
+
+
+def legacy_decode(body: bytes) -> pandas.DataFrame:
+    """The JSON path before vectorization: Python-level delta loop per key + DataFrame."""
+    data = json.loads(body)
+    columns = {}
+    for key in ["TIMESTAMP"] + COLUMNS:
+        deltas = data[f"{key}_DELTA"]
+        values = [deltas[0]]
+        for delta in deltas[1:]:
+            values.append(values[-1] + delta)
+        columns[key] = values
+    index = columns.pop("TIMESTAMP")
+    return pandas.DataFrame(columns, index=index)
+
+
+def cpu_per_call(fn, body: bytes, iterations: int) -> float:
+    start = time.process_time()
+    for _ in range(iterations):
+        fn(body)
+    return (time.process_time() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[25, 250, 2500])
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'samples':>8} {'method':<14} {'body bytes':>11} {'us/request':>11} {'vs json+loop':>13}")
+    for size in args.sizes:
+        timestamps, values = make_batch(size)
+        iterations = max(20, args.iterations * 25 // size)
+        runs = [
+            ("json + loop", legacy_decode, json_body(timestamps, values)),
+            ("json", lambda b: ppg_dict_to_arrays(json.loads(b)), json_body(timestamps, values)),
+            ("binary", decode_ppg_binary, encode_ppg_binary(timestamps, COLUMNS, values)),
+            ("binary delta", decode_ppg_binary, encode_ppg_binary(timestamps, COLUMNS, values, delta=True)),
+        ]
+        baseline = None
+        for name, fn, body in runs:
+            elapsed = cpu_per_call(fn, body, iterations)
+            baseline = baseline or elapsed
+            print(f"{size:>8} {name:<14} {len(body):>11} {elapsed * 1e6:>11.1f} {baseline / elapsed:>12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
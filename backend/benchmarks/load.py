@@ -0,0 +1,164 @@
+"""End-to-end load test of the ingest pipeline, in process.
+
+Starts the FastAPI app behind starlette's ASGI ``TestClient`` (no network) with
+its data folder in a temporary directory. ``--devices`` synthetic devices
+(``benchmarks.synthetic``) each POST ``--batch`` samples to ``/`` (or
+``/binary``) from their own thread, and ``--viewers`` WebSocket clients stay
+connected to ``/ws`` meanwhile.
+
+Devices post in real time (one batch every ``batch / 25`` s) unless
+``--as-fast-as-possible`` is given. The report covers:
+
+- POST latency p50/p99 and ingested samples/s
+- per viewer, messages and bytes received and, for JSON viewers, the delivery
+  latency from the start of the POST to the arrival of its broadcast
+
+Usage (from ``backend``):
+    python -m benchmarks.load --devices 20 --viewers 5 --seconds 20
+    python -m benchmarks.load --devices 50 --as-fast-as-possible --model ../models/model.keras
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from benchmarks.report import summarize, print_table
+from benchmarks.synthetic import SyntheticDevice, FS
+
+LOCALHOST = ("127.0.0.1", 50000)
+
+
+def run_load(devices: int = 10, viewers: int = 2, seconds: float = 10.0, batch: int = 25, delta: bool = True,
+             binary: bool = False, realtime: bool = True, viewer_format: str = "json",
+             model_path: Optional[str] = None) -> dict:
+    """Runs one load test and returns ``{"post": summary, "delivery": summary, ...}``."""
+    data_dir = tempfile.mkdtemp(prefix="ppg-load-")
+    os.environ["PPG_DATA_DIR"] = data_dir
+    os.environ["PPG_VIDEO_DIR"] = os.path.join(data_dir, "videos")
+    if model_path:
+        os.environ["PPG_MODEL_PATH"] = model_path
+    else:
+        os.environ.pop("PPG_MODEL_PATH", None)
+    # main reads its configuration from the environment at import time
+    import main
+    from fastapi.testclient import TestClient
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    post_durations: list[float] = []
+    delivery: list[float] = []
+    sent_at: dict[tuple[str, int], float] = {}
+    received = [{"messages": 0, "bytes": 0} for _ in range(viewers)]
+    errors: list[str] = []
+
+    def device_loop(client, index: int):
+        device = SyntheticDevice(f"load-{index}", seed=index)
+        interval = batch / FS
+        next_post = time.perf_counter() + interval * index / max(devices, 1)
+        while not stop.is_set():
+            if realtime:
+                time.sleep(max(0.0, next_post - time.perf_counter()))
+                next_post += interval
+            first_ts = device.next_ms
+            start = time.perf_counter()
+            with lock:
+                sent_at[(device.device_id, first_ts)] = start
+            if binary:
+                response = client.post("/binary", content=device.binary(batch, delta),
+                                       headers={"Content-Type": "application/octet-stream"})
+            else:
+                response = client.post("/", json=device.payload(batch, delta))
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                errors.append(f"{response.status_code}: {response.text[:200]}")
+            with lock:
+                post_durations.append(elapsed)
+
+    def viewer_loop(client, index: int, ready: threading.Event):
+        with client.websocket_connect(f"/ws?format={viewer_format}") as ws:
+            ready.set()
+            while not stop.is_set():
+                message = ws.receive()
+                now = time.perf_counter()
+                payload = message.get("text") or message.get("bytes")
+                if payload is None:
+                    break
+                received[index]["messages"] += 1
+                received[index]["bytes"] += len(payload)
+                if viewer_format == "json":
+                    data = json.loads(payload)
+                    index_ts = data.get("raw", {}).get("index")
+                    with lock:
+                        start = sent_at.get((data.get("device"), index_ts[0])) if index_ts else None
+                    if start is not None:
+                        delivery.append(now - start)
+
+    with TestClient(main.app, client=LOCALHOST) as client:
+        # the model and the video subsystem load in the background: measure steady state only
+        while client.get("/ready").status_code != 200:
+            time.sleep(0.05)
+        viewer_threads = []
+        for i in range(viewers):
+            ready = threading.Event()
+            thread = threading.Thread(target=viewer_loop, args=(client, i, ready), daemon=True)
+            thread.start()
+            ready.wait(5.0)
+            viewer_threads.append(thread)
+
+        device_threads = [threading.Thread(target=device_loop, args=(client, i), daemon=True) for i in range(devices)]
+        started = time.perf_counter()
+        for thread in device_threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in device_threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        # One more broadcast wakes viewers blocked in receive() so they see the stop flag.
+        client.post("/", json=SyntheticDevice("load-stop", seed=0).payload(batch))
+        for thread in viewer_threads:
+            thread.join(5.0)
+        stats = client.get("/stats").json()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+    return {
+        "post": summarize(post_durations, batch, elapsed),
+        "delivery": summarize(delivery, elapsed=elapsed),
+        "viewers": received,
+        "dropped_messages": stats.get("websocket", {}).get("dropped"),
+        "errors": errors[:10],
+        "config": {"devices": devices, "viewers": viewers, "seconds": seconds, "batch": batch, "delta": delta,
+                   "binary": binary, "realtime": realtime, "viewer_format": viewer_format,
+                   "model": bool(model_path)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--viewers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch", type=int, default=25, help="samples per POST")
+    parser.add_argument("--absolute", action="store_true", help="absolute payloads instead of *_DELTA")
+    parser.add_argument("--binary", action="store_true", help="POST packed bodies to /binary")
+    parser.add_argument("--viewer-format", choices=("json", "binary"), default="json")
+    parser.add_argument("--as-fast-as-possible", action="store_true", help="post back to back instead of at 25 Hz")
+    parser.add_argument("--model", help="Keras model (inference disabled when omitted)")
+    args = parser.parse_args()
+
+    result = run_load(args.devices, args.viewers, args.seconds, args.batch, not args.absolute, args.binary,
+                      not args.as_fast_as_possible, args.viewer_format, args.model)
+    print_table("load", {"post": result["post"], "delivery": result["delivery"]})
+    for i, viewer in enumerate(result["viewers"]):
+        print(f"viewer {i}: {viewer['messages']} messages, {viewer['bytes'] / 1024:.0f} KB")
+    print(f"dropped WebSocket messages: {result['dropped_messages']}")
+    for error in result["errors"]:
+        print("error:", error)
+
+
+if __name__ == "__main__":
+    main()
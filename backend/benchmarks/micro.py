@@ -0,0 +1,146 @@
+"""Microbenchmarks of the ingest pipeline stages.
+
+Each stage runs on synthetic data (``benchmarks.synthetic``) and reports p50/p99
+latency per call and samples/s:
+
+- ``ppg_dict_to_dataframe``: one ``*_DELTA`` payload of ``--batch`` samples
+- ``bandpass_filter``: one 250-sample window, zero-phase
+- ``inferer_classify``: ``Inferer.classify`` on a batch once the window is full
+  (only with ``--model``)
+- ``broadcast``: ``ConnectionManager.broadcast`` of one JSON payload to
+  ``--clients`` idle clients (queueing only; delivery is asynchronous)
+- ``csv_writer``: ``store_ppg_dataframe_to_csv`` of one batch
+- ``video_frame``: one frame of the raster GREEN video recorder
+
+Usage (from ``backend``):
+    python -m benchmarks.micro --iterations 500
+    python -m benchmarks.micro --model ../models/model.keras
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from typing import Optional
+import numpy
+
+from benchmarks.report import summarize, time_calls, print_table
+from benchmarks.synthetic import SyntheticDevice, FS
+from connections import ConnectionManager
+from data import ppg_dict_to_dataframe, store_ppg_dataframe_to_csv
+from infer import Inferer, bandpass_filter, robust_normalize, WINDOW_SIZE
+from video import RasterGreenChannelVideoRecorder
+
+VIDEO_WINDOW = 250
+
+
+class IdleWebSocket:
+    """Stand-in for a connected browser that accepts every message immediately."""
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        pass
+
+    async def send_bytes(self, message: bytes):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def bench_dataframe(batch: int, iterations: int) -> dict:
+    payload = SyntheticDevice("micro", seed=0).payload(batch, delta=True)
+    return summarize(time_calls(lambda: ppg_dict_to_dataframe(payload), iterations), batch)
+
+
+def bench_bandpass(iterations: int) -> dict:
+    _, values = SyntheticDevice("micro", seed=0).read(WINDOW_SIZE)
+    green = values[2].astype(numpy.float64)
+    return summarize(time_calls(lambda: bandpass_filter(green, 0.5, 8.0, FS), iterations), WINDOW_SIZE)
+
+
+def bench_classify(model_path: Optional[str], batch: int, iterations: int) -> Optional[dict]:
+    if model_path is None:
+        return None
+    inferer = Inferer(model_path)
+    device = SyntheticDevice("micro", seed=0)
+    frames = [ppg_dict_to_dataframe(device.payload(batch)) for _ in range(iterations + WINDOW_SIZE // batch + 4)]
+    frames = iter(frames)
+    for _ in range(WINDOW_SIZE // batch + 1):
+        inferer.classify(next(frames))
+    return summarize(time_calls(lambda: inferer.classify(next(frames)), iterations, warmup=1), batch)
+
+
+def bench_broadcast(batch: int, clients: int, iterations: int) -> dict:
+    async def run() -> list[float]:
+        manager = ConnectionManager(max_queue=iterations + 8)
+        for _ in range(clients):
+            await manager.connect(IdleWebSocket())
+        message = json.dumps({"device": "micro", "raw": SyntheticDevice("micro", seed=0).payload(batch)})
+        durations = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            manager.broadcast(message)
+            durations.append(time.perf_counter() - start)
+            # let the sender tasks drain between broadcasts
+            await asyncio.sleep(0)
+        await manager.close_all()
+        return durations
+
+    return summarize(asyncio.run(run()), batch)
+
+
+def bench_csv(batch: int, iterations: int) -> dict:
+    device = SyntheticDevice("micro", seed=0)
+    frames = [ppg_dict_to_dataframe(device.payload(batch)) for _ in range(iterations + 3)]
+    frames = iter(frames)
+    with tempfile.TemporaryDirectory() as folder:
+        durations = time_calls(lambda: store_ppg_dataframe_to_csv(folder, next(frames)), iterations)
+    return summarize(durations, batch)
+
+
+def bench_video(iterations: int) -> dict:
+    _, values = SyntheticDevice("micro", seed=0).read(VIDEO_WINDOW + iterations + 3)
+    processed = robust_normalize(bandpass_filter(values[2].astype(numpy.float64), 0.5, 8.0, FS))
+    timestamps = 1763344895.168 + numpy.arange(processed.shape[0]) / FS
+    with tempfile.TemporaryDirectory() as folder:
+        recorder = RasterGreenChannelVideoRecorder(folder, filename_prefix="micro", window=VIDEO_WINDOW, fs=FS)
+        recorder.start_time = float(timestamps[0])
+        frame = iter(range(iterations + 3))
+
+        def write():
+            i = next(frame)
+            recorder.write_frame_from_arrays_with_timestamps(processed[i:i + VIDEO_WINDOW],
+                                                             timestamps[i:i + VIDEO_WINDOW],
+                                                             display_window_seconds=6.0)
+        durations = time_calls(write, iterations)
+        recorder.close()
+    return summarize(durations, 1)
+
+
+def run_all(batch: int = 25, iterations: int = 500, clients: int = 50, model_path: Optional[str] = None) -> dict:
+    """Runs every microbenchmark and returns ``{name: summary}``."""
+    return {
+        "ppg_dict_to_dataframe": bench_dataframe(batch, iterations),
+        "bandpass_filter": bench_bandpass(iterations),
+        "inferer_classify": bench_classify(model_path, batch, max(10, iterations // 5)),
+        "broadcast": bench_broadcast(batch, clients, iterations),
+        "csv_writer": bench_csv(batch, max(10, iterations // 5)),
+        "video_frame": bench_video(max(10, iterations // 5)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=25, help="samples per payload")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=50, help="WebSocket clients for the broadcast benchmark")
+    parser.add_argument("--model", help="Keras model for the classify benchmark")
+    args = parser.parse_args()
+    print_table("microbenchmarks", run_all(args.batch, args.iterations, args.clients, args.model))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Per-channel preprocessing vs. the cached filter bank with axis-wise operations.
+
+- ``per channel``: the previous path. ``butter`` designs (b, a) on every call, then
+  ``filtfilt`` and ``robust_normalize`` run in a Python loop, one row at a time.
+- ``batched``: ``preprocess_windows``. The cached SOS from ``filter_bank``,
+  ``sosfiltfilt`` and ``robust_normalize`` all run along the sample axis of the
+  whole (rows x 250) array.
+
+The benchmark measures one live window (3 channels) and a block of ``--windows``
+windows. It also reports the largest difference between both outputs, which are
+in normalized units.
+
+Usage (from ``backend``):
+    python -m benchmarks.preprocess --windows 1000 --iterations 200
+"""
+import argparse
+import time
+from pathlib import Path
+import numpy
+import pandas
+from scipy.signal import butter, filtfilt
+
+from infer import SAMPLING_RATE, WINDOW_SIZE, preprocess_windows
+
+SAMPLE = Path(__file__).resolve().parents[2] / "data" / "2025-11-17T02-01-41Z_ppg.csv"
+
+
+def legacy(windows: numpy.ndarray) -> numpy.ndarray:
+    processed = numpy.empty(windows.shape, dtype=numpy.float32)
+    for i in range(windows.shape[0]):
+        nyq = SAMPLING_RATE * 0.5
+        b, a = butter(4, [0.5 / nyq, 8.0 / nyq], btype="band")
+        signal = numpy.asarray(filtfilt(b, a, windows[i]), dtype=numpy.float32)
+        med = numpy.median(signal)
+        processed[i] = (signal - med) / (numpy.median(numpy.abs(signal - med)) + 1e-8)
+    return processed
+
+
+def timed(function, data: numpy.ndarray, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(data)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--windows", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    sample = pandas.read_csv(SAMPLE, index_col=0).to_numpy(dtype=numpy.float64).T
+    loop = numpy.concatenate([sample, sample[:, ::-1]], axis=1)
+    signal = numpy.resize(loop, (sample.shape[0], WINDOW_SIZE + args.windows))
+    live = signal[:, :WINDOW_SIZE]
+    block = numpy.stack([signal[i % sample.shape[0], i:i + WINDOW_SIZE] for i in range(args.windows)])
+
+    print(f"{'input':<18} {'per channel':>14} {'batched':>14} {'speedup':>8} {'max diff':>9}")
+    for name, data, iterations in (("live (3 x 250)", live, args.iterations),
+                                   (f"{args.windows} x 250", block, max(1, args.iterations // 20))):
+        slow = timed(legacy, data, iterations)
+        fast = timed(preprocess_windows, data, iterations)
+        diff = float(numpy.max(numpy.abs(legacy(data) - preprocess_windows(data))))
+        print(f"{name:<18} {slow * 1e6:>11.0f} us {fast * 1e6:>11.0f} us {slow / fast:>7.1f}x {diff:>9.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Windowing + preprocessing cost of offline reclassification.
+
+Cuts ``--minutes`` of 3-channel 25 Hz signal into 250-sample windows every
+``--stride`` samples and preprocesses them:
+
+- ``per window``: slicing each window and calling ``preprocess_signals`` on it,
+  as a loop around the live path would
+- ``batched``: ``reclassify.windows_of`` (sliding-window view) + one
+  ``preprocess_windows`` call over the stacked windows
+
+Model time is not included (see ``benchmarks.scheduler`` for batched predicts).
+
+Usage (from ``backend``):
+    python -m benchmarks.reclassify --minutes 60 --stride 250
+"""
+import argparse
+import time
+from pathlib import Path
+import numpy
+import pandas
+
+from infer import WINDOW_SIZE, preprocess_signals, preprocess_windows
+from reclassify import windows_of
+
+SAMPLE = Path(__file__).resolve().parents[2] / "data" / "2025-11-17T02-01-41Z_ppg.csv"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=60)
+    parser.add_argument("--stride", type=int, default=WINDOW_SIZE)
+    args = parser.parse_args()
+
+    sample = pandas.read_csv(SAMPLE, index_col=0)
+    n = int(args.minutes * 60 * 25)
+    values = numpy.resize(numpy.concatenate([sample.to_numpy(), sample.to_numpy()[::-1]]).T,
+                          (sample.shape[1], n)).astype(numpy.float32)
+    timestamps = int(sample.index[0]) + 40 * numpy.arange(n, dtype=numpy.int64)
+
+    start = time.perf_counter()
+    loop = [preprocess_signals(timestamps[i:i + WINDOW_SIZE], values[:, i:i + WINDOW_SIZE])
+            for i in range(0, n - WINDOW_SIZE + 1, args.stride)]
+    per_window = time.perf_counter() - start
+
+    start = time.perf_counter()
+    starts, windows = windows_of(timestamps, values, args.stride)
+    batched_out = preprocess_windows(windows)
+    batched = time.perf_counter() - start
+
+    assert numpy.allclose(numpy.stack(loop, axis=1), batched_out, atol=1e-3)
+    count = starts.shape[0] * values.shape[0]
+    print(f"{count} windows ({args.minutes:g} min x {values.shape[0]} channels, stride {args.stride})")
+    print(f"{'per window':<12} {per_window:8.3f} s  {count / per_window:10.0f} windows/s")
+    print(f"{'batched':<12} {batched:8.3f} s  {count / batched:10.0f} windows/s  ({per_window / batched:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
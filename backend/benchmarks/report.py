@@ -0,0 +1,98 @@
+"""Latency summaries and baseline files shared by the benchmark suite."""
+import json
+import platform
+import time
+from pathlib import Path
+from typing import Callable, Optional
+import numpy
+
+# Metrics where a larger value is a regression; every other metric regresses when it drops.
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "mean_ms")
+COMPARED = LOWER_IS_BETTER + ("samples_per_second", "calls_per_second")
+
+
+def summarize(durations: list[float], samples_per_call: int = 0, elapsed: Optional[float] = None) -> dict:
+    """p50/p99/mean latency in ms and throughput of a list of call durations (seconds).
+
+    ``elapsed`` is the wall time of the run; without it throughput assumes calls ran
+    back to back.
+    """
+    if not durations:
+        return {"count": 0}
+    values = numpy.asarray(durations) * 1000.0
+    elapsed = float(numpy.sum(durations)) if elapsed is None else elapsed
+    summary = {
+        "count": len(durations),
+        "p50_ms": round(float(numpy.percentile(values, 50)), 4),
+        "p99_ms": round(float(numpy.percentile(values, 99)), 4),
+        "mean_ms": round(float(values.mean()), 4),
+        "calls_per_second": round(len(durations) / elapsed, 2) if elapsed > 0 else None,
+    }
+    if samples_per_call:
+        summary["samples_per_second"] = round(len(durations) * samples_per_call / elapsed, 1) if elapsed > 0 else None
+    return summary
+
+
+def time_calls(fn: Callable[[], object], iterations: int, warmup: int = 3) -> list[float]:
+    """Durations (seconds) of ``iterations`` calls of ``fn`` after ``warmup`` untimed calls."""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def print_table(section: str, results: dict[str, dict]) -> None:
+    print(f"\n{section}")
+    print(f"{'benchmark':<28} {'p50 ms':>10} {'p99 ms':>10} {'calls/s':>10} {'samples/s':>12}")
+    for name, r in results.items():
+        if not r or not r.get("count"):
+            print(f"{name:<28} {'skipped':>10}")
+            continue
+        samples = r.get("samples_per_second")
+        print(f"{name:<28} {r['p50_ms']:>10.3f} {r['p99_ms']:>10.3f} {r['calls_per_second'] or 0:>10.1f} "
+              f"{'' if samples is None else f'{samples:.0f}':>12}")
+
+
+def save_baseline(results: dict, path: str | Path) -> None:
+    Path(path).write_text(json.dumps(results, indent=2) + "\n")
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> list[str]:
+    """Metrics of ``results`` worse than ``baseline`` by more than ``tolerance`` (relative).
+
+    Both are ``{section: {benchmark: summary}}``; benchmarks missing on either side
+    are ignored. Returns one line per regression and prints every comparison.
+    """
+    regressions = []
+    print(f"\nComparison with baseline (tolerance {tolerance:.0%})")
+    for section, benchmarks in results.items():
+        if not isinstance(benchmarks, dict) or section == "environment":
+            continue
+        for name, summary in benchmarks.items():
+            before = baseline.get(section, {}).get(name)
+            if not isinstance(summary, dict) or not isinstance(before, dict):
+                continue
+            for metric in COMPARED:
+                new, old = summary.get(metric), before.get(metric)
+                if not new or not old:
+                    continue
+                change = (new - old) / old
+                worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+                flag = "REGRESSION" if worse else ""
+                print(f"{section}/{name:<26} {metric:<20} {old:>12.3f} -> {new:>12.3f} {change:>+8.1%} {flag}")
+                if worse:
+                    regressions.append(f"{section}/{name} {metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
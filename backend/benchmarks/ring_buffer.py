@@ -0,0 +1,83 @@
+"""RingBuffer vs. the pandas concat/tail inference window.
+
+Appends batches of ``--batch`` samples to a 3 x 250 window and reads it back as a
+float32 (C, 250) array, as the inference path does on every POST.
+
+Usage (from ``backend``):
+    python -m benchmarks.ring_buffer --batch 25 --iterations 20000
+"""
+import argparse
+import time
+import numpy
+import pandas
+
+from ringbuffer import RingBuffer
+
+WINDOW = 250
+COLUMNS = ["RED", "IR", "GREEN"]
+
+
+def make_batches(batch: int, count: int) -> list[pandas.DataFrame]:
+    rng = numpy.random.default_rng(0)
+    batches = []
+    t0 = 1763344895168
+    for k in range(count):
+        index = t0 + 40 * (numpy.arange(batch) + k * batch)
+        values = rng.integers(10000, 2000000, size=(batch, len(COLUMNS)))
+        batches.append(pandas.DataFrame(values, index=index, columns=COLUMNS))
+    return batches
+
+
+def bench_concat_tail(batches: list[pandas.DataFrame]) -> float:
+    window = None
+    start = time.perf_counter()
+    for df in batches:
+        window = df.copy() if window is None else pandas.concat([window, df]).tail(WINDOW)
+        if len(window) == WINDOW:
+            signals = numpy.stack([window[c].values.astype(numpy.float32) for c in window.columns])
+    return time.perf_counter() - start
+
+
+def bench_ring_buffer(batches: list[pandas.DataFrame]) -> float:
+    ring = RingBuffer(len(COLUMNS), WINDOW)
+    # Same per-POST conversion the session does (DataFrame -> arrays) is included.
+    start = time.perf_counter()
+    for df in batches:
+        ring.append(df.index.to_numpy(dtype=numpy.int64), df.to_numpy(dtype=numpy.float32).T)
+        if ring.is_full():
+            timestamps, signals = ring.view()
+    return time.perf_counter() - start
+
+
+def bench_ring_buffer_arrays(batches: list[pandas.DataFrame]) -> float:
+    ring = RingBuffer(len(COLUMNS), WINDOW)
+    arrays = [(df.index.to_numpy(dtype=numpy.int64), df.to_numpy(dtype=numpy.float32).T) for df in batches]
+    start = time.perf_counter()
+    for timestamps, values in arrays:
+        ring.append(timestamps, values)
+        if ring.is_full():
+            timestamps, signals = ring.view()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=25)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    batches = make_batches(args.batch, args.iterations)
+    results = [
+        ("pandas concat/tail", bench_concat_tail(batches)),
+        ("RingBuffer (from DataFrame)", bench_ring_buffer(batches)),
+        ("RingBuffer (arrays only)", bench_ring_buffer_arrays(batches)),
+    ]
+    baseline = results[0][1]
+    print(f"{args.iterations} appends of {args.batch} samples into a {len(COLUMNS)}x{WINDOW} window")
+    for name, elapsed in results:
+        per_call = elapsed / args.iterations * 1e6
+        print(f"{name:<30} {per_call:>9.2f} us/append   x{baseline / elapsed:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
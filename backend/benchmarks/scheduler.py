@@ -0,0 +1,90 @@
+"""Throughput vs. added latency of the micro-batching inference scheduler.
+
+Simulates N devices that each submit a (3, 250) window at a fixed rate and
+measures windows/s and per-request latency for several batching settings.
+By default the model is replaced by a synthetic cost model (fixed dispatch
+overhead + per-window cost); pass ``--model`` to benchmark a real Keras model.
+
+Usage (from ``backend``):
+    python -m benchmarks.scheduler --devices 200 --duration 5
+    python -m benchmarks.scheduler --model ../models/model.keras
+"""
+import argparse
+import asyncio
+import time
+import numpy
+
+from scheduler import InferenceScheduler
+
+
+def synthetic_predict(dispatch_ms: float, per_window_ms: float):
+    """Returns a predict function whose cost is ``dispatch_ms + per_window_ms * N``."""
+    def predict(batch: numpy.ndarray) -> numpy.ndarray:
+        time.sleep((dispatch_ms + per_window_ms * batch.shape[0]) / 1000.0)
+        out = numpy.zeros((batch.shape[0], 2), dtype=numpy.float32)
+        out[:, 0] = 1.0
+        return out
+    return predict
+
+
+async def run_config(predict, devices: int, duration: float, interval: float,
+                     max_batch_size: int, max_wait_ms: float) -> dict:
+    scheduler = InferenceScheduler(predict, max_batch_size=max_batch_size,
+                                   max_wait_ms=max_wait_ms, max_queue_depth=max(1024, devices * 3))
+    await scheduler.start()
+    latencies: list[float] = []
+    window = numpy.random.default_rng(0).standard_normal((3, 250)).astype(numpy.float32)
+    stop_at = time.perf_counter() + duration
+
+    async def device(offset: float):
+        await asyncio.sleep(offset)
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            await scheduler.submit(window)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(max(0.0, interval - (time.perf_counter() - start)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(device(i * interval / devices) for i in range(devices)))
+    elapsed = time.perf_counter() - start
+    stats = scheduler.stats()
+    await scheduler.stop()
+
+    lat = numpy.array(latencies) * 1000.0
+    return {
+        "windows_per_s": stats["windows_run"] / elapsed,
+        "mean_batch": stats["mean_batch_size"] or 0.0,
+        "p50_ms": float(numpy.percentile(lat, 50)) if lat.size else float("nan"),
+        "p99_ms": float(numpy.percentile(lat, 99)) if lat.size else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per configuration")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between posts per device")
+    parser.add_argument("--model", default=None, help="path to a Keras model (default: synthetic cost)")
+    parser.add_argument("--dispatch-ms", type=float, default=4.0)
+    parser.add_argument("--per-window-ms", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.model:
+        from infer import Inferer
+        predict = Inferer(args.model).predict
+    else:
+        predict = synthetic_predict(args.dispatch_ms, args.per_window_ms)
+
+    # (max_batch_size, max_wait_ms); batch=3/wait=0 is the unbatched baseline.
+    configs = [(3, 0.0), (16, 5.0), (64, 10.0), (64, 20.0), (128, 50.0)]
+    print(f"{args.devices} devices, one (3, 250) window every {args.interval}s each")
+    print(f"{'batch':>6} {'wait ms':>8} {'win/s':>10} {'mean batch':>11} {'p50 ms':>9} {'p99 ms':>9}")
+    for max_batch_size, max_wait_ms in configs:
+        r = asyncio.run(run_config(predict, args.devices, args.duration, args.interval,
+                                   max_batch_size, max_wait_ms))
+        print(f"{max_batch_size:>6} {max_wait_ms:>8.1f} {r['windows_per_s']:>10.1f} "
+              f"{r['mean_batch']:>11.1f} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Cold-start cost of the server per subsystem configuration.
+
+Each configuration runs in a fresh interpreter (``python -c``) with its own
+environment and reports:
+
+- ``import``: seconds to ``import main`` and the peak RSS right after it
+- ``ready``: seconds from the start of the app until ``GET /ready`` answers 200
+  (background model load and preloads included) and the peak RSS then
+
+Configurations: ``minimal`` (video and session image off, no model),
+``default`` (video and session image on, no model) and, with ``--model``,
+``inference`` (default + model).
+
+Usage (from ``backend``):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --model ../models/model.keras
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Optional
+
+PROBE = r"""
+import json, resource, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+import_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+from fastapi.testclient import TestClient
+with TestClient(main.app, client=("127.0.0.1", 50000)) as client:
+    started = time.perf_counter()
+    while client.get("/ready").status_code != 200:
+        time.sleep(0.02)
+    ready = time.perf_counter() - started
+    ready_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    status = client.get("/ready").json()
+print("RESULT " + json.dumps({"import_seconds": imported, "import_rss_kb": import_rss, "ready_seconds": ready,
+                              "ready_rss_kb": ready_rss, "ready": status}))
+"""
+
+CONFIGURATIONS = {
+    "minimal": {"PPG_VIDEO": "0", "PPG_SESSION_IMAGE": "0"},
+    "default": {},
+}
+
+
+def measure(env: dict[str, str]) -> dict:
+    """Runs the probe in a fresh interpreter with ``env`` added to the environment."""
+    with tempfile.TemporaryDirectory(prefix="ppg-startup-") as data_dir:
+        full_env = dict(os.environ, PPG_DATA_DIR=data_dir, PPG_VIDEO_DIR=os.path.join(data_dir, "videos"))
+        full_env.pop("PPG_MODEL_PATH", None)
+        full_env.update(env)
+        out = subprocess.run([sys.executable, "-c", PROBE], env=full_env, capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    for line in out.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"startup probe failed:\n{out.stderr[-2000:]}")
+
+
+def run_all(model_path: Optional[str] = None) -> dict[str, dict]:
+    configurations = dict(CONFIGURATIONS)
+    if model_path:
+        configurations["inference"] = {"PPG_MODEL_PATH": os.path.abspath(model_path)}
+    return {name: measure(env) for name, env in configurations.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Keras model for the inference configuration")
+    args = parser.parse_args()
+
+    print(f"{'configuration':<14} {'import s':>9} {'import MB':>10} {'ready s':>9} {'ready MB':>9}  subsystems")
+    for name, r in run_all(args.model).items():
+        subsystems = ", ".join(f"{k}={v}" for k, v in r["ready"]["subsystems"].items())
+        print(f"{name:<14} {r['import_seconds']:>9.2f} {r['import_rss_kb'] / 1024:>10.0f} "
+              f"{r['ready_seconds']:>9.2f} {r['ready_rss_kb'] / 1024:>9.0f}  {subsystems}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Write throughput and bytes/row: per-POST CSV appends vs. the segment store.
+
+Writes ``--posts`` batches of ``--batch`` samples (RED, IR, GREEN) derived from
+the sample recording with both ``store_ppg_dataframe_to_csv`` and
+``SegmentStore``, then reports rows/s and on-disk bytes per row (timestamp + 3 channels).
+
+Usage (from ``backend``):
+    python -m benchmarks.storage --posts 2000 --batch 25
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy
+import pandas
+
+from data import store_ppg_dataframe_to_csv
+from storage import SegmentStore
+
+SAMPLE = Path(__file__).resolve().parents[2] / "data" / "2025-11-17T02-01-41Z_ppg.csv"
+
+
+def make_batches(posts: int, batch: int) -> list[pandas.DataFrame]:
+    sample = pandas.read_csv(SAMPLE, index_col=0)
+    values = numpy.concatenate([sample.to_numpy(), sample.to_numpy()[::-1]])
+    values = numpy.resize(values, (posts * batch, values.shape[1]))
+    index = int(sample.index[0]) + 40 * numpy.arange(posts * batch, dtype=numpy.int64)
+    full = pandas.DataFrame(values, index=index, columns=sample.columns)
+    return [full.iloc[i * batch:(i + 1) * batch] for i in range(posts)]
+
+
+def folder_size(folder: Path) -> int:
+    return sum(p.stat().st_size for p in folder.rglob("*") if p.is_file())
+
+
+def bench_csv(batches, folder: Path) -> float:
+    start = time.perf_counter()
+    for df in batches:
+        store_ppg_dataframe_to_csv(str(folder), df)
+    return time.perf_counter() - start
+
+
+def bench_segments(batches, folder: Path, fsync: str) -> float:
+    store = SegmentStore(folder, fsync=fsync)
+    start = time.perf_counter()
+    for df in batches:
+        store.append("bench", df.index.to_numpy(dtype=numpy.int64), list(df.columns), df.to_numpy().T)
+    store.close()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=25)
+    args = parser.parse_args()
+
+    batches = make_batches(args.posts, args.batch)
+    rows = args.posts * args.batch
+    root = Path(tempfile.mkdtemp(prefix="ppg_storage_bench_"))
+
+    runs = [("csv (per-POST append)", root / "csv", lambda f: bench_csv(batches, f))]
+    for fsync in ("close", "flush"):
+        runs.append((f"segments (fsync={fsync})", root / f"seg_{fsync}",
+                     lambda f, fsync=fsync: bench_segments(batches, f, fsync)))
+
+    print(f"{args.posts} POSTs x {args.batch} samples x 3 channels ({rows} rows)")
+    for name, folder, run in runs:
+        folder.mkdir(parents=True, exist_ok=True)
+        elapsed = run(folder)
+        print(f"{name:<24} {rows / elapsed:>12.0f} rows/s  {folder_size(folder) / rows:>7.2f} bytes/row")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark suite: microbenchmarks + end-to-end load test, with a baseline file.
+
+Runs ``benchmarks.micro`` and ``benchmarks.load`` and prints p50/p99 latency and
+samples/s for each. ``--save`` writes the results as a baseline JSON. ``--compare``
+checks the results against a saved baseline and exits with status 1 when any
+latency grew, or any throughput dropped, by more than ``--tolerance``.
+
+Baselines are only comparable on the same machine and with the same options.
+
+Usage (from ``backend``):
+    python -m benchmarks.suite --save benchmarks/baseline.json
+    python -m benchmarks.suite --compare benchmarks/baseline.json --tolerance 0.25
+"""
+import argparse
+import json
+import sys
+
+from benchmarks import micro
+from benchmarks.load import run_load
+from benchmarks.report import environment, print_table, save_baseline, compare
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=500, help="microbenchmark iterations")
+    parser.add_argument("--batch", type=int, default=25, help="samples per payload")
+    parser.add_argument("--devices", type=int, default=10, help="load test devices")
+    parser.add_argument("--viewers", type=int, default=2, help="load test WebSocket viewers")
+    parser.add_argument("--seconds", type=float, default=10, help="load test duration")
+    parser.add_argument("--model", help="Keras model (classify benchmark and inference under load)")
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--save", help="write the results to this baseline JSON")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    results = {"environment": environment(), "micro": micro.run_all(args.batch, args.iterations, 50, args.model)}
+    print_table("microbenchmarks", results["micro"])
+    if not args.skip_load:
+        load = run_load(args.devices, args.viewers, args.seconds, args.batch, model_path=args.model)
+        results["load"] = {"post": load["post"], "delivery": load["delivery"]}
+        results["load_config"] = load["config"]
+        print_table(f"load ({args.devices} devices, {args.viewers} viewers, {args.seconds:g} s)", results["load"])
+
+    if args.save:
+        save_baseline(results, args.save)
+        print(f"\nBaseline saved to {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s):")
+            for line in regressions:
+                print(" ", line)
+            sys.exit(1)
+        print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Synthetic PPG devices for load tests.
+
+Each ``SyntheticDevice`` produces an endless 25 Hz recording (RED, IR, GREEN)
+that looks like the sample one: pulses with a systolic peak and a dicrotic wave,
+beat-to-beat heart-rate variability, respiratory baseline modulation, slow drift
+and sensor noise, around the ADC levels of the sample recording. Set an
+``af_probability`` to get irregular (AF-like) beat intervals.
+
+Batches come out as request payloads: absolute (``TIMESTAMP``, ``RED``...),
+``*_DELTA`` (first value absolute, then differences, as the devices send) or the
+packed binary body.
+
+Usage (from ``backend``), e.g. to dump payloads as JSON lines:
+    python -m benchmarks.synthetic --devices 3 --seconds 60 --batch 25 --delta > payloads.jsonl
+"""
+import argparse
+import json
+import sys
+from typing import Optional
+import numpy
+
+from data import (TIMESTAMP_KEY, RED_KEY, IR_KEY, GREEN_KEY, DELTA_END, DEVICE_ID_KEY, encode_ppg_binary)
+
+FS = 25.0
+COLUMNS = [RED_KEY, IR_KEY, GREEN_KEY]
+# Mean level and pulse amplitude per channel, close to the sample recording.
+LEVELS = numpy.array([916800.0, 1294200.0, 31500.0])
+AMPLITUDES = numpy.array([1100.0, 900.0, 5000.0])
+
+
+class SyntheticDevice:
+    """An endless synthetic recording for one device."""
+
+    def __init__(self, device_id: str, seed: Optional[int] = None, heart_rate: Optional[float] = None,
+                 start_ms: int = 1763344895168, af_probability: float = 0.0, noise: float = 0.03):
+        """
+        Args:
+            device_id: Sent in the ``DEVICE_ID`` key of each payload.
+            seed: Random seed (derived from ``device_id`` when None).
+            heart_rate: Mean heart rate in bpm (random in 55-95 when None).
+            start_ms: Timestamp of the first sample (epoch ms).
+            af_probability: Probability that the recording is AF-like (irregular RR).
+            noise: Sensor noise relative to the pulse amplitude.
+        """
+        self.device_id = device_id
+        self.rng = numpy.random.default_rng(seed if seed is not None else abs(hash(device_id)) % 2**32)
+        self.heart_rate = heart_rate if heart_rate is not None else float(self.rng.uniform(55, 95))
+        self.irregular = bool(self.rng.random() < af_probability)
+        self.noise = float(noise)
+        self.next_ms = int(start_ms)
+        self.sample = 0
+        # phase of the current beat in [0, 1) and its duration in samples
+        self._phase = float(self.rng.random())
+        self._beat = self._next_beat()
+        self._breath = float(self.rng.uniform(0.2, 0.33))  # Hz
+        self._drift = numpy.zeros(3)
+
+    def _next_beat(self) -> float:
+        rr = 60.0 / self.heart_rate
+        if self.irregular:
+            rr *= self.rng.uniform(0.6, 1.4)
+        else:
+            rr *= 1.0 + 0.04 * self.rng.standard_normal()
+        return max(rr, 0.3) * FS
+
+    def read(self, n: int) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """The next ``n`` samples: timestamps (n,) in ms and int64 values (3, n)."""
+        phases = numpy.empty(n)
+        for i in range(n):
+            phases[i] = self._phase
+            self._phase += 1.0 / self._beat
+            if self._phase >= 1.0:
+                self._phase -= 1.0
+                self._beat = self._next_beat()
+        # Systolic peak + dicrotic wave, roughly 0..1
+        pulse = numpy.exp(-((phases - 0.18) / 0.07) ** 2) + 0.45 * numpy.exp(-((phases - 0.45) / 0.1) ** 2)
+
+        t = (self.sample + numpy.arange(n)) / FS
+        breathing = 0.3 * numpy.sin(2 * numpy.pi * self._breath * t)
+        steps = self.rng.standard_normal((3, n)) * 0.02
+        drift = self._drift[:, None] + numpy.cumsum(steps, axis=1)
+        self._drift = drift[:, -1] * 0.999
+        noise = self.noise * self.rng.standard_normal((3, n))
+
+        # PPG is an absorption signal: the light level drops at each pulse.
+        shape = -pulse[None, :] + breathing[None, :] + drift + noise
+        values = numpy.round(LEVELS[:, None] + AMPLITUDES[:, None] * shape).astype(numpy.int64)
+        timestamps = self.next_ms + 40 * numpy.arange(n, dtype=numpy.int64)
+        self.next_ms += 40 * n
+        self.sample += n
+        return timestamps, values
+
+    def payload(self, n: int, delta: bool = False) -> dict:
+        """The next ``n`` samples as a JSON payload for POST ``/``."""
+        timestamps, values = self.read(n)
+        suffix = DELTA_END if delta else ""
+        arrays = [timestamps] + list(values)
+        if delta:
+            arrays = [numpy.diff(a, prepend=0) for a in arrays]
+        payload = {key + suffix: a.tolist() for key, a in zip([TIMESTAMP_KEY] + COLUMNS, arrays)}
+        payload[DEVICE_ID_KEY] = self.device_id
+        return payload
+
+    def binary(self, n: int, delta: bool = False) -> bytes:
+        """The next ``n`` samples as a packed body for POST ``/binary``."""
+        timestamps, values = self.read(n)
+        return encode_ppg_binary(timestamps, COLUMNS, values, device_id=self.device_id, delta=delta)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--batch", type=int, default=25)
+    parser.add_argument("--delta", action="store_true", help="emit *_DELTA payloads")
+    parser.add_argument("--af", type=float, default=0.0, help="probability of an AF-like device")
+    args = parser.parse_args()
+
+    devices = [SyntheticDevice(f"synthetic-{i}", seed=i, af_probability=args.af) for i in range(args.devices)]
+    for _ in range(int(args.seconds * FS) // args.batch):
+        for device in devices:
+            sys.stdout.write(json.dumps(device.payload(args.batch, args.delta)) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Frames/s of the matplotlib GREEN recorder vs. the direct OpenCV rasterizer.
+
+Feeds both recorders the same sliding 250-sample windows of the processed GREEN
+channel from the sample recording and measures render + encode throughput on
+the current (single) core. A sample frame of each backend is saved as PNG so
+they can be compared visually.
+
+Usage (from ``backend``):
+    python -m benchmarks.video_render --frames 500
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import cv2
+import numpy
+import pandas
+
+from infer import bandpass_filter, robust_normalize
+from video import GreenChannelVideoRecorder, RasterGreenChannelVideoRecorder
+
+WINDOW = 250
+FS = 25.0
+SAMPLE = Path(__file__).resolve().parents[2] / "data" / "2025-11-17T02-01-41Z_ppg.csv"
+
+
+def make_windows(count: int) -> list[tuple[numpy.ndarray, numpy.ndarray]]:
+    green = pandas.read_csv(SAMPLE, index_col=0)["GREEN"].to_numpy(dtype=numpy.float64)
+    signal = numpy.resize(numpy.concatenate([green, green[::-1]]), WINDOW + count)
+    processed = robust_normalize(bandpass_filter(signal, 0.5, 8.0, FS))
+    timestamps = 1763344895.168 + numpy.arange(signal.shape[0]) / FS
+    return [(processed[i:i + WINDOW], timestamps[i:i + WINDOW]) for i in range(count)]
+
+
+def run(recorder_cls, windows, out_dir: str, name: str) -> float:
+    recorder = recorder_cls(out_dir, filename_prefix=name, window=WINDOW, fs=FS)
+    recorder.start_time = float(windows[0][1][0])
+    start = time.perf_counter()
+    for processed, timestamps in windows:
+        recorder.write_frame_from_arrays_with_timestamps(processed, timestamps, display_window_seconds=6.0)
+    elapsed = time.perf_counter() - start
+    recorder.close()
+    return len(windows) / elapsed, recorder.get_video_path()
+
+
+def save_last_frame(video_path: str, png_path: Path):
+    capture = cv2.VideoCapture(video_path)
+    count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.set(cv2.CAP_PROP_POS_FRAMES, max(count - 1, 0))
+    ok, frame = capture.read()
+    if ok:
+        cv2.imwrite(str(png_path), frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--out", default=None, help="folder for videos and sample frames (default: temp)")
+    args = parser.parse_args()
+
+    windows = make_windows(args.frames)
+    out_dir = args.out or tempfile.mkdtemp(prefix="ppg_video_bench_")
+    results = []
+    for name, cls in (("matplotlib", GreenChannelVideoRecorder), ("raster", RasterGreenChannelVideoRecorder)):
+        fps, path = run(cls, windows, out_dir, name)
+        save_last_frame(path, Path(out_dir) / f"{name}_frame.png")
+        results.append((name, fps))
+
+    print(f"{args.frames} frames of 800x240, render + encode")
+    for name, fps in results:
+        print(f"{name:<12} {fps:>9.1f} frames/s")
+    print(f"speedup x{results[1][1] / results[0][1]:.1f}  (videos and sample frames in {out_dir})")
+
+
+if __name__ == "__main__":
+    main()
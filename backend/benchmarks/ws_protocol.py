@@ -0,0 +1,81 @@
+"""Bandwidth and serialization CPU of the WebSocket JSON payload vs. binary frames.
+
+Builds one live update as the server does after a classification: a batch of
+``--batch`` raw samples (RED, IR, GREEN) plus three 250-sample processed windows.
+It then reports the message size and the CPU time to serialize it:
+
+- ``json (DataFrame)``: the payload before this protocol (``df.to_dict(orient="split")``)
+- ``json``: ``LiveUpdate`` JSON (same layout, built from arrays)
+- ``binary full``: binary frame with the whole float32 processed windows
+- ``binary tail``: binary frame with only the new samples (+ overlap) of the windows
+- ``binary tail int16``: same, with processed samples quantized to int16
+
+Usage (from ``backend``):
+    python -m benchmarks.ws_protocol --batch 25 --iterations 2000
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+import numpy
+import pandas
+
+from infer import bandpass_filter, robust_normalize
+from protocol import LiveUpdate
+
+SAMPLE = Path(__file__).resolve().parents[2] / "data" / "2025-11-17T02-01-41Z_ppg.csv"
+WINDOW = 250
+FS = 25.0
+
+
+def make_update(batch: int) -> LiveUpdate:
+    sample = pandas.read_csv(SAMPLE, index_col=0)
+    columns = list(sample.columns)
+    raw = numpy.resize(numpy.concatenate([sample.to_numpy(), sample.to_numpy()[::-1]]), (WINDOW, len(columns))).T
+    timestamps = int(sample.index[0]) + 40 * numpy.arange(WINDOW, dtype=numpy.int64)
+    inference = {
+        c: {"signal": robust_normalize(bandpass_filter(raw[i].astype(float), 0.5, 8.0, FS)).astype(numpy.float32),
+            "label": "SR", "confidence": 0.93}
+        for i, c in enumerate(columns)
+    }
+    return LiveUpdate("bench", timestamps[-batch:], columns, raw[:, -batch:].astype(numpy.int64), inference, batch)
+
+
+def legacy_json(update: LiveUpdate) -> str:
+    df = pandas.DataFrame(update.values.T, index=update.timestamps, columns=update.columns)
+    payload = {"device": update.device_id, "raw": df.to_dict(orient="split")}
+    payload["inference"] = {c: {"signal": r["signal"].tolist(), "label": r["label"],
+                                "confidence": float(r["confidence"])} for c, r in update.inference.items()}
+    return json.dumps(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=25)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    update = make_update(args.batch)
+    runs = [
+        ("json (DataFrame)", lambda u: legacy_json(u)),
+        ("json", lambda u: u._encode_json(u.timestamps, u.values, None)),
+        ("binary full", lambda u: u._encode_binary(u.timestamps, u.values, None, "float32", True)),
+        ("binary tail", lambda u: u._encode_binary(u.timestamps, u.values, None, "float32", False)),
+        ("binary tail int16", lambda u: u._encode_binary(u.timestamps, u.values, None, "int16", False)),
+    ]
+
+    posts_per_second = FS / args.batch
+    print(f"one update: {args.batch} raw samples x 3 channels + 3 x {WINDOW} processed samples "
+          f"({posts_per_second:.1f} updates/s per device)")
+    print(f"{'format':<20} {'bytes':>8} {'KB/s/device':>12} {'us/encode':>10}")
+    for name, encode in runs:
+        size = len(encode(update))
+        start = time.process_time()
+        for _ in range(args.iterations):
+            encode(update)
+        elapsed = (time.process_time() - start) / args.iterations
+        print(f"{name:<20} {size:>8} {size * posts_per_second / 1024:>12.1f} {elapsed * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
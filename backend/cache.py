@@ -0,0 +1,101 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+import numpy
+
+
+def window_key(values: numpy.ndarray, version: str = "") -> bytes:
+    """Content address of a window: 128-bit BLAKE2b of its dtype, shape and bytes, salted with ``version``.
+
+    ``version`` identifies what produced the cached value (e.g. the model), so
+    entries from another model never match.
+    """
+    values = numpy.ascontiguousarray(values)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{version}|{values.dtype.str}|{values.shape}".encode())
+    digest.update(memoryview(values).cast("B"))
+    return digest.digest()
+
+
+class LRUCache:
+    """Mapping bounded by entry count (least recently used first out) and entry age.
+
+    Entries older than ``ttl_seconds`` are treated as missing and removed when
+    looked up, or by ``evict_expired``. Plain dict operations on the event loop
+    thread (no locks).
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl_seconds: Optional[float] = 600.0):
+        """
+        Args:
+            max_entries: Maximum number of entries; 0 disables the cache.
+            ttl_seconds: Maximum age of an entry, or None for no expiry.
+        """
+        if max_entries < 0:
+            raise ValueError("max_entries must be >= 0")
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = None if ttl_seconds is None else float(ttl_seconds)
+        self._entries: "OrderedDict[Hashable, tuple[float, object]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default=None):
+        """The value of ``key`` (marking it as recently used), or ``default`` on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None and self._is_expired(entry[0], time.monotonic()):
+            del self._entries[key]
+            self.expired += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: Hashable, value: object) -> None:
+        if not self.max_entries:
+            return
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def evict_expired(self, now: Optional[float] = None) -> int:
+        """Removes expired entries and returns how many."""
+        if self.ttl_seconds is None:
+            return 0
+        now = time.monotonic() if now is None else now
+        # Writes append at the end, so the oldest insertions come first unless a hit moved them.
+        expired = [k for k, (stored, _) in self._entries.items() if self._is_expired(stored, now)]
+        for key in expired:
+            del self._entries[key]
+        self.expired += len(expired)
+        return len(expired)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int | float | None]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
+
+    def _is_expired(self, stored: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored > self.ttl_seconds
@@ -0,0 +1,297 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Optional, Union
+from fastapi import WebSocket
+from downsample import METHODS
+from protocol import LiveUpdate, FORMATS, PROCESSED_DTYPES, WINDOW_MODES
+from session import sanitize_device_id
+
+Message = Union[str, bytes]
+
+# Keys accepted as /ws query parameters and in {"type": "subscribe"} messages
+SUBSCRIPTION_KEYS = ("format", "devices", "channels", "processed", "window", "points", "span", "method")
+
+
+class ClientConnection:
+    """A WebSocket client with its own bounded outbound queue drained by a sender task.
+
+    ``enqueue`` never awaits, so a slow or stalled client only fills its own queue.
+    When the queue is full, ``drop_oldest`` discards the oldest pending message and
+    ``latest`` discards every pending message so the client jumps to the newest one.
+    """
+
+    def __init__(self, websocket: WebSocket, client_id: int, max_queue: int = 64, policy: str = "drop_oldest"):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.max_queue = int(max_queue)
+        self.policy = policy
+        # pending items: (message, enqueue_time)
+        self._queue: deque[tuple[Message, float]] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # enqueue time of the message being sent, None while idle
+        self._sending_since: Optional[float] = None
+        self.closed = False
+
+        self.sent = 0
+        self.dropped = 0
+        self.max_lag_seen = 0.0
+
+        # subscription: message format, device/channel filters (None = all)
+        self.format = "json"
+        self.processed = "float32"
+        self.window = "tail"
+        # live downsampling budget: ``points`` samples per channel for ``span`` seconds of chart
+        self.points: Optional[int] = None
+        self.span = 20.0
+        self.method = "minmax"
+        self.devices: Optional[frozenset] = None
+        self.channels: Optional[frozenset] = None
+        # devices whose full processed window this client has (binary tails apply)
+        self.primed: set[str] = set()
+
+    def subscribe(self, format: Optional[str] = None, devices=None, channels=None,
+                  processed: Optional[str] = None, window: Optional[str] = None,
+                  points=None, span=None, method: Optional[str] = None) -> None:
+        """Updates the subscription; ``None`` keeps the current value.
+
+        ``devices``/``channels`` are lists or comma-separated strings, where an empty
+        value or ``"*"`` selects everything. ``points`` (chart width in pixels times
+        points per pixel, 0 to disable) and ``span`` (seconds shown) set the live
+        downsampling budget; ``method`` is ``minmax`` or ``lttb``.
+        """
+        if format is not None:
+            if format not in FORMATS:
+                raise ValueError(f"format must be one of {FORMATS}")
+            self.format = format
+        if processed is not None:
+            if processed not in PROCESSED_DTYPES:
+                raise ValueError(f"processed must be one of {PROCESSED_DTYPES}")
+            self.processed = processed
+        if window is not None:
+            if window not in WINDOW_MODES:
+                raise ValueError(f"window must be one of {WINDOW_MODES}")
+            self.window = window
+        if method is not None:
+            if method not in METHODS:
+                raise ValueError(f"method must be one of {METHODS}")
+            self.method = method
+        if points is not None:
+            points = int(points)
+            self.points = points if points > 0 else None
+        if span is not None:
+            if float(span) <= 0:
+                raise ValueError("span must be > 0")
+            self.span = float(span)
+        if devices is not None:
+            devices = _as_set(devices)
+            self.devices = None if devices is None else frozenset(sanitize_device_id(d) for d in devices)
+        if channels is not None:
+            channels = _as_set(channels)
+            self.channels = None if channels is None else frozenset(c.upper() for c in channels)
+        self.primed.clear()
+
+    def wants(self, device_id: str) -> bool:
+        return self.devices is None or device_id in self.devices
+
+    def points_per_second(self) -> Optional[float]:
+        return None if self.points is None else self.points / self.span
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def is_full(self) -> bool:
+        return len(self._queue) >= self.max_queue
+
+    def enqueue(self, message: Message) -> None:
+        if self.is_full():
+            # a dropped binary frame may have carried window samples: resend full windows
+            self.primed.clear()
+            if self.policy == "latest":
+                self.dropped += len(self._queue)
+                self._queue.clear()
+            else:
+                self._queue.popleft()
+                self.dropped += 1
+        self._queue.append((message, time.monotonic()))
+        self._wakeup.set()
+
+    def lag(self, now: Optional[float] = None) -> float:
+        """Age in seconds of the oldest message not yet delivered (0 when up to date)."""
+        now = time.monotonic() if now is None else now
+        oldest = self._sending_since
+        if self._queue and (oldest is None or self._queue[0][1] < oldest):
+            oldest = self._queue[0][1]
+        return 0.0 if oldest is None else now - oldest
+
+    async def close(self, code: int = 1000) -> None:
+        """Stops the sender task and closes the socket."""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        try:
+            # A stalled peer may never complete the closing handshake.
+            await asyncio.wait_for(self.websocket.close(code=code), timeout=1.0)
+        except Exception:
+            pass
+
+    def stats(self) -> dict[str, int | float]:
+        lag = self.lag()
+        self.max_lag_seen = max(self.max_lag_seen, lag)
+        return {
+            "client": self.client_id,
+            "format": self.format,
+            "points_per_second": self.points_per_second(),
+            "queue_depth": len(self._queue),
+            "lag_seconds": round(lag, 3),
+            "max_lag_seconds": round(self.max_lag_seen, 3),
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await self._wakeup.wait()
+                while self._queue:
+                    message, enqueued = self._queue.popleft()
+                    self._sending_since = enqueued
+                    if isinstance(message, bytes):
+                        await self.websocket.send_bytes(message)
+                    else:
+                        await self.websocket.send_text(message)
+                    self.max_lag_seen = max(self.max_lag_seen, time.monotonic() - enqueued)
+                    self._sending_since = None
+                    self.sent += 1
+                self._wakeup.clear()
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Peer went away: the manager drops the client on its next pass.
+            self.closed = True
+
+
+class ConnectionManager:
+    """Fans broadcasts out to every connected client without awaiting any of them.
+
+    Each message is serialized once per distinct subscription and placed on every
+    matching client's queue; per-client sender tasks deliver concurrently. Clients
+    lagging more than ``max_lag_seconds`` behind are disconnected.
+    """
+
+    POLICIES = ("drop_oldest", "latest")
+
+    def __init__(self, max_queue: int = 64, policy: str = "drop_oldest", max_lag_seconds: float = 10.0):
+        """
+        Args:
+            max_queue: Messages pending per client before the drop policy applies.
+            policy: ``drop_oldest`` or ``latest`` (see ``ClientConnection``).
+            max_lag_seconds: Clients whose oldest undelivered message is older than
+                this are disconnected.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}")
+        self.max_queue = int(max_queue)
+        self.policy = policy
+        self.max_lag_seconds = float(max_lag_seconds)
+        self.active_connections: dict[WebSocket, ClientConnection] = {}
+        self._ids = itertools.count(1)
+
+        self.broadcasts = 0
+        self.evicted = 0
+        self._closed_sent = 0
+        self._closed_dropped = 0
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        client = ClientConnection(websocket, next(self._ids), self.max_queue, self.policy)
+        self.active_connections[websocket] = client
+        client.start()
+        return client
+
+    def disconnect(self, websocket: WebSocket, code: int = 1000) -> None:
+        client = self.active_connections.pop(websocket, None)
+        if client is not None:
+            self._closed_sent += client.sent
+            self._closed_dropped += client.dropped
+            if not client.closed:
+                asyncio.ensure_future(client.close(code))
+
+    def broadcast(self, message: Message) -> int:
+        """Queues ``message`` for every client and returns the number of recipients."""
+        self.broadcasts += 1
+        recipients = 0
+        for client in self._live_clients():
+            client.enqueue(message)
+            recipients += 1
+        return recipients
+
+    def publish(self, update: LiveUpdate) -> int:
+        """Queues a device update for every client subscribed to it, in the client's format.
+
+        Each distinct subscription is encoded once per update (see ``LiveUpdate.encode``).
+        """
+        self.broadcasts += 1
+        recipients = 0
+        for client in self._live_clients():
+            if not client.wants(update.device_id):
+                continue
+            if client.is_full():
+                client.primed.clear()
+            full_window = client.window == "full" or update.device_id not in client.primed
+            message = update.encode(client.format, client.channels, client.processed, full_window,
+                                    client.points_per_second(), client.method)
+            if message is None:
+                continue
+            client.enqueue(message)
+            if update.inference is not None:
+                client.primed.add(update.device_id)
+            recipients += 1
+        return recipients
+
+    def _live_clients(self) -> list[ClientConnection]:
+        """Connected clients, after dropping closed ones and disconnecting those lagging too far behind."""
+        now = time.monotonic()
+        clients = []
+        for websocket, client in list(self.active_connections.items()):
+            if client.closed:
+                self.disconnect(websocket)
+                continue
+            if client.lag(now) > self.max_lag_seconds:
+                # Counted only: reported as evicted_slow_clients in /stats and /metrics
+                self.evicted += 1
+                self.disconnect(websocket, code=1013)  # 1013: try again later
+                continue
+            clients.append(client)
+        return clients
+
+    async def close_all(self) -> None:
+        for websocket, client in list(self.active_connections.items()):
+            self.active_connections.pop(websocket, None)
+            await client.close(code=1001)
+
+    def stats(self) -> dict:
+        clients = [client.stats() for client in self.active_connections.values()]
+        return {
+            "clients": len(clients),
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "max_lag_seconds": self.max_lag_seconds,
+            "broadcasts": self.broadcasts,
+            "evicted_slow_clients": self.evicted,
+            "sent": self._closed_sent + sum(c["sent"] for c in clients),
+            "dropped": self._closed_dropped + sum(c["dropped"] for c in clients),
+            "per_client": clients,
+        }
+
+
+def _as_set(value) -> Optional[set[str]]:
+    if isinstance(value, str):
+        value = value.split(",")
+    items = {str(v).strip() for v in value} - {""}
+    return None if not items or "*" in items else items
@@ -0,0 +1,114 @@
+"""Converts a Keras model to TFLite, optionally quantized.
+
+- ``none``: float32 weights and activations
+- ``float16``: float16 weights (half the size), float32 compute on most CPUs
+- ``int8``: int8 weights and activations calibrated on real windows, with float32
+  input/output so ``TFLiteBackend`` can feed it the usual preprocessed windows
+
+int8 needs calibration data: ``--calibration`` takes data folders or ``*.csv``
+recordings (the ``reclassify`` layout). Windows are cut every ``--stride`` samples
+and preprocessed exactly like the live path. A recording shorter than one window
+(such as the bundled sample) is tiled back and forth to one window; calibrate on
+longer recordings for a representative int8 model.
+
+Check the converted model against the original with ``python -m benchmarks.backends``.
+
+Usage (from ``backend``):
+    python convert_model.py ../models/model.keras ../models/model.tflite
+    python convert_model.py ../models/model.keras ../models/model_int8.tflite --quantize int8 --calibration ../data
+"""
+import argparse
+from pathlib import Path
+from typing import Optional
+import numpy
+
+from infer import WINDOW_SIZE, preprocess_windows
+from inference_backends import load_tensorflow
+
+QUANTIZATIONS = ("none", "float16", "int8")
+
+
+def tile_recording(values: numpy.ndarray, n: int) -> numpy.ndarray:
+    """(C, n) samples repeating a (C, N) recording forwards then backwards, so the joins do not jump."""
+    mirrored = numpy.concatenate([values, values[:, ::-1]], axis=1)
+    return numpy.tile(mirrored, -(-n // mirrored.shape[1]))[:, :n]
+
+
+def calibration_windows(sources: list[str | Path], stride: int = WINDOW_SIZE, limit: int = 500) -> numpy.ndarray:
+    """Up to ``limit`` preprocessed (N, 250) windows from data folders or CSV recordings."""
+    from reclassify import WorkUnit, find_units, load_unit, windows_of
+
+    windows = []
+    count = 0
+    for source in sources:
+        source = Path(source)
+        units = [WorkUnit("csv", source.stem, (str(source),))] if source.suffix == ".csv" else find_units(source)
+        for unit in units:
+            _, timestamps, values = load_unit(unit)
+            _, unit_windows = windows_of(timestamps, values, stride)
+            flat = unit_windows.reshape(-1, WINDOW_SIZE)
+            if not flat.shape[0] and values.shape[1]:
+                print(f"Warning: {unit.name} has no complete {WINDOW_SIZE}-sample window "
+                      f"({values.shape[1]} samples); tiling it to one window for calibration")
+                flat = tile_recording(values, WINDOW_SIZE)
+            flat = flat[:limit - count]
+            windows.append(flat)
+            count += flat.shape[0]
+            if count >= limit:
+                break
+        if count >= limit:
+            break
+    if not count:
+        raise ValueError(f"No samples found in {[str(s) for s in sources]}")
+    return preprocess_windows(numpy.concatenate(windows))
+
+
+def convert(model_path: str | Path, out_path: str | Path, quantize: str = "none",
+            calibration: Optional[numpy.ndarray] = None) -> Path:
+    """Writes the TFLite conversion of a Keras model and returns its path.
+
+    ``calibration`` holds preprocessed (N, 250) windows and is required for ``int8``.
+    """
+    if quantize not in QUANTIZATIONS:
+        raise ValueError(f"quantize must be one of {QUANTIZATIONS}")
+    if quantize == "int8" and (calibration is None or not len(calibration)):
+        raise ValueError("int8 quantization needs calibration windows")
+
+    tensorflow = load_tensorflow()
+    model = tensorflow.keras.models.load_model(model_path, compile=False)
+    # Keras inputs keep their dynamic batch dimension, so the interpreter can be resized to any batch
+    converter = tensorflow.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "float16":
+        converter.optimizations = [tensorflow.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tensorflow.float16]
+    elif quantize == "int8":
+        samples = numpy.asarray(calibration, dtype=numpy.float32).reshape(-1, 1, *model.input_shape[1:])
+        converter.optimizations = [tensorflow.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([sample] for sample in samples)
+        converter.target_spec.supported_ops = [tensorflow.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_bytes(converter.convert())
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="Keras model (.keras / .h5)")
+    parser.add_argument("out", help="output .tflite file")
+    parser.add_argument("--quantize", choices=QUANTIZATIONS, default="none")
+    parser.add_argument("--calibration", nargs="+", default=[], help="data folders or CSV recordings (int8)")
+    parser.add_argument("--stride", type=int, default=WINDOW_SIZE, help="samples between calibration windows")
+    parser.add_argument("--limit", type=int, default=500, help="maximum calibration windows")
+    args = parser.parse_args()
+
+    calibration = calibration_windows(args.calibration, args.stride, args.limit) if args.quantize == "int8" else None
+    out = convert(args.model, args.out, args.quantize, calibration)
+    size = out.stat().st_size
+    print(f"Wrote {out} ({size / 1024:.1f} KB, quantize={args.quantize}"
+          + (f", {len(calibration)} calibration windows)" if calibration is not None else ")"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,56 @@
-import pandas
 from datetime import datetime as Datetime
 import os
 from pathlib import Path
 import re
+import struct
+from typing import TYPE_CHECKING, NamedTuple, Optional
+import numpy
+
+from storage import SegmentStore
+
+# pandas is only needed by the DataFrame/CSV helpers; the array ingest path does not import it
+if TYPE_CHECKING:
+    import pandas
 
 TIMESTAMP_KEY = 'TIMESTAMP'
 RED_KEY = 'RED'
 IR_KEY = 'IR'
 GREEN_KEY = 'GREEN'
 DELTA_END = '_DELTA'
-
-def ppg_dict_to_dataframe(ppg_dict: dict) -> pandas.DataFrame:
-    """Converts a PPG data dictionary to a pandas DataFrame."""
-
-    def deltas_to_values(deltas: list[int]) -> list[int]:
-        """Converts a list in delta format to absolute format."""
-        if not deltas:
-            return deltas
-
-        values = [deltas[0]]
-        for delta in deltas[1:]:
-            values.append(values[-1] + delta)
-
-        return values
+DEVICE_ID_KEY = 'DEVICE_ID'
+
+# Packed binary ingest body (all little-endian):
+#   header      <4sBBHI: magic b"PPGB", version, flags, channel count C, row count N
+#   device id   u8 length + utf-8 bytes (length 0 = not given)
+#   channels    C x (u8 length + utf-8 name)
+#   timestamps  N x int64
+#   values      C x N x int32, channel-major
+# With FLAG_DELTA set, timestamps and every channel hold a first absolute value
+# followed by deltas, as in the *_DELTA JSON keys.
+BINARY_MAGIC = b"PPGB"
+BINARY_VERSION = 1
+BINARY_FLAG_DELTA = 0x01
+BINARY_HEADER = struct.Struct("<4sBBHI")
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+
+class PPGBatch(NamedTuple):
+    """A decoded batch: timestamps (N,), channel names and values (C, N)."""
+    device_id: Optional[str]
+    timestamps: numpy.ndarray
+    columns: list[str]
+    values: numpy.ndarray
+
+
+def deltas_to_values(deltas) -> numpy.ndarray:
+    """Converts an array in delta format (first value absolute) to absolute values."""
+    deltas = numpy.asarray(deltas)
+    if deltas.dtype.kind in "iub":
+        return numpy.cumsum(deltas, dtype=numpy.int64)
+    return numpy.cumsum(deltas)
+
+def ppg_dict_to_arrays(ppg_dict: dict) -> PPGBatch:
+    """Converts a PPG data dictionary to arrays, without building a DataFrame."""
 
     # Determine if the data is in delta format or invalid.
     is_delta_format = False
@@ -32,46 +60,105 @@ def ppg_dict_to_dataframe(ppg_dict: dict) -> pandas.DataFrame:
         else:
             raise ValueError("No timestamp data found in dictionary.")
 
-    # Prepare keys based on format.
-    timestamp_key = TIMESTAMP_KEY + (DELTA_END if is_delta_format else '')
-    red_key = RED_KEY + (DELTA_END if is_delta_format else '')
-    ir_key = IR_KEY + (DELTA_END if is_delta_format else '')
-    green_key = GREEN_KEY + (DELTA_END if is_delta_format else '')
-
-    # Extract data from the dictionary.
-    new_dict = {
-                key.split('_')[0]: ppg_dict.get(key, [])
-                        for key in [timestamp_key, red_key, ir_key, green_key]
-            }
+    suffix = DELTA_END if is_delta_format else ''
+    columns = [RED_KEY, IR_KEY, GREEN_KEY]
+    timestamps = numpy.asarray(ppg_dict[TIMESTAMP_KEY + suffix])
+    channels = [numpy.asarray(ppg_dict.get(key + suffix, [])) for key in columns]
+    for key, channel in zip(columns, channels):
+        if channel.shape != timestamps.shape:
+            raise ValueError(f"{key}{suffix} has {channel.size} values, expected {timestamps.size}.")
 
     # Convert from delta format to absolute values if necessary.
     if is_delta_format:
-        for key in new_dict:
-            deltas = new_dict[key]
-            new_dict[key] = deltas_to_values(deltas)
+        timestamps = deltas_to_values(timestamps)
+        channels = [deltas_to_values(channel) for channel in channels]
 
-    index = new_dict.pop(TIMESTAMP_KEY)
-    return pandas.DataFrame(new_dict, index=index)
+    values = numpy.stack(channels) if timestamps.size else numpy.empty((len(columns), 0))
+    return PPGBatch(ppg_dict.get(DEVICE_ID_KEY), timestamps, columns, values)
 
-def store_ppg_dataframe_to_csv(folder: str, df: pandas.DataFrame) -> str:
+def ppg_dict_to_dataframe(ppg_dict: dict) -> "pandas.DataFrame":
+    """Converts a PPG data dictionary to a pandas DataFrame."""
+    import pandas
+    batch = ppg_dict_to_arrays(ppg_dict)
+    return pandas.DataFrame(batch.values.T, index=batch.timestamps, columns=batch.columns)
+
+def decode_ppg_binary(body: bytes) -> PPGBatch:
+    """Decodes a packed binary ingest body.
+
+    Absolute arrays are read-only views of ``body`` (``numpy.frombuffer``, no copy);
+    delta arrays are integrated with a cumulative sum.
+    """
+    if len(body) < BINARY_HEADER.size:
+        raise ValueError("Binary body is shorter than its header.")
+    magic, version, flags, n_channels, n_rows = BINARY_HEADER.unpack_from(body, 0)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("Not a PPG binary body (bad magic or version).")
+
+    offset = BINARY_HEADER.size
+    names = []
+    for _ in range(n_channels + 1):
+        if offset >= len(body):
+            raise ValueError("Binary body is truncated.")
+        length = body[offset]
+        names.append(bytes(body[offset + 1:offset + 1 + length]).decode("utf-8"))
+        offset += 1 + length
+    device_id, columns = names[0] or None, names[1:]
+
+    expected = offset + 8 * n_rows + 4 * n_channels * n_rows
+    if len(body) != expected:
+        raise ValueError(f"Binary body has {len(body)} bytes, expected {expected}.")
+    timestamps = numpy.frombuffer(body, dtype="<i8", count=n_rows, offset=offset)
+    values = numpy.frombuffer(body, dtype="<i4", count=n_channels * n_rows,
+                              offset=offset + 8 * n_rows).reshape(n_channels, n_rows)
+
+    if flags & BINARY_FLAG_DELTA:
+        timestamps = numpy.cumsum(timestamps, dtype=numpy.int64)
+        values = numpy.cumsum(values, axis=1, dtype=numpy.int64)
+    return PPGBatch(device_id, timestamps, columns, values)
+
+def encode_ppg_binary(timestamps, columns: list[str], values, device_id: Optional[str] = None,
+                      delta: bool = False) -> bytes:
+    """Packs a batch in the binary ingest format (the inverse of ``decode_ppg_binary``)."""
+    timestamps = numpy.asarray(timestamps, dtype=numpy.int64)
+    values = numpy.asarray(values, dtype=numpy.int64).reshape(len(columns), timestamps.shape[0])
+    if delta:
+        timestamps = numpy.diff(timestamps, prepend=0)
+        values = numpy.diff(values, axis=1, prepend=0)
+
+    parts = [BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, BINARY_FLAG_DELTA if delta else 0,
+                                len(columns), timestamps.shape[0])]
+    for name in [device_id or ""] + list(columns):
+        encoded = name.encode("utf-8")
+        parts.append(bytes([len(encoded)]) + encoded)
+    parts.append(timestamps.astype("<i8").tobytes())
+    parts.append(values.astype("<i4").tobytes())
+    return b"".join(parts)
+
+def store_ppg_dataframe_to_csv(folder: str, df: "pandas.DataFrame") -> str:
     """Stores the PPG DataFrame to a single CSV file and returns the file path."""
     filepath = __store_ppg_dataframe_to_csv_with_name__(folder, "ppg.csv", df)
     return filepath
 
-def load_top_n_csv_to_dataframe(folder: str, top_n: int) -> pandas.DataFrame | None:
+def load_top_n_csv_to_dataframe(folder: str, top_n: int) -> "pandas.DataFrame | None":
     """Loads the top N most recent PPG CSV files from the specified folder and combines them into a single DataFrame."""
+    import pandas
     folder = Path(folder).resolve()
 
-    # list all files with pattern '<timestamp>_ppg.csv'
-    files: list[Path] = [p for p in folder.iterdir() if p.is_file() and p.name.endswith("_ppg.csv")]
+    # list '<timestamp>_ppg.csv' files plus the 'ppg.csv' written by store_ppg_dataframe_to_csv,
+    # which is dated by its modification time
     pairs: list[tuple[Datetime, Path]] = []  # (datetime, path)
-    for path in files:
+    for path in folder.iterdir():
+        if not path.is_file():
+            continue
+        if path.name == "ppg.csv":
+            pairs.append((Datetime.fromtimestamp(path.stat().st_mtime), path))
+            continue
         datetime = __parse_timestamp_from_name__(path.name)
         if datetime is not None:
             pairs.append((datetime, path))
 
     if not pairs:
-        print(f"Warning: did not find any files with pattern '<timestamp>_ppg.csv' in {folder}")
+        print(f"Warning: did not find 'ppg.csv' or any files with pattern '<timestamp>_ppg.csv' in {folder}")
         return None
 
     # order by timestamp descending
@@ -82,7 +169,7 @@ def load_top_n_csv_to_dataframe(folder: str, top_n: int) -> pandas.DataFrame | N
     print(f"Selected {len(selected)} files (most recent).")
 
     # Parse and combine dataframes
-    dfs: list[pandas.DataFrame] = []
+    dfs: list["pandas.DataFrame"] = []
     for path in selected:
         try:
             dfs.append(pandas.read_csv(path, header=0, index_col=0))
@@ -95,7 +182,25 @@ def load_top_n_csv_to_dataframe(folder: str, top_n: int) -> pandas.DataFrame | N
 
     return pandas.concat(dfs, axis=0)
 
-def __store_ppg_dataframe_to_csv_with_name__(folder: str, filename: str, df: pandas.DataFrame) -> str:
+def load_time_range_to_dataframe(root: str, device_id: str, start_ms: int | None = None,
+                                 end_ms: int | None = None, channels: list[str] | None = None) -> "pandas.DataFrame | None":
+    """Loads the samples of a device between two timestamps (ms, inclusive) from the segment store.
+
+    Only the segments overlapping the range are read, using the store's manifest.
+    """
+    import pandas
+    timestamps, values, names = [], [], None
+    for names, ts, vals in SegmentStore(root).query(device_id, start_ms, end_ms, channels):
+        timestamps.append(ts)
+        values.append(vals)
+
+    if not timestamps:
+        print(f"Warning: no data for device '{device_id}' in the requested range")
+        return None
+
+    return pandas.DataFrame(numpy.concatenate(values, axis=1).T, index=numpy.concatenate(timestamps), columns=names)
+
+def __store_ppg_dataframe_to_csv_with_name__(folder: str, filename: str, df: "pandas.DataFrame") -> str:
     """Stores the PPG DataFrame to a CSV file and returns the file path."""
     if not os.path.exists(folder):
         os.makedirs(folder)
@@ -0,0 +1,245 @@
+import math
+from typing import Optional
+import numpy
+
+METHODS = ("minmax", "lttb")
+
+
+def minmax(timestamps: numpy.ndarray, values: numpy.ndarray, n_out: int) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """Min/max envelope decimation to at most ``n_out`` samples per channel.
+
+    Samples are split into ``n_out // 2`` buckets of (almost) equal size. Each bucket
+    yields two samples per channel, its minimum and maximum in order of occurrence,
+    placed at the bucket's first and last timestamps so all channels share them.
+    """
+    values = numpy.atleast_2d(values)
+    n = timestamps.shape[0]
+    buckets = max(1, n_out // 2)
+    if n <= max(n_out, 2):
+        return timestamps, values
+
+    # Bucket edges; equal sizes except for the remainder spread over the first buckets.
+    edges = (numpy.arange(buckets + 1) * n) // buckets
+    starts, ends = edges[:-1], edges[1:]
+    lo = numpy.minimum.reduceat(values, starts, axis=1)
+    hi = numpy.maximum.reduceat(values, starts, axis=1)
+
+    # Whether the minimum comes before the maximum inside each bucket.
+    positions = numpy.arange(n)
+    bucket_of = numpy.repeat(numpy.arange(buckets), ends - starts)
+    is_lo = values == lo[:, bucket_of]
+    is_hi = values == hi[:, bucket_of]
+    first_lo = numpy.minimum.reduceat(numpy.where(is_lo, positions, n), starts, axis=1)
+    first_hi = numpy.minimum.reduceat(numpy.where(is_hi, positions, n), starts, axis=1)
+    lo_first = first_lo <= first_hi
+
+    out_values = numpy.empty((values.shape[0], 2 * buckets), dtype=values.dtype)
+    out_values[:, 0::2] = numpy.where(lo_first, lo, hi)
+    out_values[:, 1::2] = numpy.where(lo_first, hi, lo)
+    out_ts = numpy.empty(2 * buckets, dtype=timestamps.dtype)
+    out_ts[0::2] = timestamps[starts]
+    out_ts[1::2] = timestamps[ends - 1]
+    return out_ts, out_values
+
+
+def lttb_indices(x: numpy.ndarray, y: numpy.ndarray, n_out: int) -> numpy.ndarray:
+    """Indices chosen by Largest-Triangle-Three-Buckets for one channel.
+
+    Keeps the first and last samples and, for each of the ``n_out - 2`` buckets in
+    between, the sample forming the largest triangle with the previously selected
+    sample and the mean of the next bucket. Bucket means and triangle areas are
+    computed with numpy; only the walk over buckets is sequential.
+    """
+    n = x.shape[0]
+    if n_out >= n or n_out < 3:
+        return numpy.arange(n)
+    x = x.astype(numpy.float64)
+    y = y.astype(numpy.float64)
+
+    buckets = n_out - 2
+    edges = 1 + (numpy.arange(buckets + 1) * (n - 2)) // buckets
+    sizes = numpy.diff(edges)
+    mean_x = numpy.add.reduceat(x[1:n - 1], edges[:-1] - 1) / sizes
+    mean_y = numpy.add.reduceat(y[1:n - 1], edges[:-1] - 1) / sizes
+    # The "next bucket" of the last bucket is the final sample.
+    next_x = numpy.append(mean_x[1:], x[-1])
+    next_y = numpy.append(mean_y[1:], y[-1])
+
+    selected = numpy.empty(n_out, dtype=numpy.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for b in range(buckets):
+        lo, hi = edges[b], edges[b + 1]
+        # Twice the triangle area (a, p, next mean) for every candidate p.
+        area = numpy.abs((x[a] - next_x[b]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[b] - y[a]))
+        a = lo + int(numpy.argmax(area))
+        selected[b + 1] = a
+    return selected
+
+
+def lttb(timestamps: numpy.ndarray, values: numpy.ndarray, n_out: int) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """LTTB to ``n_out`` samples per channel.
+
+    Channels share timestamps, so the union of the samples selected for each
+    channel is returned (at most ``n_out`` times the channel count).
+    """
+    values = numpy.atleast_2d(values)
+    if timestamps.shape[0] <= n_out:
+        return timestamps, values
+    indices = numpy.unique(numpy.concatenate([lttb_indices(timestamps, channel, n_out) for channel in values]))
+    return timestamps[indices], values[:, indices]
+
+
+def downsample(timestamps: numpy.ndarray, values: numpy.ndarray, n_out: int,
+               method: str = "minmax") -> tuple[numpy.ndarray, numpy.ndarray]:
+    """Reduces (timestamps (N,), values (C, N)) to about ``n_out`` samples per channel."""
+    if method == "lttb":
+        return lttb(timestamps, values, n_out)
+    if method == "minmax":
+        return minmax(timestamps, values, n_out)
+    raise ValueError(f"method must be one of {METHODS}")
+
+
+def budget_for(timestamps: numpy.ndarray, points_per_second: float) -> Optional[int]:
+    """Samples allowed for a batch at ``points_per_second``, or None if it already fits."""
+    n = timestamps.shape[0]
+    if n < 3:
+        return None
+    # Batch duration including the last sample period.
+    duration = (float(timestamps[-1]) - float(timestamps[0])) * n / (n - 1) / 1000.0
+    n_out = max(2, math.ceil(duration * points_per_second))
+    return None if n_out >= n else n_out
+
+
+class MinMaxAccumulator:
+    """Streaming min/max envelope over fixed time buckets.
+
+    Chunks of (timestamps, values) are folded into ``buckets`` equal time buckets
+    between ``start_ms`` and ``end_ms``, so arbitrarily long ranges are reduced
+    with memory proportional to the bucket count.
+    """
+
+    def __init__(self, start_ms: int, end_ms: int, buckets: int, channels: int):
+        self.start_ms = int(start_ms)
+        self.width = max(1.0, (int(end_ms) - int(start_ms) + 1) / max(1, int(buckets)))
+        self.buckets = max(1, int(buckets))
+        self.lo = numpy.full((channels, self.buckets), numpy.inf)
+        self.hi = numpy.full((channels, self.buckets), -numpy.inf)
+        # Earliest timestamp of each bucket's min / max, to emit them in time order
+        self.lo_ts = numpy.full((channels, self.buckets), numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+        self.hi_ts = numpy.full((channels, self.buckets), numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+        self.dtype = None
+        self.first_ts = numpy.full(self.buckets, numpy.iinfo(numpy.int64).max, dtype=numpy.int64)
+        self.last_ts = numpy.full(self.buckets, numpy.iinfo(numpy.int64).min, dtype=numpy.int64)
+        self.rows = 0
+        self._emitted = 0
+
+    def add(self, timestamps: numpy.ndarray, values: numpy.ndarray) -> None:
+        if self.dtype is None:
+            self.dtype = values.dtype
+        index = ((timestamps - self.start_ms) / self.width).astype(numpy.int64)
+        keep = (index >= 0) & (index < self.buckets)
+        index, timestamps, values = index[keep], timestamps[keep], values[:, keep]
+        if not index.shape[0]:
+            return
+        # Per-bucket extremes of this chunk and the earliest timestamp at which each occurs
+        order = numpy.argsort(index, kind="stable")
+        index, timestamps, values = index[order], timestamps[order], values[:, order]
+        starts = numpy.flatnonzero(numpy.diff(index, prepend=-1))
+        touched = index[starts]
+        bucket_of = numpy.repeat(numpy.arange(starts.shape[0]), numpy.diff(starts, append=index.shape[0]))
+        never = numpy.iinfo(numpy.int64).max
+        lo = numpy.minimum.reduceat(values, starts, axis=1)
+        hi = numpy.maximum.reduceat(values, starts, axis=1)
+        lo_ts = numpy.minimum.reduceat(numpy.where(values == lo[:, bucket_of], timestamps, never), starts, axis=1)
+        hi_ts = numpy.minimum.reduceat(numpy.where(values == hi[:, bucket_of], timestamps, never), starts, axis=1)
+
+        # Merge into the accumulated buckets; on ties the earlier occurrence wins
+        old_lo, old_lo_ts = self.lo[:, touched], self.lo_ts[:, touched]
+        self.lo_ts[:, touched] = numpy.where(lo < old_lo, lo_ts,
+                                             numpy.where(lo == old_lo, numpy.minimum(lo_ts, old_lo_ts), old_lo_ts))
+        self.lo[:, touched] = numpy.minimum(old_lo, lo)
+        old_hi, old_hi_ts = self.hi[:, touched], self.hi_ts[:, touched]
+        self.hi_ts[:, touched] = numpy.where(hi > old_hi, hi_ts,
+                                             numpy.where(hi == old_hi, numpy.minimum(hi_ts, old_hi_ts), old_hi_ts))
+        self.hi[:, touched] = numpy.maximum(old_hi, hi)
+        self.first_ts[touched] = numpy.minimum(self.first_ts[touched], timestamps[starts])
+        self.last_ts[touched] = numpy.maximum(self.last_ts[touched], numpy.maximum.reduceat(timestamps, starts))
+        self.rows += index.shape[0]
+
+    def result(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """Two samples per non-empty bucket at its first and last timestamps: the min and max,
+        in the order they occurred (as ``minmax``)."""
+        return self._buckets(0, self.buckets)
+
+    def drain(self, before_ms: Optional[int] = None) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """Like ``result`` for the buckets not drained yet that end before ``before_ms`` (all if None).
+
+        With chunks added in time order, buckets before the newest timestamp are
+        final, so a long range can be emitted progressively.
+        """
+        stop = self.buckets if before_ms is None else int((before_ms - self.start_ms) // self.width)
+        stop = min(max(stop, self._emitted), self.buckets)
+        out = self._buckets(self._emitted, stop)
+        self._emitted = stop
+        return out
+
+    def _buckets(self, first: int, stop: int) -> tuple[numpy.ndarray, numpy.ndarray]:
+        filled = numpy.flatnonzero(self.last_ts[first:stop] >= self.first_ts[first:stop]) + first
+        ts = numpy.empty(2 * filled.shape[0], dtype=numpy.int64)
+        ts[0::2] = self.first_ts[filled]
+        ts[1::2] = self.last_ts[filled]
+        values = numpy.empty((self.lo.shape[0], ts.shape[0]), dtype=numpy.float64 if self.dtype is None else self.dtype)
+        lo_first = self.lo_ts[:, filled] <= self.hi_ts[:, filled]
+        lo, hi = self.lo[:, filled], self.hi[:, filled]
+        values[:, 0::2] = numpy.where(lo_first, lo, hi)
+        values[:, 1::2] = numpy.where(lo_first, hi, lo)
+        return ts, values
+
+
+class EnvelopeAccumulator:
+    """Min/max envelope of an open-ended stream in a fixed number of time buckets.
+
+    Buckets start ``width`` wide from the first timestamp. When a sample falls past
+    the last bucket, adjacent buckets are merged pairwise and the width doubles, so
+    the envelope always spans the whole stream with constant memory and each
+    sample costs O(1) amortized.
+    """
+
+    def __init__(self, buckets: int = 2048, width: float = 1.0, channels: int = 1):
+        self.buckets = max(2, int(buckets) + int(buckets) % 2)
+        self.width = float(width)
+        self.start: Optional[float] = None
+        self.lo = numpy.full((channels, self.buckets), numpy.inf)
+        self.hi = numpy.full((channels, self.buckets), -numpy.inf)
+        self.rows = 0
+
+    def add(self, timestamps: numpy.ndarray, values: numpy.ndarray) -> None:
+        values = numpy.atleast_2d(values)
+        if timestamps.shape[0] == 0:
+            return
+        if self.start is None:
+            self.start = float(timestamps[0])
+        while float(timestamps[-1]) >= self.start + self.width * self.buckets:
+            self._merge()
+        # Late samples before the first timestamp fall into the first bucket.
+        index = numpy.clip(((timestamps - self.start) / self.width).astype(numpy.int64), 0, self.buckets - 1)
+        for c in range(values.shape[0]):
+            numpy.minimum.at(self.lo[c], index, values[c])
+            numpy.maximum.at(self.hi[c], index, values[c])
+        self.rows += timestamps.shape[0]
+
+    def _merge(self) -> None:
+        half = self.buckets // 2
+        self.lo[:, :half] = self.lo.reshape(self.lo.shape[0], half, 2).min(axis=2)
+        self.hi[:, :half] = self.hi.reshape(self.hi.shape[0], half, 2).max(axis=2)
+        self.lo[:, half:] = numpy.inf
+        self.hi[:, half:] = -numpy.inf
+        self.width *= 2
+
+    def result(self) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """``(bucket centres, lo (C, B), hi (C, B))`` for the non-empty buckets."""
+        filled = numpy.flatnonzero(numpy.any(self.hi >= self.lo, axis=0))
+        start = 0.0 if self.start is None else self.start
+        centres = start + (filled + 0.5) * self.width
+        return centres, self.lo[:, filled].copy(), self.hi[:, filled].copy()
@@ -0,0 +1,101 @@
+import json
+import math
+import struct
+from typing import Iterable, Iterator, Optional
+import numpy
+
+from downsample import MinMaxAccumulator, lttb
+from infer import SAMPLING_RATE, StreamingPreprocessor
+from protocol import LiveUpdate
+
+PREPROCESS_MODES = ("none", "bandpass", "normalize")
+STREAM_FORMATS = ("ndjson", "binary", "json")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "binary": "application/octet-stream", "json": "application/json"}
+
+# Binary history streams are a sequence of u32 length-prefixed binary WebSocket frames
+# (see protocol.py), one per chunk.
+FRAME_LENGTH = struct.Struct("<I")
+
+# A jump longer than this between chunks restarts the preprocessing filters.
+GAP_RESET_MS = 1000
+
+Chunk = tuple[list[str], numpy.ndarray, numpy.ndarray]
+
+
+def iter_history(chunks: Iterable[Chunk], start_ms: int, end_ms: int, preprocess: str = "none",
+                 points: Optional[int] = None, method: str = "minmax", fs: float = SAMPLING_RATE) -> Iterator[Chunk]:
+    """Preprocesses and downsamples stored ``(channels, timestamps, values)`` chunks as they are read.
+
+    Memory stays bounded by one storage block plus the point budget, whatever the
+    length of the range.
+
+    Args:
+        chunks: Chunks in time order, e.g. ``storage.read_segments``.
+        start_ms: Start of the range (ms), used to place downsampling buckets.
+        end_ms: End of the range (ms).
+        preprocess: ``none``, ``bandpass`` or ``normalize`` (bandpass + robust
+            normalization). Uses ``StreamingPreprocessor``, whose state carries over
+            between chunks: a causal filter, so unlike ``bandpass_filter`` it is not
+            zero-phase.
+        points: Optional budget of samples per channel for the whole range.
+        method: ``minmax`` (time buckets, emitted as soon as they are complete) or
+            ``lttb`` (applied per chunk with a proportional share of the budget).
+        fs: Sampling rate for the preprocessing filters.
+    """
+    preprocessors = None
+    accumulator = None
+    columns: list[str] = []
+    last_ts = None
+    span = max(1, end_ms - start_ms + 1)
+    for columns, timestamps, values in chunks:
+        if preprocess != "none":
+            if preprocessors is None or (last_ts is not None and timestamps[0] - last_ts > GAP_RESET_MS):
+                preprocessors = [StreamingPreprocessor(0.5, 8.0, fs, normalize=preprocess == "normalize")
+                                 for _ in columns]
+            values = numpy.vstack([p.process(channel) for p, channel in zip(preprocessors, values)])
+        last_ts = timestamps[-1]
+
+        if points is None:
+            yield columns, timestamps, values
+            continue
+        if method == "minmax":
+            if accumulator is None:
+                accumulator = MinMaxAccumulator(start_ms, end_ms, points // 2, len(columns))
+            accumulator.add(timestamps, values)
+            timestamps, values = accumulator.drain(int(timestamps[-1]))
+        else:
+            share = (float(timestamps[-1]) - float(timestamps[0]) + 1) / span
+            timestamps, values = lttb(timestamps, values, max(3, math.ceil(points * share)))
+        if timestamps.shape[0]:
+            yield columns, timestamps, values
+
+    if accumulator is not None:
+        timestamps, values = accumulator.drain()
+        if timestamps.shape[0]:
+            yield columns, timestamps, values
+
+
+def ndjson_stream(header: dict, chunks: Iterable[Chunk]) -> Iterator[bytes]:
+    """One JSON header line, then one line per chunk in the ``raw`` (orient="split") layout."""
+    yield (json.dumps(header) + "\n").encode()
+    for columns, timestamps, values in chunks:
+        line = {"columns": columns, "index": timestamps.tolist(), "data": values.T.tolist()}
+        yield (json.dumps(line) + "\n").encode()
+
+
+def binary_stream(device_id: str, chunks: Iterable[Chunk]) -> Iterator[bytes]:
+    """Length-prefixed binary frames, one per chunk (decodable with ``decodeBinaryFrame``)."""
+    for columns, timestamps, values in chunks:
+        frame = LiveUpdate(device_id, timestamps, columns, values).encode("binary")
+        yield FRAME_LENGTH.pack(len(frame)) + frame
+
+
+def collect(chunks: Iterable[Chunk]) -> Chunk:
+    """Concatenates chunks into one ``(channels, timestamps, values)`` (for non-streaming responses)."""
+    columns, timestamps, values = [], [], []
+    for columns, ts, vals in chunks:
+        timestamps.append(ts)
+        values.append(vals)
+    if not timestamps:
+        return columns, numpy.empty(0, dtype=numpy.int64), numpy.empty((len(columns), 0))
+    return columns, numpy.concatenate(timestamps), numpy.concatenate(values, axis=1)
@@ -15,49 +15,125 @@ warnings.filterwarnings("ignore", category=UserWarning, module=r"keras.*")
 # Reduce verbosity from absl (used by TensorFlow) and from the tensorflow logger.
 logging.getLogger('absl').setLevel(logging.ERROR)
 
-from pandas import DataFrame, concat
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
 import numpy
-from scipy.signal import butter, filtfilt
-from tensorflow import keras
+from ringbuffer import RingBuffer
+from inference_backends import InferenceBackend, load_backend, model_version
+
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
+WINDOW_SIZE = 250
+SAMPLING_RATE = 25.0
+# Label of channels whose window skipped the model (see quality.py)
+LOW_QUALITY_LABEL = "LOW_QUALITY"
 
-# After TensorFlow is imported, ensure its Python logger is quiet.
-logging.getLogger('tensorflow').setLevel(logging.ERROR)
 
 class Inferer:
     """Manages the inference model and performs classification on PPG data."""
 
-    def __init__(self, model_path: str):
-        """Initializes the Inferer with the specified model path."""
+    def __init__(self, model_path: str, warmup: bool = True, backend: Optional[str] = None,
+                 num_threads: Optional[int] = None):
+        """Initializes the Inferer, loading the model once and keeping it resident.
+
+        Args:
+            model_path (str): Path to the model file (Keras ``.keras``/``.h5`` or ``.tflite``).
+            warmup (bool): If True, runs a dummy forward pass so the first real
+                request does not pay for graph tracing.
+            backend (str): ``"keras"``, ``"tflite"`` or None/``"auto"`` to pick it
+                from the file suffix (see ``inference_backends``).
+            num_threads (int): Interpreter threads for the TFLite backend.
+        """
         self.model_path: str = model_path
-        self.data: DataFrame = None
+        self.columns: list[str] | None = None
+        self.window: RingBuffer | None = None
+
+        start = time.perf_counter()
+        self.backend: InferenceBackend = load_backend(model_path, backend, num_threads)
+        self.load_seconds: float = time.perf_counter() - start
+        self.warmup_seconds: float | None = None
+        # Content hash of the model file, part of the classify cache keys
+        self.version: str = model_version(model_path)
+
+        self.inference_count: int = 0
+        self.inference_seconds_total: float = 0.0
+        self.last_inference_seconds: float | None = None
+
+        if warmup:
+            self.warmup()
+
+    def warmup(self) -> None:
+        """Runs a dummy batch through the model to trace and compile the forward pass."""
+        start = time.perf_counter()
+        self.backend.predict(numpy.zeros((3, WINDOW_SIZE, 1), dtype=numpy.float32))
+        self.warmup_seconds = time.perf_counter() - start
 
     def classify(self, data) -> dict:
         """Classify PPG data using the loaded model."""
         self.__add_data__(data)
-        if len(self.data) != 250:
-            print(f"Insufficient data for classification: {len(self.data)} samples (need 250).")
+        if not self.window.is_full():
+            print(f"Insufficient data for classification: {len(self.window)} samples (need {WINDOW_SIZE}).")
             return None
 
-        return classify(self.data, self.model_path)
+        timestamps, original = self.window.view()
+        processed = preprocess_signals(timestamps, original)
+        predictions = self.predict(processed)
+        return build_results(self.columns, original, processed, predictions)
+
+    def predict(self, windows: numpy.ndarray) -> numpy.ndarray:
+        """Runs a single forward pass over stacked preprocessed windows.
 
+        Args:
+            windows (numpy.ndarray): Array of shape (N, 250) with preprocessed signals.
+
+        Returns:
+            numpy.ndarray: Class probabilities of shape (N, n_classes).
+        """
+        batch = numpy.ascontiguousarray(windows, dtype=numpy.float32).reshape(-1, WINDOW_SIZE, 1)
+        start = time.perf_counter()
+        predictions = self.backend.predict(batch)
+        elapsed = time.perf_counter() - start
+
+        self.inference_count += 1
+        self.inference_seconds_total += elapsed
+        self.last_inference_seconds = elapsed
+        return predictions
+
+    def timings(self) -> dict[str, float | int | None]:
+        """Returns model load time and per-call inference timing statistics (seconds)."""
+        mean = (self.inference_seconds_total / self.inference_count) if self.inference_count else None
+        return {
+            "backend": self.backend.name,
+            "model_version": self.version,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "inference_count": self.inference_count,
+            "last_inference_seconds": self.last_inference_seconds,
+            "mean_inference_seconds": mean,
+        }
 
     def __add_data__(self, data) -> None:
         """Adds new PPG data for inference."""
-        if self.data is None:
-            self.data = data.copy()
-            return
+        if self.window is None:
+            self.columns = list(data.columns)
+            self.window = RingBuffer(len(self.columns), WINDOW_SIZE)
 
-        self.data = concat([self.data, data]).tail(250)
+        self.window.append(data.index.to_numpy(dtype=numpy.int64), data.to_numpy(dtype=numpy.float32).T)
 
 
-def classify(data: DataFrame, model_path: str) -> dict[str, dict[str, object]]:
+def classify(data: "DataFrame", model_path: str) -> dict[str, dict[str, object]]:
     """Classify PPG data and return per-channel results.
 
+    Loads the model on every call; long-running callers should use ``Inferer``,
+    which keeps the model resident.
+
     Args:
         data (pandas.DataFrame): DataFrame containing the PPG channels as columns.
             Must be 10 seconds at 25 Hz (exactly 250 rows).
-        model_path (str): Filesystem path to a Keras model file compatible with the
-            network used for inference. Model must accept input shape (1, 250, 1).
+        model_path (str): Filesystem path to a Keras or ``.tflite`` model file compatible
+            with the network used for inference. Model must accept input shape (N, 250, 1).
 
     Returns:
         results: A mapping from channel name (e.g. ``"RED"``,
@@ -77,65 +153,186 @@ def classify(data: DataFrame, model_path: str) -> dict[str, dict[str, object]]:
         >>> results["RED"]["signal"].shape
         (250,)
 
+    Raises:
+        ValueError: If the input data does not have the expected frequency or length.
+    """
+    columns, original, processed = preprocess_window(data)
+
+    # All channels go through the model in one batch of shape (C, 250, 1).
+    backend = load_backend(model_path)
+    predictions = backend.predict(numpy.ascontiguousarray(processed, dtype=numpy.float32).reshape(-1, WINDOW_SIZE, 1))
+
+    return build_results(columns, original, processed, predictions)
+
+
+def preprocess_window(data: "DataFrame") -> tuple[list[str], numpy.ndarray, numpy.ndarray]:
+    """Validates a 250-sample window and preprocesses every channel.
+
+    Returns:
+        A tuple ``(columns, original, processed)`` where ``original`` and
+        ``processed`` are float32 arrays of shape (C, 250), one row per column.
+
+    Raises:
+        ValueError: If the input data does not have the expected frequency or length.
+    """
+    original = data.to_numpy(dtype=numpy.float32).T
+    processed = preprocess_signals(data.index.to_numpy(), original)
+    return list(data.columns), original, processed
+
+
+def preprocess_signals(timestamps: numpy.ndarray, signals: numpy.ndarray) -> numpy.ndarray:
+    """Validates a window given as arrays and preprocesses every channel.
+
+    Args:
+        timestamps (numpy.ndarray): 1-D timestamps in milliseconds, length 250.
+        signals (numpy.ndarray): Raw signals of shape (C, 250).
+
+    Returns:
+        numpy.ndarray: float32 array of shape (C, 250) with the preprocessed signals.
+
     Raises:
         ValueError: If the input data does not have the expected frequency or length.
     """
 
     # Validate data frequency and length
     try:
-        # Assuming the index is a timestamp in milliseconds
-        first = int(data.iloc[0].name) 
-        second = int(data.iloc[1].name)
-        diff = second - first
+        # Assuming the index is a timestamp in milliseconds; the median step of the
+        # whole window, so one jittery pair does not decide the rate
+        diff = float(numpy.median(numpy.diff(numpy.asarray(timestamps, dtype=numpy.float64))))
         freq = 1.0 / (diff / 1000.0)  # ms to s
-        if (abs(freq - 25.0) > 0.1):
+        if (abs(freq - SAMPLING_RATE) > 0.1):
             raise ValueError(f"Data frequency is {freq:.2f} Hz, expected 25.0 Hz.")
     except Exception as e:
         raise ValueError(f"Could not determine data frequency: {e}")
 
-    if len(data) != 250:
-        raise ValueError(f"Data length is {len(data)} samples, expected exactly 250 samples (10 seconds at 25 Hz).")
+    if signals.shape[-1] != WINDOW_SIZE:
+        raise ValueError(f"Data length is {signals.shape[-1]} samples, expected exactly 250 samples (10 seconds at 25 Hz).")
 
-    # Preprocess each channel
+    # Preprocess every channel in one call along the sample axis
     # The bandpass filter is expected to remove baseline wander and high-frequency noise, leaving the relevant cardiac components.
     # The robust normalization centers the signal around zero and scales it based on the median absolute deviation.
-    processed: dict[str, numpy.ndarray] = {}
-    for key in data.columns:
-        signal = data[key].values.astype(numpy.float32)
-        signal = bandpass_filter(signal, 0.5, 8.0, 25.0)
-        signal = robust_normalize(signal)
-        processed[key] = signal
-
-    # Load model and classify each channel
-    model = keras.models.load_model(model_path, compile=False)
-    results: dict[str, dict[str, object]] = {}
-    for key in processed:
-        seg = processed[key].reshape(1, 250, 1)
+    return preprocess_windows(signals)
+
 
-        pred = model.predict(seg, verbose=0)[0]
-        idx = int(numpy.argmax(pred))
-        label = "SR" if idx == 0 else "AF"
-        conf = float(numpy.max(pred))
+def preprocess_windows(windows: numpy.ndarray) -> numpy.ndarray:
+    """Preprocesses many windows at once, without validation.
+
+    Same bandpass + robust normalization as ``preprocess_signals``, applied along
+    the last axis of a (channels x samples) or (windows x samples) array in one
+    call instead of per row.
+    """
+    return robust_normalize(bandpass_filter(windows, 0.5, 8.0, SAMPLING_RATE), axis=-1)
 
+
+def build_results(columns: list[str], original: numpy.ndarray, processed: numpy.ndarray,
+                  predictions: numpy.ndarray, classified: Optional[numpy.ndarray] = None) -> dict[str, dict[str, object]]:
+    """Maps per-channel model outputs to the result dictionaries returned by ``classify``.
+
+    With a boolean ``classified`` mask, ``predictions`` only holds the rows of the
+    channels where it is True; the other channels skipped the model (low signal
+    quality) and get the ``LOW_QUALITY_LABEL`` label with confidence 0.
+    """
+    indices = numpy.argmax(predictions, axis=1)
+    confidences = numpy.max(predictions, axis=1)
+    rows = numpy.arange(len(columns)) if classified is None else numpy.cumsum(classified) - 1
+
+    results: dict[str, dict[str, object]] = {}
+    for i, key in enumerate(columns):
+        skipped = classified is not None and not classified[i]
         results[key] = {
-            "original_signal": data[key].values.astype(numpy.float32),
-            "preprocessed_signal": processed[key],
-            "label": label,
-            "confidence": conf
+            "original_signal": numpy.array(original[i]),
+            "preprocessed_signal": processed[i],
+            "label": LOW_QUALITY_LABEL if skipped else ("SR" if int(indices[rows[i]]) == 0 else "AF"),
+            "confidence": 0.0 if skipped else float(confidences[rows[i]])
         }
 
     return results
-    
 
-def bandpass_filter(x: numpy.ndarray, lowcut: float, highcut: float, fs: float) -> numpy.ndarray:
-    """Applies a Butterworth bandpass filter to the input signal x."""
+
+@lru_cache(maxsize=32)
+def filter_bank(order: int, lowcut: float, highcut: float, fs: float) -> numpy.ndarray:
+    """Butterworth bandpass second-order sections, designed once per (order, band, fs).
+
+    The returned array is shared between callers and must not be modified.
+    """
+    from scipy.signal import butter  # scipy.signal takes about a second to import
     nyq = fs * 0.5
-    b, a = butter(4, [lowcut / nyq, highcut / nyq], btype="band")
-    return filtfilt(b, a, x)
+    return butter(order, [lowcut / nyq, highcut / nyq], btype="band", output="sos")
+
 
-def robust_normalize(x: numpy.ndarray) -> numpy.ndarray:
-    """Applies robust normalization to the input signal x."""
+def bandpass_filter(x: numpy.ndarray, lowcut: float, highcut: float, fs: float,
+                    order: int = 4, axis: int = -1) -> numpy.ndarray:
+    """Applies a zero-phase Butterworth bandpass filter to x along ``axis``.
+
+    Rows of a 2-D array (channels or windows) are filtered in a single call. Uses
+    the cached second-order sections of ``filter_bank`` with the same edge padding
+    as ``filtfilt`` on the (b, a) form of the filter.
+    """
+    from scipy.signal import sosfiltfilt
+    return sosfiltfilt(filter_bank(order, lowcut, highcut, fs), x, axis=axis, padlen=3 * (2 * order + 1))
+
+def robust_normalize(x: numpy.ndarray, axis: Optional[int] = -1) -> numpy.ndarray:
+    """Applies robust normalization to the input signal x along ``axis`` (None: the whole array)."""
     x = numpy.asarray(x, dtype=numpy.float32)
-    med = numpy.median(x)
-    mad = numpy.median(numpy.abs(x - med)) + 1e-8
+    med = numpy.median(x, axis=axis, keepdims=True)
+    mad = numpy.median(numpy.abs(x - med), axis=axis, keepdims=True) + 1e-8
     return (x - med) / mad
+
+
+class StreamingPreprocessor:
+    """Causal, stateful counterpart of ``bandpass_filter`` + ``robust_normalize``.
+
+    The bandpass runs as a second-order-sections filter whose state is kept between
+    calls, so each new sample costs O(1) instead of re-filtering a whole window.
+    Median and MAD are tracked incrementally with a stochastic-approximation update
+    (step ``1 / stats_window``), seeded with the exact statistics of the first batch
+    and advanced for a whole batch with a few numpy operations (no per-sample loop).
+    Unlike ``bandpass_filter`` this is not zero-phase: use it for live display, and
+    keep the per-window zero-phase path for inference. With ``normalize=False`` only
+    the bandpass is applied.
+    """
+
+    def __init__(self, lowcut: float = 0.5, highcut: float = 8.0, fs: float = SAMPLING_RATE,
+                 order: int = 4, stats_window: int = WINDOW_SIZE, normalize: bool = True):
+        self.sos = filter_bank(order, lowcut, highcut, fs)
+        self.rate = 1.0 / float(stats_window)
+        self.normalize = normalize
+        self._zi: numpy.ndarray | None = None
+        self.median: float | None = None
+        self.mad: float | None = None
+
+    def reset(self) -> None:
+        self._zi = None
+        self.median = None
+        self.mad = None
+
+    def process(self, x: numpy.ndarray) -> numpy.ndarray:
+        """Filters and normalizes a batch of new samples, returning float32 values of the same length."""
+        x = numpy.asarray(x, dtype=numpy.float64)
+        if x.size == 0:
+            return numpy.zeros(0, dtype=numpy.float32)
+        from scipy.signal import sosfilt, sosfilt_zi
+        if self._zi is None:
+            # Start in steady state for the first value to avoid a large step transient.
+            self._zi = sosfilt_zi(self.sos) * x[0]
+        filtered, self._zi = sosfilt(self.sos, x, zi=self._zi)
+        if not self.normalize:
+            return filtered.astype(numpy.float32)
+
+        if self.median is None:
+            self.median = float(numpy.median(filtered))
+            self.mad = float(numpy.median(numpy.abs(filtered - self.median))) + 1e-8
+
+        # Stochastic-approximation steps for the whole batch at once: each sample moves the
+        # median by ``rate * mad`` towards itself and scales the MAD by ``1 +/- rate``. Step
+        # directions are taken against the estimates at the start of the batch (equal to the
+        # per-sample recursion while a batch moves them less than its spread), and every
+        # sample is normalized with the estimates reached just before it.
+        med, mad, rate = self.median, self.mad, self.rate
+        signs = numpy.sign(filtered - med)
+        medians = med + (rate * mad) * numpy.cumsum(signs)    # after each sample
+        factors = numpy.where(numpy.abs(filtered - medians) > mad, 1.0 + rate, 1.0 - rate)
+        mads = numpy.maximum(mad * numpy.cumprod(factors), 1e-8)
+        out = ((filtered - (medians - (rate * mad) * signs)) / (mads / factors)).astype(numpy.float32)
+        self.median, self.mad = float(medians[-1]), float(mads[-1])
+        return out
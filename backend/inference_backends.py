@@ -0,0 +1,160 @@
+import abc
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+import numpy
+
+BACKENDS = ("keras", "tflite")
+
+
+def load_tensorflow():
+    """Imports TensorFlow on first use.
+
+    TensorFlow takes seconds and hundreds of MB to import, so it is only loaded when
+    a model is, not when ``infer`` is imported for its signal processing.
+    """
+    import tensorflow
+    # After TensorFlow is imported, ensure its Python logger is quiet.
+    logging.getLogger('tensorflow').setLevel(logging.ERROR)
+    return tensorflow
+
+
+def load_tflite_interpreter():
+    """Interpreter class of the lightest TFLite runtime installed.
+
+    ``ai-edge-litert`` and ``tflite-runtime`` only ship the interpreter; the
+    TensorFlow fallback works everywhere but imports the whole framework.
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            Interpreter = load_tensorflow().lite.Interpreter
+    return Interpreter
+
+
+class InferenceBackend(abc.ABC):
+    """Runs a classification model on batches of preprocessed windows.
+
+    ``predict`` takes a float32 array of shape (N, samples, 1) and returns the
+    (N, n_classes) class probabilities as a numpy array.
+    """
+
+    name = ""
+
+    def __init__(self, model_path: str):
+        self.model_path = str(model_path)
+
+    @abc.abstractmethod
+    def predict(self, batch: numpy.ndarray) -> numpy.ndarray:
+        """Class probabilities (N, n_classes) of a (N, samples, 1) float32 batch."""
+
+    def describe(self) -> dict[str, object]:
+        return {"backend": self.name, "model_path": self.model_path}
+
+
+class KerasBackend(InferenceBackend):
+    """Keras model behind a single traced ``tf.function`` for any batch size."""
+
+    name = "keras"
+
+    def __init__(self, model_path: str):
+        super().__init__(model_path)
+        tensorflow = load_tensorflow()
+        self.model = tensorflow.keras.models.load_model(model_path, compile=False)
+        # A single traced graph for any number of stacked windows: (N, 250, 1).
+        self._forward = tensorflow.function(
+            lambda x: self.model(x, training=False),
+            input_signature=[tensorflow.TensorSpec([None, *self.model.input_shape[1:]], tensorflow.float32)],
+        )
+
+    def predict(self, batch: numpy.ndarray) -> numpy.ndarray:
+        return self._forward(batch).numpy()
+
+
+class TFLiteBackend(InferenceBackend):
+    """TFLite interpreter with its tensors allocated up front.
+
+    Tensors are allocated at load time for a batch of one window and re-allocated
+    only when a call brings a different batch size, so the steady state is
+    ``set_tensor`` + ``invoke``. Quantized (int8/uint8) inputs and outputs are
+    converted with the scale and zero point stored in the model.
+    """
+
+    name = "tflite"
+
+    def __init__(self, model_path: str, num_threads: Optional[int] = None):
+        super().__init__(model_path)
+        self.interpreter = load_tflite_interpreter()(model_path=str(model_path), num_threads=num_threads)
+        self.num_threads = num_threads
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+        self._input_index = input_details["index"]
+        self._output_index = output_details["index"]
+        self._sample_shape = list(input_details["shape"][1:])
+        self._input_dtype = input_details["dtype"]
+        self._input_quantization = input_details["quantization"]
+        self._output_quantization = output_details["quantization"]
+        self._batch_size = 0
+        self._allocate(1)
+
+    def _allocate(self, batch_size: int) -> None:
+        self.interpreter.resize_tensor_input(self._input_index, [batch_size, *self._sample_shape], strict=False)
+        self.interpreter.allocate_tensors()
+        self._batch_size = batch_size
+
+    def predict(self, batch: numpy.ndarray) -> numpy.ndarray:
+        if batch.shape[0] != self._batch_size:
+            self._allocate(batch.shape[0])
+        scale, zero_point = self._input_quantization
+        if scale:
+            info = numpy.iinfo(self._input_dtype)
+            batch = numpy.clip(numpy.round(batch / scale + zero_point), info.min, info.max).astype(self._input_dtype)
+        self.interpreter.set_tensor(self._input_index, batch)
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self._output_index)
+        scale, zero_point = self._output_quantization
+        if scale:
+            return (output.astype(numpy.float32) - zero_point) * scale
+        return output
+
+    def describe(self) -> dict[str, object]:
+        return {**super().describe(), "input_dtype": numpy.dtype(self._input_dtype).name,
+                "num_threads": self.num_threads}
+
+
+def model_version(model_path: str) -> str:
+    """Short content hash of a model file, or of the names, sizes and mtimes of a model folder.
+
+    Identifies the model in cache keys, so results of a replaced model never match.
+    """
+    path = Path(model_path)
+    digest = hashlib.blake2b(digest_size=8)
+    if path.is_dir():
+        for item in sorted(p for p in path.rglob("*") if p.is_file()):
+            stat = item.stat()
+            digest.update(f"{item.relative_to(path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    else:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def backend_for(model_path: str, backend: Optional[str] = None) -> str:
+    """Backend name for a model file: ``backend`` if given, else from the suffix (``.tflite`` or Keras)."""
+    if backend not in (None, "", "auto"):
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS} or 'auto'")
+        return backend
+    return "tflite" if Path(model_path).suffix == ".tflite" else "keras"
+
+
+def load_backend(model_path: str, backend: Optional[str] = None, num_threads: Optional[int] = None) -> InferenceBackend:
+    """Loads ``model_path`` with the chosen backend (``None``/``"auto"``: by file suffix)."""
+    if backend_for(model_path, backend) == "tflite":
+        return TFLiteBackend(model_path, num_threads=num_threads)
+    return KerasBackend(model_path)
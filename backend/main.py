@@ -3,20 +3,33 @@ import os
 import time
 from pathlib import Path
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from data import ppg_dict_to_dataframe, store_ppg_dataframe_to_csv
-from infer import Inferer, bandpass_filter, robust_normalize
-from typing import List, Optional
+from data import ppg_dict_to_arrays, decode_ppg_binary, store_ppg_dataframe_to_csv
+# infer.py importa TensorFlow y scipy.signal solo al usarlos (carga del modelo / primer filtro)
+from infer import (Inferer, bandpass_filter, robust_normalize, build_results, preprocess_signals, StreamingPreprocessor,
+                   filter_bank, SAMPLING_RATE)
+from scheduler import InferenceScheduler, LatestJobDispatcher, SchedulerFull
+from quality import signal_quality
+from cache import LRUCache, window_key
+from timebase import GridResampler, Run, to_epoch_ms
+from storage import SegmentStore, FSYNC_POLICIES, read_segments
+from downsample import METHODS as DOWNSAMPLE_METHODS, lttb
+from history import (iter_history, ndjson_stream, binary_stream, collect,
+                     PREPROCESS_MODES, STREAM_FORMATS, MEDIA_TYPES)
+from measurement import MeasurementLog
+from session import DeviceSession, SessionManager, DEVICE_ID_HEADER, sanitize_device_id
+from connections import ConnectionManager, SUBSCRIPTION_KEYS
+from protocol import LiveUpdate
+from metrics import Metrics, SamplingProfiler, monitor_event_loop, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from typing import Optional
+import io
 import json
+import asyncio
+import threading
 import numpy as np
-from collections import deque
-import pandas as pd
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-
-# importar recorder (asumimos que uvicorn se ejecuta desde la carpeta backend)
-from video import GreenChannelVideoRecorder
+from datetime import datetime
+# pandas, matplotlib y video.py (OpenCV) se importan al usarse: ver create_recorder y render_measurement_image
 
 # ---------------- App / CORS / Manager ----------------
 app = FastAPI()
@@ -34,45 +47,149 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-
-    async def broadcast(self, message: str):
-        for connection in list(self.active_connections):
-            try:
-                await connection.send_text(message)
-            except Exception:
-                try:
-                    self.disconnect(connection)
-                except Exception:
-                    pass
-
-manager = ConnectionManager()
+# Fan-out WebSocket: cola acotada por cliente + tarea de envío propia; el POST nunca espera a los clientes
+WS_QUEUE_SIZE = int(os.environ.get('PPG_WS_QUEUE_SIZE', '64'))                  # mensajes pendientes por cliente
+WS_DROP_POLICY = os.environ.get('PPG_WS_DROP_POLICY', 'drop_oldest')            # drop_oldest | latest
+WS_MAX_LAG_SECONDS = float(os.environ.get('PPG_WS_MAX_LAG_SECONDS', '10'))       # retraso máximo antes de desconectar
+if WS_DROP_POLICY not in ConnectionManager.POLICIES:
+    print(f"Unknown PPG_WS_DROP_POLICY '{WS_DROP_POLICY}', using 'drop_oldest'.")
+    WS_DROP_POLICY = 'drop_oldest'
+
+manager = ConnectionManager(max_queue=WS_QUEUE_SIZE, policy=WS_DROP_POLICY, max_lag_seconds=WS_MAX_LAG_SECONDS)
+
+# ---------------- Métricas ----------------
+# Histogramas de latencia por etapa y dispositivo, expuestos en /metrics (formato Prometheus)
+metrics = Metrics()
+LOOP_LAG_INTERVAL = float(os.environ.get('PPG_LOOP_LAG_INTERVAL', '0.5'))   # segundos entre mediciones del retraso del event loop
+# Perfilador por muestreo (/debug/profile): desactivado por defecto, expone las pilas del proceso
+PROFILER_ENABLED = os.environ.get('PPG_PROFILER', '0') not in ('0', 'false', 'False')
+PROFILER_MAX_SECONDS = float(os.environ.get('PPG_PROFILER_MAX_SECONDS', '60'))
+profiler = SamplingProfiler()
+
+# ---------------- Subsistemas opcionales ----------------
+# Cada subsistema pesado se activa por configuración y solo se importa si está activo:
+# inferencia (TensorFlow, con PPG_MODEL_PATH), video GREEN (OpenCV + matplotlib) e imagen de sesión (matplotlib).
+def env_flag(name: str, default: str = '1') -> bool:
+    return os.environ.get(name, default) not in ('0', 'false', 'False')
+
+VIDEO_ENABLED = env_flag('PPG_VIDEO')
+SESSION_IMAGE_ENABLED = env_flag('PPG_SESSION_IMAGE')
 
 # ---------------- Inferer / Project paths ----------------
+# El modelo se carga (y se calienta) en segundo plano tras el arranque; /ready indica cuándo está listo.
+# Hasta entonces los POST se procesan sin inferencia.
 model_path = os.environ.get('PPG_MODEL_PATH') or None
+# Backend de inferencia: 'auto' (por extensión: .tflite -> intérprete TFLite, resto -> Keras), 'keras' o 'tflite'
+INFERENCE_BACKEND = os.environ.get('PPG_INFERENCE_BACKEND', 'auto').lower()
+INFERENCE_THREADS = int(os.environ.get('PPG_INFERENCE_THREADS', '0')) or None   # hilos del intérprete TFLite
 inferer: Optional[Inferer] = None
 if model_path is not None:
-    print(f"Using PPG model path from env: {model_path}")
+    print(f"Using PPG model path from env: {model_path} (backend: {INFERENCE_BACKEND})")
+
+# Micro-batching: agrupa ventanas de varios dispositivos en una sola llamada al modelo.
+# Sin batching (PPG_BATCH_INFERENCE=0) cada ventana (todos sus canales) es una llamada, igualmente en el hilo del scheduler.
+BATCH_INFERENCE = os.environ.get('PPG_BATCH_INFERENCE', '1') not in ('0', 'false', 'False')
+BATCH_MAX_SIZE = int(os.environ.get('PPG_BATCH_MAX_SIZE', '64'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('PPG_BATCH_MAX_WAIT_MS', '20'))
+BATCH_QUEUE_DEPTH = int(os.environ.get('PPG_BATCH_QUEUE_DEPTH', '1024'))
+
+# Stride: segundos de datos nuevos entre dos ventanas clasificadas (ventanas solapadas de 10 s); 0 = en cada POST
+INFERENCE_STRIDE_SECONDS = float(os.environ.get('PPG_INFERENCE_STRIDE_SECONDS', '2.5'))
+INFERENCE_STRIDE = max(1, round(INFERENCE_STRIDE_SECONDS * SAMPLING_RATE))
+
+# Calidad de señal (quality.py): los canales con SQI < umbral no pasan por el modelo (resultado LOW_QUALITY).
+# 0 desactiva el filtrado; la perfusión mínima (AC/DC) pone el SQI a 0 (sensor sin pulso)
+SQI_THRESHOLD = float(os.environ.get('PPG_SQI_THRESHOLD', '0.7'))
+SQI_MIN_PERFUSION = float(os.environ.get('PPG_SQI_MIN_PERFUSION', '0.0005'))
+# Canales clasificados / descartados por baja calidad (inferencia ahorrada)
+quality_counts = {"classified": 0, "low_quality": 0}
+
+# Caché de clasificación direccionada por contenido: hash de la ventana cruda de un canal + versión del modelo
+# -> (SQI, ventana preprocesada, predicción). LRU acotada por entradas y antigüedad; tamaño 0 la desactiva
+CLASSIFY_CACHE_SIZE = int(os.environ.get('PPG_CLASSIFY_CACHE_SIZE', '4096'))
+CLASSIFY_CACHE_TTL_SECONDS = float(os.environ.get('PPG_CLASSIFY_CACHE_TTL_SECONDS', '600'))
+classify_cache = LRUCache(CLASSIFY_CACHE_SIZE, CLASSIFY_CACHE_TTL_SECONDS)
+# Lotes recientes recordados por sesión para descartar POST duplicados (reintentos, reenvíos); 0 desactiva
+DEDUPE_BATCHES = int(os.environ.get('PPG_DEDUPE_BATCHES', '64'))
+# Remuestreo a la rejilla exacta de SAMPLING_RATE (inferencia, video GREEN, imagen de la medición):
+# pasos de hasta PPG_RESAMPLE_MAX_GAP_MS se interpolan; uno mayor es un hueco y la rejilla se reinicia
+RESAMPLE_ENABLED = env_flag('PPG_RESAMPLE')
+RESAMPLE_MAX_GAP_MS = float(os.environ.get('PPG_RESAMPLE_MAX_GAP_MS', '200'))
+
+scheduler: Optional[InferenceScheduler] = None
+
+# Estado de carga de cada subsistema para /ready: disabled | loading | ready | failed
+readiness = {
+    "inference": "loading" if model_path is not None else "disabled",
+    "video": "loading" if VIDEO_ENABLED else "disabled",
+    "signal": "loading",
+}
+
+async def load_model():
+    """Carga y calienta el modelo en un hilo; después arranca el scheduler de micro-batching."""
+    global inferer, scheduler
     try:
-        inferer = Inferer(model_path)
+        loaded = await asyncio.to_thread(Inferer, model_path, backend=INFERENCE_BACKEND, num_threads=INFERENCE_THREADS)
     except Exception as e:
         print(f"Could not initialize Inferer: {e}")
-        inferer = None
+        readiness["inference"] = "failed"
+        return
+    timings = loaded.timings()
+    print(f"Model loaded in {timings['load_seconds']:.2f}s (warm-up {timings['warmup_seconds']:.2f}s)")
+    # El modelo nunca se ejecuta en el event loop: todas las llamadas pasan por el hilo del scheduler
+    batch_size = BATCH_MAX_SIZE if BATCH_INFERENCE else 1
+    batcher = InferenceScheduler(
+        loaded.predict,
+        max_batch_size=batch_size,
+        max_wait_ms=BATCH_MAX_WAIT_MS if BATCH_INFERENCE else 0.0,
+        max_queue_depth=max(BATCH_QUEUE_DEPTH, batch_size),
+    )
+    await batcher.start()
+    scheduler = batcher
+    print(f"Inference scheduler started (batch={batcher.max_batch_size}, wait={batcher.max_wait * 1000.0:g}ms, "
+          f"queue={BATCH_QUEUE_DEPTH}, stride={INFERENCE_STRIDE} samples)")
+    inferer = loaded
+    readiness["inference"] = "ready"
+
+def preload_subsystems():
+    """Importa en segundo plano lo que el primer POST necesitaría: scipy.signal (filtros) y video.py."""
+    try:
+        filter_bank(4, 0.5, 8.0, VIDEO_FS)
+        readiness["signal"] = "ready"
+    except Exception as e:
+        print(f"Could not load signal processing: {e}")
+        readiness["signal"] = "failed"
+    if VIDEO_ENABLED:
+        try:
+            get_render_worker()
+            readiness["video"] = "ready"
+        except Exception as e:
+            print(f"Could not load video recording: {e}")
+            readiness["video"] = "failed"
 
 project_root = Path(__file__).resolve().parents[1]
 DATA_DIR = Path(os.environ.get('PPG_DATA_DIR') or (project_root / 'data'))
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+# ---------------- Almacenamiento ----------------
+# 'segments': segmentos binarios comprimidos por dispositivo (data/segments/<device>/...)
+# 'csv': anexar cada POST a data/ppg.csv (comportamiento anterior)
+STORAGE = os.environ.get('PPG_STORAGE', 'segments').lower()
+STORAGE_FSYNC = os.environ.get('PPG_STORAGE_FSYNC', 'close')
+if STORAGE_FSYNC not in FSYNC_POLICIES:
+    print(f"Unknown PPG_STORAGE_FSYNC '{STORAGE_FSYNC}', using 'close'.")
+    STORAGE_FSYNC = 'close'
+
+store: Optional[SegmentStore] = None
+if STORAGE == 'segments':
+    store = SegmentStore(
+        DATA_DIR / 'segments',
+        segment_seconds=int(os.environ.get('PPG_SEGMENT_SECONDS', '3600')),
+        flush_rows=int(os.environ.get('PPG_STORAGE_FLUSH_ROWS', '1500')),
+        flush_seconds=float(os.environ.get('PPG_STORAGE_FLUSH_SECONDS', '5')),
+        fsync=STORAGE_FSYNC,
+    )
+
 # ---------------- Video configuration (incluye Y-limits opcionales) ----------------
 VIDEO_DIR = Path(os.environ.get('PPG_VIDEO_DIR') or (project_root / 'data' / 'videos'))
 VIDEO_DIR.mkdir(parents=True, exist_ok=True)
@@ -89,6 +206,13 @@ VIDEO_Y_MIN = os.environ.get('PPG_VIDEO_Y_MIN')  # e.g. "-5"
 VIDEO_Y_MAX = os.environ.get('PPG_VIDEO_Y_MAX')  # e.g. "5"
 VIDEO_Y_SMOOTH = float(os.environ.get('PPG_VIDEO_Y_SMOOTH', '0.2'))  # 0..1 para suavizado dinámico
 
+# Preprocesado GREEN para el video: 'streaming' (filtro causal con estado, O(1) por muestra)
+# o 'zerophase' (filtfilt + robust_normalize sobre la ventana completa en cada muestra)
+GREEN_PREPROCESS = os.environ.get('PPG_GREEN_PREPROCESS', 'streaming').lower()
+if GREEN_PREPROCESS not in ('streaming', 'zerophase'):
+    print(f"Unknown PPG_GREEN_PREPROCESS '{GREEN_PREPROCESS}', using 'streaming'.")
+    GREEN_PREPROCESS = 'streaming'
+
 if VIDEO_Y_MIN is not None:
     try:
         VIDEO_Y_MIN = float(VIDEO_Y_MIN)
@@ -100,51 +224,158 @@ if VIDEO_Y_MAX is not None:
     except Exception:
         VIDEO_Y_MAX = None
 
-# Instanciar recorder con parámetros Y
-recorder = GreenChannelVideoRecorder(
-    str(VIDEO_DIR),
-    filename_prefix="GREEN_channel",
-    fps=VIDEO_FPS,
-    width=VIDEO_WIDTH,
-    height=VIDEO_HEIGHT,
-    window=VIDEO_WINDOW,
-    fs=VIDEO_FS,
-    y_min=VIDEO_Y_MIN,
-    y_max=VIDEO_Y_MAX,
-    y_smooth=VIDEO_Y_SMOOTH
-)
+# Render/encode del video en un hilo dedicado alimentado por una cola acotada
+VIDEO_QUEUE_SIZE = int(os.environ.get('PPG_VIDEO_QUEUE_SIZE', '500'))          # frames pendientes (todas las sesiones)
+VIDEO_OVERFLOW_POLICY = os.environ.get('PPG_VIDEO_OVERFLOW_POLICY', 'drop_oldest')  # drop_oldest | coalesce | block
+
+# Backend de render: 'raster' (chrome cacheado + trazo con OpenCV) o 'matplotlib' (redibujo completo)
+VIDEO_RENDERER = os.environ.get('PPG_VIDEO_RENDERER', 'raster').lower()
+
+# video.py (OpenCV + matplotlib) se importa con el primer recorder o en preload_subsystems
+render_worker = None
+video_recorder_class = None
+_video_lock = threading.Lock()
+
+def get_render_worker():
+    """Importa video.py y arranca el FrameRenderWorker la primera vez (thread-safe)."""
+    global render_worker, video_recorder_class, VIDEO_OVERFLOW_POLICY, VIDEO_RENDERER
+    with _video_lock:
+        if render_worker is None:
+            import video
+            if VIDEO_OVERFLOW_POLICY not in video.FrameRenderWorker.POLICIES:
+                print(f"Unknown PPG_VIDEO_OVERFLOW_POLICY '{VIDEO_OVERFLOW_POLICY}', using 'drop_oldest'.")
+                VIDEO_OVERFLOW_POLICY = 'drop_oldest'
+            recorder_classes = {'raster': video.RasterGreenChannelVideoRecorder, 'matplotlib': video.GreenChannelVideoRecorder}
+            if VIDEO_RENDERER not in recorder_classes:
+                print(f"Unknown PPG_VIDEO_RENDERER '{VIDEO_RENDERER}', using 'raster'.")
+                VIDEO_RENDERER = 'raster'
+            video_recorder_class = recorder_classes[VIDEO_RENDERER]
+            worker = video.FrameRenderWorker(max_queue=VIDEO_QUEUE_SIZE, policy=VIDEO_OVERFLOW_POLICY)
+            worker.start()
+            render_worker = worker
+    return render_worker
+
+# ---------------- Sesiones por dispositivo ----------------
+SESSION_MAX = int(os.environ.get('PPG_SESSION_MAX', '256'))
+SESSION_TTL_SECONDS = float(os.environ.get('PPG_SESSION_TTL_SECONDS', '300'))
+# Resolución de la envolvente min/max de la imagen de sesión (~1 bucket por píxel)
+SESSION_IMAGE_BUCKETS = int(os.environ.get('PPG_SESSION_IMAGE_BUCKETS', '2048'))
+
+def create_recorder(device_id: str):
+    """Instancia un recorder GREEN (con parámetros Y) para un dispositivo, renderizado en segundo plano."""
+    from video import BackgroundRecorder
+    worker = get_render_worker()
+    recorder = video_recorder_class(
+        str(VIDEO_DIR),
+        filename_prefix=f"GREEN_channel_{device_id}",
+        fps=VIDEO_FPS,
+        width=VIDEO_WIDTH,
+        height=VIDEO_HEIGHT,
+        window=VIDEO_WINDOW,
+        fs=VIDEO_FS,
+        y_min=VIDEO_Y_MIN,
+        y_max=VIDEO_Y_MAX,
+        y_smooth=VIDEO_Y_SMOOTH
+    )
+    return BackgroundRecorder(recorder, worker)
+
+def create_session(device_id: str) -> DeviceSession:
+    return DeviceSession(
+        device_id,
+        window_size=250,
+        video_window=VIDEO_WINDOW,
+        measurement=MeasurementLog(
+            buckets=SESSION_IMAGE_BUCKETS,
+            sample_period=1.0 / VIDEO_FS,
+            preprocessor=StreamingPreprocessor(0.5, 8.0, VIDEO_FS, normalize=False),
+        ) if SESSION_IMAGE_ENABLED else None,
+        recorder_factory=create_recorder if VIDEO_ENABLED else None,
+        green_preprocessor=StreamingPreprocessor(0.5, 8.0, VIDEO_FS) if VIDEO_ENABLED and GREEN_PREPROCESS == 'streaming' else None,
+        inference_stride=INFERENCE_STRIDE,
+        dedupe_batches=DEDUPE_BATCHES,
+        resampler=GridResampler(1000.0 / SAMPLING_RATE, RESAMPLE_MAX_GAP_MS) if RESAMPLE_ENABLED else None,
+    )
+
+# Imágenes de medición pendientes de sesiones expulsadas: se renderizan fuera del event loop; el apagado las espera
+finalize_tasks: set = set()
+
+def save_measurement_image(session: DeviceSession):
+    """Renderiza y guarda la imagen de la medición completa de una sesión expulsada (en un hilo)."""
+    try:
+        images_dir = DATA_DIR / "images"
+        images_dir.mkdir(parents=True, exist_ok=True)
+        saved = save_full_measurement_image(
+            session.measurement, images_dir,
+            filename_prefix=f"measurement_full_{session.device_id}"
+        )
+        if saved is not None:
+            print(f"[{session.device_id}] Full measurement image saved at:", saved)
+        else:
+            print(f"[{session.device_id}] No full measurement image saved (no data).")
+    except Exception as e:
+        print(f"[{session.device_id}] Error while saving full measurement image:", e)
+
+def finalize_session(session: DeviceSession):
+    """Al expulsar una sesión: cierra su segmento, informa del video y guarda la imagen de la medición completa.
 
-# Rolling buffers (valores y timestamps en epoch seconds) — para ventana
-green_values = deque(maxlen=VIDEO_WINDOW)
-green_timestamps = deque(maxlen=VIDEO_WINDOW)
+    La imagen (render matplotlib + escritura, cientos de ms con una medición larga) se delega a un hilo,
+    porque la expulsión ocurre dentro de sessions.get() en el POST y en maintenance_loop.
+    """
+    # las series por dispositivo se descartan con la sesión (cardinalidad acotada por PPG_SESSION_MAX)
+    metrics.forget(device=session.device_id)
+    if store is not None:
+        # en el loop: vuelca como mucho PPG_STORAGE_FLUSH_ROWS filas, y debe terminar antes de que el
+        # dispositivo pueda volver a abrir el mismo segmento con una sesión nueva
+        store.close_device(session.device_id)
+    if session.has_recorder():
+        print(f"[{session.device_id}] GREEN recorder closing. Video saved at:", session.recorder.get_video_path())
+    if session.measurement is None:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # fuera del event loop (p. ej. scripts): no hay nada que bloquear
+        save_measurement_image(session)
+        return
+    task = loop.create_task(asyncio.to_thread(save_measurement_image, session))
+    finalize_tasks.add(task)
+    task.add_done_callback(finalize_tasks.discard)
+
+sessions = SessionManager(
+    create_session,
+    max_sessions=SESSION_MAX,
+    ttl_seconds=SESSION_TTL_SECONDS,
+    on_evict=finalize_session,
+)
 
-# FULL measurement accumulators (guardan la medición completa durante la sesión)
-full_green_values: List[float] = []
-full_green_timestamps: List[float] = []
+def get_device_id(request: Request, device_id: Optional[str]) -> Optional[str]:
+    """Obtiene el id de dispositivo del payload (DEVICE_ID) o de la cabecera X-Device-Id."""
+    if device_id is None:
+        device_id = request.headers.get(DEVICE_ID_HEADER)
+    return device_id
 
-# ---------------- Util: parse index -> epoch seconds ----------------
-def parse_index_to_seconds(idx):
+# ---------------- Util: ventanas de tamaño fijo por muestra ----------------
+def sliding_windows(ring, timestamps: np.ndarray, values: np.ndarray, window: int, fs: float):
     """
-    Convierte un índice TIMESTAMP del DataFrame a segundos epoch (float).
-    Maneja int/float (ms o s) y strings datetimelike.
+    Ventanas de tamaño EXACTO `window` que terminan en cada muestra nueva (una por frame), en una
+    sola operación: historial del ring buffer de 1 canal + lote, rellenando por la izquierda con el
+    primer valor (y timestamps hacia atrás a 1/fs) mientras no hay `window` muestras.
+    Añade el lote al ring buffer. Devuelve (valores (N, window), timestamps (N, window)): vistas de
+    arrays nuevos, que no cambian con los lotes siguientes.
     """
-    try:
-        if isinstance(idx, (int, np.integer, float, np.floating)):
-            val = float(idx)
-            # heurística: si el número > 1e11 -> ms
-            if val > 1e11:
-                return val / 1000.0
-            if val > 1e9:
-                return val
-            # fallback: si es muy pequeño, usar time.time()
-            return time.time()
-        else:
-            ts = pd.to_datetime(idx, errors='coerce')
-            if pd.isna(ts):
-                return time.time()
-            return ts.timestamp()
-    except Exception:
-        return time.time()
+    hist_ts, hist_vals = ring.view()
+    n_hist = hist_ts.shape[0]
+    seq_ts = np.concatenate((hist_ts, timestamps)).astype(np.float64)
+    seq_vals = np.concatenate((hist_vals[0], values)).astype(np.float32)
+    pad_len = max(0, window - 1 - n_hist)
+    if pad_len:
+        seq_ts = np.concatenate((seq_ts[0] - np.arange(pad_len, 0, -1, dtype=np.float64) * (1.0 / fs), seq_ts))
+        seq_vals = np.concatenate((np.full(pad_len, seq_vals[0], dtype=np.float32), seq_vals))
+    first = pad_len + n_hist - window + 1
+    n = timestamps.shape[0]
+    ring.append(timestamps, values)
+    return (np.lib.stride_tricks.sliding_window_view(seq_vals, window)[first:first + n],
+            np.lib.stride_tricks.sliding_window_view(seq_ts, window)[first:first + n])
 
 # ---------------- WebSocket endpoint ----------------
 @app.websocket("/ws")
@@ -157,54 +388,238 @@ async def websocket_endpoint(websocket: WebSocket):
             await websocket.close(code=1008)
             return
 
-    await manager.connect(websocket)
+    # Suscripción opcional por query: ?format=binary&devices=a,b&channels=GREEN&processed=int16&window=full&points=800&span=60
+    params = websocket.query_params
+    client = await manager.connect(websocket)
+    try:
+        client.subscribe(**{key: params.get(key) for key in SUBSCRIPTION_KEYS})
+    except ValueError as e:
+        print(f"Invalid WebSocket subscription: {e}")
     try:
         while True:
             data = await websocket.receive_text()
-            await manager.broadcast(data)
+            # Mensajes de control {"type": "subscribe", ...}; el resto se reenvía como antes
+            message = None
+            try:
+                message = json.loads(data)
+            except ValueError:
+                pass
+            if isinstance(message, dict) and message.get('type') == 'subscribe':
+                try:
+                    client.subscribe(**{key: message.get(key) for key in SUBSCRIPTION_KEYS})
+                except ValueError as e:
+                    print(f"Invalid WebSocket subscription: {e}")
+                continue
+            manager.broadcast(data)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
+    except RuntimeError:
+        # el servidor cerró la conexión (cliente lento expulsado o apagado)
+        manager.disconnect(websocket)
+
+# ---------------- Stats endpoint ----------------
+@app.get("/stats")
+async def get_stats():
+    """
+    Devuelve estadísticas de ejecución: tiempo de carga del modelo y
+    tiempos de inferencia por llamada.
+    """
+    checked = sum(quality_counts.values())
+    stats = {
+        "sessions": sessions.stats(),
+        "video": render_worker.stats() if render_worker is not None else None,
+        "websocket": manager.stats(),
+        "storage": store.stats() if store is not None else None,
+        "inference": inferer.timings() if inferer is not None else None,
+        "scheduler": scheduler.stats() if scheduler is not None else None,
+        "inference_dispatch": dispatcher.stats(),
+        "classify_cache": classify_cache.stats(),
+        "quality": {
+            "threshold": SQI_THRESHOLD,
+            "min_perfusion": SQI_MIN_PERFUSION,
+            **quality_counts,
+            "skipped_ratio": quality_counts["low_quality"] / checked if checked else None,
+        },
+        "stages": metrics.summary("stage_seconds"),
+    }
+    return stats
+
+def collect_component_metrics():
+    """Convierte las estadísticas de sesiones, WebSocket, video, scheduler y almacenamiento en gauges/counters."""
+    ws = manager.stats()
+    session_stats = sessions.stats()
+    yield "websocket_clients", "gauge", "Connected WebSocket clients.", [({}, ws["clients"])]
+    yield "websocket_broadcasts_total", "counter", "Live updates published.", [({}, ws["broadcasts"])]
+    yield "websocket_messages_sent_total", "counter", "WebSocket messages sent.", [({}, ws["sent"])]
+    yield "websocket_messages_dropped_total", "counter", "WebSocket messages dropped by the overflow policy.", [({}, ws["dropped"])]
+    yield "websocket_evicted_clients_total", "counter", "Slow WebSocket clients disconnected.", [({}, ws["evicted_slow_clients"])]
+    yield "websocket_queue_depth", "gauge", "Messages queued per WebSocket client.", [
+        ({"client": c["client"]}, c["queue_depth"]) for c in ws["per_client"]]
+    if render_worker is not None:
+        video = render_worker.stats()
+        yield "video_queue_depth", "gauge", "Frames waiting for the render worker.", [({}, video["queue_depth"])]
+        yield "video_frames_rendered_total", "counter", "Video frames rendered.", [({}, video["frames_rendered"])]
+        yield "video_frames_dropped_total", "counter", "Video frames dropped by the overflow policy.", [({}, video["frames_dropped"])]
+        yield "video_frames_coalesced_total", "counter", "Video frames replaced by a newer one.", [({}, video["frames_coalesced"])]
+        yield "video_render_errors_total", "counter", "Video frames that failed to render.", [({}, video["render_errors"])]
+    yield "subsystem_ready", "gauge", "1 when an enabled subsystem finished loading.", [
+        ({"subsystem": name}, state == "ready") for name, state in readiness.items() if state != "disabled"]
+    yield "sessions_active", "gauge", "Device sessions in memory.", [({}, session_stats["active_sessions"])]
+    yield "sessions_evicted_total", "counter", "Device sessions evicted.", [({}, session_stats["evicted_sessions"])]
+    yield "session_measurement_samples", "gauge", "Samples folded into the full-measurement envelopes.", [
+        ({}, session_stats["measurement_samples"])]
+    if session_stats["max_jitter_ms"] is not None:
+        yield "timestamp_max_jitter_ms", "gauge", "Largest deviation of a sample step from the grid period.", [
+            ({}, session_stats["max_jitter_ms"])]
+    if scheduler is not None:
+        sched = scheduler.stats()
+        yield "scheduler_queue_depth", "gauge", "Inference windows waiting for a batch.", [({}, sched["queue_depth"])]
+        yield "scheduler_batches_total", "counter", "Inference batches run.", [({}, sched["batches_run"])]
+        yield "scheduler_windows_total", "counter", "Inference windows run.", [({}, sched["windows_run"])]
+        yield "scheduler_rejected_windows_total", "counter", "Inference windows rejected (queue full).", [
+            ({}, sched["rejected_windows"])]
+    dispatch = dispatcher.stats()
+    yield "inference_jobs_running", "gauge", "Devices with a window being classified.", [({}, dispatch["running"])]
+    yield "inference_jobs_waiting", "gauge", "Devices with a window waiting for the running one.", [({}, dispatch["waiting"])]
+    yield "inference_windows_dispatched_total", "counter", "Windows handed to background inference.", [
+        ({}, dispatch["submitted"])]
+    yield "inference_windows_superseded_total", "counter", "Waiting windows replaced by a newer one of the same device.", [
+        ({}, dispatch["superseded"])]
+    yield "inference_jobs_failed_total", "counter", "Background inference jobs that failed.", [({}, dispatch["failed"])]
+    cache = classify_cache.stats()
+    yield "classify_cache_hits_total", "counter", "Channel windows served from the classify cache.", [({}, cache["hits"])]
+    yield "classify_cache_misses_total", "counter", "Channel windows not found in the classify cache.", [({}, cache["misses"])]
+    yield "classify_cache_entries", "gauge", "Entries in the classify cache.", [({}, cache["entries"])]
+    yield "inference_channels_total", "counter", "Channel windows classified or skipped for low signal quality.", [
+        ({"outcome": outcome}, count) for outcome, count in quality_counts.items()]
+    if store is not None:
+        storage = store.stats()
+        yield "storage_open_streams", "gauge", "Open segment files.", [({}, storage["open_streams"])]
+        yield "storage_rows_written_total", "counter", "Rows written to segments.", [({}, storage["rows_written"])]
+        yield "storage_bytes_written_total", "counter", "Bytes written to segments.", [({}, storage["bytes_written"])]
+
+metrics.add_collector(collect_component_metrics)
+
+# ---------------- Readiness endpoint ----------------
+@app.get("/ready")
+async def get_ready():
+    """
+    Disponibilidad para balanceadores/autoescalado: 503 mientras algún subsistema activo
+    (modelo, filtros, video) se está cargando; 200 después ("degraded" si alguno falló).
+    """
+    states = set(readiness.values())
+    if "loading" in states:
+        return JSONResponse({"status": "loading", "subsystems": readiness}, status_code=503)
+    return {"status": "degraded" if "failed" in states else "ready", "subsystems": readiness}
+
+# ---------------- Metrics endpoint ----------------
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas en formato de texto de Prometheus: latencia por etapa y dispositivo, colas, clientes y descartes."""
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+# ---------------- Profiler endpoint ----------------
+@app.get("/debug/profile")
+async def get_profile(seconds: float = 10.0, interval_ms: float = 5.0):
+    """
+    Captura un perfil por muestreo de todos los hilos durante `seconds` segundos.
+    Devuelve pilas plegadas ("a;b;c N" por línea) para flamegraph.pl o speedscope.
+    Solo disponible con PPG_PROFILER=1; una captura a la vez.
+    """
+    if not PROFILER_ENABLED:
+        return {"status": "error", "message": "Profiler disabled (set PPG_PROFILER=1)"}
+    if profiler.running:
+        return {"status": "error", "message": "A profile is already being captured"}
+    seconds = min(max(seconds, 0.1), PROFILER_MAX_SECONDS)
+    interval = min(max(interval_ms, 1.0), 1000.0) / 1000.0
+    try:
+        folded = await asyncio.to_thread(profiler.capture, seconds, interval)
+    except RuntimeError as e:
+        return {"status": "error", "message": str(e)}
+    return Response(folded, media_type="text/plain")
+
+# ---------------- History endpoint ----------------
+@app.get("/history/{device_id}")
+async def get_history(device_id: str, start: Optional[int] = None, end: Optional[int] = None,
+                      channels: Optional[str] = None, preprocess: str = "none",
+                      points: Optional[int] = None, method: str = "minmax", format: str = "ndjson"):
+    """
+    Datos almacenados de un dispositivo entre `start` y `end` (epoch ms, inclusive).
+
+    - `channels`: lista separada por comas (por defecto todos).
+    - `preprocess`: `none`, `bandpass` o `normalize` (bandpass + normalización robusta),
+      con filtros causales cuyo estado se mantiene entre bloques.
+    - `points`: presupuesto opcional de muestras por canal (ancho del gráfico en píxeles
+      x puntos por píxel), reducido con `minmax` (envolvente) o `lttb`.
+    - `format`: `ndjson` o `binary` se envían por bloques directamente desde los segmentos
+      (memoria constante, el primer byte llega enseguida); `json` devuelve un único documento.
+    """
+    if store is None:
+        return {"status": "error", "message": "History requires PPG_STORAGE=segments"}
+    if method not in DOWNSAMPLE_METHODS or (points is not None and points < 2):
+        return {"status": "error", "message": f"method must be one of {DOWNSAMPLE_METHODS} and points >= 2"}
+    if preprocess not in PREPROCESS_MODES or format not in STREAM_FORMATS:
+        return {"status": "error", "message": f"preprocess must be one of {PREPROCESS_MODES}, format one of {STREAM_FORMATS}"}
+
+    device_id = sanitize_device_id(device_id)
+    # Segmentos resueltos en el hilo del servidor; la lectura (mmap) y el procesado fuera del event loop
+    store.flush_device(device_id)
+    time_range = store.time_range(device_id, start, end)
+    paths = store.segments(device_id, *time_range) if time_range is not None else []
+    first, last = time_range if time_range is not None else (start or 0, end or 0)
+    selected = [c.strip().upper() for c in channels.split(',')] if channels else None
+    header = {"device": device_id, "start": first, "end": last, "preprocess": preprocess,
+              "points": points, "method": method}
+
+    if format == "json":
+        def load():
+            # lttb sobre el rango completo (el documento se construye en memoria de todos modos)
+            budget = points if method == "minmax" else None
+            columns, timestamps, values = collect(iter_history(read_segments(paths, first, last, selected),
+                                                               first, last, preprocess, budget, method, VIDEO_FS))
+            if points is not None and method == "lttb":
+                timestamps, values = lttb(timestamps, values, points)
+            return columns, timestamps, values
+        columns, timestamps, values = await asyncio.to_thread(load)
+        header["raw"] = {"index": timestamps.tolist(), "columns": columns, "data": values.T.tolist()}
+        return header
+
+    # Generadores síncronos: StreamingResponse los itera en el threadpool
+    chunks = iter_history(read_segments(paths, first, last, selected), first, last, preprocess, points, method, VIDEO_FS)
+    body = ndjson_stream(header, chunks) if format == "ndjson" else binary_stream(device_id, chunks)
+    return StreamingResponse(body, media_type=MEDIA_TYPES[format])
 
 # ---------------- Helper: save full-measurement image ----------------
-def save_full_measurement_image(values: List[float], timestamps: List[float], out_dir: Path, filename_prefix: str = "measurement_full"):
+def render_measurement_image(measurement: MeasurementLog) -> Optional[bytes]:
     """
-    Guarda una imagen PNG de la medición completa (solo señal procesada, normalizada).
-    - values: lista de floats (raw)
-    - timestamps: lista de epoch seconds floats (mismo largo)
-    - out_dir: carpeta donde guardar la imagen (se crea si no existe)
+    PNG de la medición completa (señal filtrada y normalizada) a partir de la envolvente
+    min/max de la sesión: el coste depende del número de buckets, no de la duración.
+    Usa Figure sin pyplot, así puede ejecutarse en un hilo a mitad de sesión.
     """
-    if not values or not timestamps or len(values) != len(timestamps):
-        print("No hay datos completos para guardar la imagen.")
+    centres, lo, hi = measurement.envelope_view()
+    if centres.shape[0] == 0:
         return None
 
-    os.makedirs(out_dir, exist_ok=True)
-    # Convertir a numpy
-    raw = np.array(values, dtype=np.float32)
-    ts = np.array(timestamps, dtype=np.float64)
-    # Preprocesado sobre toda la serie: bandpass + robust normalize
-    try:
-        proc = bandpass_filter(raw, 0.5, 8.0, VIDEO_FS)
-    except TypeError:
-        proc = bandpass_filter(raw, 0.5, 8.0)
-    try:
-        proc = robust_normalize(proc)
-    except Exception:
-        # fallback: zscore-like
-        proc = (proc - np.mean(proc)) / (np.std(proc) + 1e-8)
+    # Normalización robusta (mediana / MAD) estimada sobre la envolvente
+    mid = (lo + hi) * 0.5
+    med = float(np.median(mid))
+    mad = float(np.median(np.abs(np.concatenate([lo, hi]) - med))) + 1e-8
+    lo = (lo - med) / mad
+    hi = (hi - med) / mad
 
-    # eje X: segundos relativos desde primer timestamp
-    t0 = float(ts[0])
-    x = ts - t0
+    # eje X: segundos relativos desde el primer bucket
+    x = centres - float(centres[0])
 
     # Crear figura de tamaño amplio para toda la señal
-    fig_w = 14
-    fig_h = 4
-    fig = plt.figure(figsize=(fig_w, fig_h), dpi=100)
+    from matplotlib.figure import Figure  # sin pyplot: no cambia el backend ni importa GUI
+    fig = Figure(figsize=(14, 4), dpi=100)
     ax = fig.add_subplot(111)
 
-    # Estética: sin título ni etiquetas, pero con ejes y ticks visibles como pediste
+    # Estética: sin título ni etiquetas, pero con ejes y ticks visibles
     ax.set_facecolor('white')
-    ax.plot(x, proc, color='#2a9d5b', linewidth=1.0)
+    # Envolvente por píxel: banda min/max con su línea media
+    ax.fill_between(x, lo, hi, color='#2a9d5b', linewidth=0.0, alpha=0.6)
+    ax.plot(x, (lo + hi) * 0.5, color='#2a9d5b', linewidth=1.0)
 
     # Mostrar ejes (left & bottom) y ticks
     for spine_name, spine in ax.spines.items():
@@ -217,180 +632,329 @@ def save_full_measurement_image(values: List[float], timestamps: List[float], ou
 
     ax.tick_params(axis='both', which='both', labelsize=9, colors='#111111')
 
-    # Ajustar límites Y simétricos opcionalmente: usaremos min/max del proc y un padding
-    ymin = float(np.min(proc))
-    ymax = float(np.max(proc))
+    # Límites Y: min/max de la envolvente con un padding
+    ymin = float(np.min(lo))
+    ymax = float(np.max(hi))
     if ymax == ymin:
         ymax += 1.0
         ymin -= 1.0
     pad = (ymax - ymin) * 0.12
     ax.set_ylim(ymin - pad, ymax + pad)
 
-    # X limits: desde 0 hasta último segundo
-    ax.set_xlim(0.0, float(x[-1]))
+    # X limits: desde 0 hasta el último bucket
+    ax.set_xlim(0.0, max(float(x[-1]), 1e-3))
 
     # Evitar labels grandes: no title, no xlabel/ylabel
     fig.tight_layout(pad=0.6)
 
-    # Guardar
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=150, facecolor='white')
+    return buffer.getvalue()
+
+def save_full_measurement_image(measurement: MeasurementLog, out_dir: Path, filename_prefix: str = "measurement_full"):
+    """
+    Guarda una imagen PNG de la medición completa (ver render_measurement_image).
+    - measurement: acumulador de la sesión
+    - out_dir: carpeta donde guardar la imagen (se crea si no existe)
+    """
+    png = render_measurement_image(measurement)
+    if png is None:
+        print("No hay datos completos para guardar la imagen.")
+        return None
+
+    os.makedirs(out_dir, exist_ok=True)
     ts_str = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
     out_path = out_dir / f"{filename_prefix}_{ts_str}.png"
     try:
-        fig.savefig(str(out_path), dpi=150, facecolor='white')
+        out_path.write_bytes(png)
         print("Saved full-measurement image to:", str(out_path))
     except Exception as e:
         print("Error saving full measurement image:", e)
         out_path = None
-    finally:
-        plt.close(fig)
 
     return out_path
 
+@app.get("/session/{device_id}/image")
+async def get_session_image(device_id: str):
+    """Imagen PNG de la medición en curso de un dispositivo (sin esperar al cierre de la sesión)."""
+    if not SESSION_IMAGE_ENABLED:
+        return {"status": "error", "message": "Session images are disabled (PPG_SESSION_IMAGE=0)"}
+    session = sessions.find(device_id)
+    if session is None or not len(session.measurement):
+        return {"status": "error", "message": f"No active measurement for device '{sanitize_device_id(device_id)}'"}
+    png = await asyncio.to_thread(render_measurement_image, session.measurement)
+    return Response(png, media_type="image/png")
+
 # ---------------- HTTP POST endpoint ----------------
 @app.post("/")
 async def receive_data(request: Request, data: dict):
     """
-    Endpoint principal. Convierte JSON -> DataFrame, guarda CSV, hace broadcast,
+    Endpoint principal. Convierte JSON -> arrays, guarda, hace broadcast,
     y actualiza el video del canal GREEN (visualización de 6s con contadores de segundos).
-    Además acumula toda la medición en full_green_values/timestamps.
+    Cada dispositivo (DEVICE_ID en el payload o cabecera X-Device-Id) tiene su propia
+    sesión: ventana de inferencia, buffers GREEN, recorder y acumuladores de la medición completa.
     """
+    started = time.perf_counter()
     try:
-        df = ppg_dict_to_dataframe(data)
+        batch = ppg_dict_to_arrays(data)
     except Exception as e:
         print(f"Error while parsing JSON: {e}")
+        metrics.inc("parse_errors_total", help="Payloads that could not be decoded.", format="json")
         return {"status": "error", "message": f"Error while parsing JSON: {e}"}
 
-    print(f"Received data with {len(df)} samples.")
+    return await ingest(request, batch, started)
+
+@app.post("/binary")
+async def receive_binary(request: Request):
+    """
+    Ingesta binaria: mismo procesamiento que POST /, pero el cuerpo es el formato
+    empaquetado de data.py (cabecera + arrays int little-endian, absolutos o delta),
+    decodificado con numpy.frombuffer sin pasar por dicts/listas de Python.
+    """
+    started = time.perf_counter()
+    try:
+        batch = decode_ppg_binary(await request.body())
+    except Exception as e:
+        print(f"Error while parsing binary body: {e}")
+        metrics.inc("parse_errors_total", help="Payloads that could not be decoded.", format="binary")
+        return {"status": "error", "message": f"Error while parsing binary body: {e}"}
+
+    return await ingest(request, batch, started)
 
-    # respuesta / broadcast (igual que antes)
-    response_payload = {"raw": df.to_dict(orient="split")}
+async def ingest(request: Request, batch, started: Optional[float] = None):
+    """
+    Procesa un lote ya decodificado (timestamps (N,), columnas y valores (C, N)).
+    `started` (time.perf_counter() antes de decodificar) permite medir la etapa de parseo;
+    cada etapa se registra en el histograma ppg_stage_seconds{stage, device}.
+    """
+    timestamps, columns, values = batch.timestamps, batch.columns, batch.values
+    device_id = sanitize_device_id(get_device_id(request, batch.device_id))
+    timer = metrics.timer(device_id, started)
+    if started is not None:
+        timer.mark("parse")
+    # Índice -> epoch ms (int64) de todo el lote en una operación; las muestras sin timestamp válido se descartan
+    timestamps, valid = to_epoch_ms(timestamps)
+    if not valid.all():
+        values = values[:, valid]
+    session = sessions.get(device_id)
+    timer.mark("session")
+    # Reintentos y reenvíos idénticos: ni se almacenan, ni se difunden, ni se renderizan otra vez
+    if session.is_duplicate_batch(timestamps):
+        print(f"[{session.device_id}] Duplicate batch ignored ({len(timestamps)} samples).")
+        metrics.inc("duplicate_batches_total", help="Batches ignored because they were already received.",
+                    device=device_id)
+        timer.total()
+        return {"status": "ok", "received": True, "duplicate": True}
+    metrics.inc("samples_received_total", len(timestamps), "Samples ingested.", device=device_id)
+    print(f"[{session.device_id}] Received data with {len(timestamps)} samples.")
+
+    # Rejilla exacta de 25 Hz para inferencia y GREEN: interpolación acotada, un tramo nuevo tras cada hueco.
+    # Almacenamiento y broadcast conservan las muestras recibidas.
+    runs = []
+    try:
+        resampler = session.resampler
+        if resampler is None:
+            runs = [Run(timestamps, values, False)] if len(timestamps) else []
+        else:
+            gaps, dropped = resampler.gaps, resampler.dropped
+            runs = resampler.process(timestamps, values)
+            if resampler.gaps > gaps:
+                metrics.inc("timestamp_gaps_total", resampler.gaps - gaps,
+                            "Gaps longer than PPG_RESAMPLE_MAX_GAP_MS (grid restarted).", device=device_id)
+            if resampler.dropped > dropped:
+                metrics.inc("timestamp_dropped_samples_total", resampler.dropped - dropped,
+                            "Samples dropped for repeated or backwards timestamps.", device=device_id)
+    except Exception as e:
+        print(f"Error while resampling: {e}")
+    timer.mark("resample")
 
-    # Inferencia opcional
+    # Inferencia opcional: la ventana se copia y se clasifica en segundo plano (ver classify_window);
+    # el POST no espera al modelo y los resultados se difunden cuando están listos
     if inferer is not None:
         try:
-            results = inferer.classify(df)
-            if results is not None:
-                serializable_results = {}
-                for channel in results:
-                    serializable_results[channel] = {
-                        "signal": results[channel]["preprocessed_signal"].tolist(),
-                        "label": results[channel]["label"],
-                        "confidence": float(results[channel]["confidence"])
-                    }
-                response_payload["inference"] = serializable_results
+            window = None
+            for run in runs:
+                if run.restart:
+                    # ninguna ventana abarca un hueco
+                    session.restart_inference_window()
+                window = session.add_inference_data(run.timestamps, columns, run.values) or window
+            if window is not None:
+                window_ts, original = window
+                # copias: el ring buffer cambia con el siguiente POST
+                dispatcher.submit(session.device_id, (session, np.array(window_ts), np.array(original),
+                                                      list(session.columns), time.perf_counter()))
         except Exception as e:
-            print(f"Error in inferer.classify: {e}")
+            print(f"Error while dispatching inference: {e}")
+        timer.mark("inference")
 
-    # Broadcast
+    # Broadcast: cada formato/suscripción se serializa una vez y se encola por cliente (sin esperar envíos)
     try:
-        await manager.broadcast(json.dumps(response_payload))
-    except Exception:
-        pass
+        manager.publish(LiveUpdate(session.device_id, timestamps, columns, values))
+    except Exception as e:
+        print(f"Error while broadcasting: {e}")
+    timer.mark("broadcast")
 
-    # Guardar CSV
+    # Guardar (segmentos binarios o CSV)
     try:
-        filepath = store_ppg_dataframe_to_csv(str(DATA_DIR), df)
-        print(f"Saved received PPG data to CSV: {filepath}")
+        if store is not None:
+            store.append(session.device_id, timestamps, columns, values)
+        else:
+            import pandas as pd
+            df = pd.DataFrame(values.T, index=timestamps, columns=columns)
+            filepath = store_ppg_dataframe_to_csv(str(DATA_DIR), df)
+            print(f"Saved received PPG data to CSV: {filepath}")
     except Exception as e:
-        print(f"Error saving PPG data to CSV: {e}")
+        print(f"Error saving PPG data: {e}")
+    timer.mark("storage")
 
     # ---------- Procesamiento del canal GREEN ----------
+    # Todo por lotes (sin bucle por muestra): una ventana por frame con sliding_windows
     try:
-        if "GREEN" in df.columns:
-            vals = df["GREEN"].astype(float).to_numpy()
-            idxs = df.index.to_numpy()
-
-            for i in range(len(vals)):
-                sample = float(vals[i])
-                idx = idxs[i]
-                ts_sec = parse_index_to_seconds(idx)
-
-                # Append real sample + timestamp to rolling buffers (window)
-                green_values.append(sample)
-                green_timestamps.append(ts_sec)
-
-                # También acumular toda la medición completa
-                full_green_values.append(sample)
-                full_green_timestamps.append(ts_sec)
+        if "GREEN" in columns and (session.measurement is not None or VIDEO_ENABLED):
+            green_row = columns.index("GREEN")
+            recorder = session.recorder
+            for run in runs:
+                vals = run.values[green_row].astype(np.float64)
+                ts_secs = run.timestamps / 1000.0
+
+                # Acumular toda la medición completa (muestras + envolvente de la imagen) por lotes
+                if session.measurement is not None:
+                    session.measurement.append(ts_secs, vals)
+
+                # Video GREEN (solo con PPG_VIDEO activo)
+                if recorder is None:
+                    continue
+                if session.green_preprocessor is not None:
+                    # Modo streaming: el lote se filtra de una vez manteniendo el estado del filtro;
+                    # las ventanas son de la señal ya procesada, sin re-filtrar
+                    proc_batch = session.green_preprocessor.process(vals)
+                    session.green.append(ts_secs, vals)
+                    procs, padded_ts = sliding_windows(session.green_processed, ts_secs, proc_batch, VIDEO_WINDOW, VIDEO_FS)
+                else:
+                    # Ventanas crudas EXACTAS de tamaño VIDEO_WINDOW y preprocesado de todas a la vez:
+                    # bandpass + robust_normalize a lo largo de cada ventana (misma lógica que infer.py)
+                    raw, padded_ts = sliding_windows(session.green, ts_secs, vals, VIDEO_WINDOW, VIDEO_FS)
+                    procs = robust_normalize(bandpass_filter(raw, 0.5, 8.0, VIDEO_FS), axis=-1)
 
                 # fijar start_time del recorder en el primer sample real (si no está)
                 if recorder.start_time is None:
-                    try:
-                        recorder.start_time = float(green_timestamps[0])
-                    except Exception:
-                        recorder.start_time = float(ts_sec)
-
-                # construir ventana EXACTA de tamaño VIDEO_WINDOW (pad por la izquierda si hace falta)
-                n = len(green_values)
-                if n < VIDEO_WINDOW:
-                    pad_len = VIDEO_WINDOW - n
-                    if n > 0:
-                        first_val = green_values[0]
-                        padded_vals = np.concatenate((np.full(pad_len, first_val, dtype=np.float32),
-                                                      np.array(green_values, dtype=np.float32)))
-                        first_ts = green_timestamps[0]
-                        # timestamps: retroceder pad_len*dt para el padding
-                        padded_ts = np.array(
-                            [first_ts - (pad_len - j) * (1.0 / VIDEO_FS) for j in range(pad_len)]
-                            + list(green_timestamps),
-                            dtype=np.float64
-                        )
-                    else:
-                        padded_vals = np.zeros(VIDEO_WINDOW, dtype=np.float32)
-                        padded_ts = np.array(
-                            [time.time() - (VIDEO_WINDOW - 1 - j) * (1.0 / VIDEO_FS) for j in range(VIDEO_WINDOW)],
-                            dtype=np.float64
-                        )
-                else:
-                    padded_vals = np.array(green_values, dtype=np.float32)
-                    padded_ts = np.array(green_timestamps, dtype=np.float64)
-
-                # Preprocesado: bandpass + robust_normalize (misma lógica que infer.py)
-                try:
-                    proc = bandpass_filter(padded_vals, 0.5, 8.0, VIDEO_FS)
-                except TypeError:
-                    # fallback si la firma de bandpass_filter es distinta
-                    proc = bandpass_filter(padded_vals, 0.5, 8.0)
-
-                proc = robust_normalize(proc)
+                    recorder.start_time = float(session.green.first_timestamp())
 
-                # Llamar al recorder con timestamps y ventana de visualización
-                try:
-                    recorder.write_frame_from_arrays_with_timestamps(
-                        proc, padded_ts, display_window_seconds=DISPLAY_WINDOW_SECONDS
-                    )
-                except Exception as e:
-                    print(f"Error writing GREEN frame: {e}")
-
-        else:
-            # no GREEN en este post: nada que hacer
-            pass
+                # Encolar los frames: el render y la codificación ocurren en el hilo del worker
+                await recorder.write_frames(list(zip(procs, padded_ts)), display_window_seconds=DISPLAY_WINDOW_SECONDS)
     except Exception as e:
         print(f"Error while recording GREEN channel to video: {e}")
+    timer.mark("video")
+    timer.total()
 
     return {"status": "ok", "received": True}
 
+# ---------------- Inferencia en segundo plano ----------------
+def assess_window(window_ts: np.ndarray, original: np.ndarray):
+    """SQI por canal (ventana cruda) y ventana preprocesada; se ejecuta en un hilo."""
+    quality = signal_quality(original, SAMPLING_RATE, min_perfusion=SQI_MIN_PERFUSION)
+    return quality["sqi"], preprocess_signals(window_ts, original)
+
+async def classify_window(job):
+    """
+    Clasifica una ventana fuera del POST: SQI y preprocesado en un hilo, modelo en el scheduler
+    (solo los canales con calidad suficiente), y difusión de los resultados como una
+    actualización sin muestras crudas.
+    """
+    session, window_ts, original, window_columns, dispatched = job
+    # Canales ya vistos con el mismo contenido y modelo: sin SQI, preprocesado ni modelo
+    keys = [window_key(row, inferer.version) for row in original]
+    entries = [classify_cache.get(key) for key in keys]
+    missing = [i for i, entry in enumerate(entries) if entry is None]
+    if missing:
+        sqi, processed = await asyncio.to_thread(assess_window, window_ts, original[missing])
+        good = sqi >= SQI_THRESHOLD
+        predictions = np.empty((0, 2), dtype=np.float32)
+        if good.any():
+            try:
+                # La ventana se agrupa con las de otros dispositivos en una sola llamada
+                predictions = await scheduler.submit(processed[good])
+            except SchedulerFull as e:
+                print(f"Inference skipped: {e}")
+                metrics.inc("inference_skipped_total", help="Windows skipped because the scheduler queue was full.")
+                return
+        rows = np.cumsum(good) - 1
+        for j, i in enumerate(missing):
+            entries[i] = (float(sqi[j]), processed[j], predictions[rows[j]] if good[j] else None)
+            classify_cache.put(keys[i], entries[i])
+        quality_counts["classified"] += int(good.sum())
+        quality_counts["low_quality"] += len(missing) - int(good.sum())
+
+    sqi = np.array([entry[0] for entry in entries], dtype=np.float32)
+    processed = np.stack([entry[1] for entry in entries])
+    classified = np.array([entry[2] is not None for entry in entries])
+    predictions = np.stack([entry[2] for entry in entries if entry[2] is not None]) if classified.any() \
+        else np.empty((0, 2), dtype=np.float32)
+    results = build_results(window_columns, original, processed, predictions, classified)
+    inference = {
+        channel: {
+            "signal": results[channel]["preprocessed_signal"],
+            "label": results[channel]["label"],
+            "confidence": float(results[channel]["confidence"]),
+            "sqi": float(sqi[i]),
+        }
+        for i, channel in enumerate(results)
+    }
+    new_window_samples = session.take_new_window_samples(window_ts)
+    empty_ts = np.empty(0, dtype=window_ts.dtype)
+    empty_values = np.empty((len(window_columns), 0), dtype=original.dtype)
+    manager.publish(LiveUpdate(session.device_id, empty_ts, window_columns, empty_values, inference, new_window_samples))
+    metrics.observe("inference_latency_seconds", time.perf_counter() - dispatched,
+                    "Time from dispatching a window to broadcasting its results.")
+
+# Una ventana en curso y como mucho una en espera por dispositivo: las más nuevas sustituyen a las pendientes
+dispatcher = LatestJobDispatcher(classify_window)
+
+# ---------------- Startup event ----------------
+async def maintenance_loop():
+    """Expulsa periódicamente las sesiones inactivas (TTL) y vuelca los buffers de almacenamiento antiguos."""
+    interval = max(1.0, SESSION_TTL_SECONDS / 4.0)
+    if store is not None:
+        interval = min(interval, max(1.0, store.flush_seconds))
+    while True:
+        await asyncio.sleep(interval)
+        sessions.evict_idle()
+        classify_cache.evict_expired()
+        if store is not None:
+            store.flush_idle()
+
+@app.on_event("startup")
+async def startup_event():
+    app.state.maintenance_task = asyncio.create_task(maintenance_loop())
+    app.state.loop_lag_task = asyncio.create_task(monitor_event_loop(metrics, LOOP_LAG_INTERVAL))
+    # Carga en segundo plano: el servidor acepta peticiones mientras tanto (ver /ready)
+    app.state.preload_task = asyncio.create_task(asyncio.to_thread(preload_subsystems))
+    app.state.model_task = asyncio.create_task(load_model()) if model_path is not None else None
+
 # ---------------- Shutdown event ----------------
 @app.on_event("shutdown")
-def shutdown_event():
-    print("Shutting down - closing GREEN video recorder...")
-    try:
-        recorder.close()
-        print("GREEN recorder closed. Video saved at:", recorder.get_video_path())
-    except Exception as e:
-        print("Error closing recorder:", e)
-
-    # Guardar imagen de la medición completa (si hay datos)
-    try:
-        images_dir = DATA_DIR / "images"
-        images_dir.mkdir(parents=True, exist_ok=True)
-        saved = save_full_measurement_image(full_green_values, full_green_timestamps, images_dir, filename_prefix="measurement_full")
-        if saved is not None:
-            print("Full measurement image saved at:", saved)
-        else:
-            print("No full measurement image saved (no data).")
-    except Exception as e:
-        print("Error while saving full measurement image:", e)
+async def shutdown_event():
+    app.state.maintenance_task.cancel()
+    app.state.loop_lag_task.cancel()
+    if app.state.model_task is not None:
+        app.state.model_task.cancel()
+    # el hilo de precarga puede estar creando el worker de video: esperar antes de pararlo
+    await asyncio.gather(app.state.preload_task, return_exceptions=True)
+    await dispatcher.stop()
+    await manager.close_all()
+    if scheduler is not None:
+        await scheduler.stop()
+
+    # Cerrar todas las sesiones: recorders GREEN + imagen de la medición completa
+    print(f"Shutting down - closing {len(sessions)} session(s)...")
+    sessions.close_all()
+    # Esperar a las imágenes de medición en curso (también las de expulsiones anteriores)
+    await asyncio.gather(*finalize_tasks, return_exceptions=True)
+    if store is not None:
+        store.close()
+    # Esperar a que el worker renderice los frames pendientes y cierre los videos
+    if render_worker is not None:
+        render_worker.stop()
 
 # ---------------- Main runner for dev (optional) ----------------
 if __name__ == "__main__":
@@ -0,0 +1,40 @@
+import numpy
+
+from downsample import EnvelopeAccumulator
+
+
+class MeasurementLog:
+    """Whole-session accumulation of one channel as an ``EnvelopeAccumulator`` of the
+    (optionally preprocessed) signal.
+
+    The envelope is updated on every append and has a fixed number of buckets, so
+    memory does not grow with the session and the session image can be drawn at any
+    time in time proportional to the envelope size, not the session length. Raw
+    samples are not kept here; the segment store archives them.
+    """
+
+    def __init__(self, buckets: int = 2048, sample_period: float = 0.04, preprocessor=None):
+        """
+        Args:
+            buckets: Envelope resolution (about one bucket per image pixel).
+            sample_period: Initial envelope bucket width in seconds.
+            preprocessor: Optional stateful preprocessor (``StreamingPreprocessor``)
+                applied before the envelope.
+        """
+        self.envelope = EnvelopeAccumulator(buckets, sample_period)
+        self.preprocessor = preprocessor
+
+    def __len__(self) -> int:
+        return self.envelope.rows
+
+    def append(self, timestamps: numpy.ndarray, values: numpy.ndarray) -> None:
+        """Appends a batch of epoch-second timestamps (N,) and raw values (N,)."""
+        timestamps = numpy.asarray(timestamps, dtype=numpy.float64)
+        values = numpy.asarray(values, dtype=numpy.float32)
+        signal = values if self.preprocessor is None else self.preprocessor.process(values)
+        self.envelope.add(timestamps, signal)
+
+    def envelope_view(self) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        """``(bucket centres in epoch seconds, lo, hi)`` of the signal so far."""
+        centres, lo, hi = self.envelope.result()
+        return centres, lo[0], hi[0]
@@ -0,0 +1,248 @@
+import asyncio
+import bisect
+import math
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+# Latency buckets in seconds, from 0.1 ms to 10 s.
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = tuple[tuple[str, str], ...]
+# (name, type, help, [(labels, value)]) as returned by collectors
+Sample = tuple[str, str, str, list[tuple[dict, float]]]
+
+
+class Histogram:
+    """Fixed-bucket histogram: one counter per upper bound plus sum and count."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding quantile ``q`` (None when empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+
+class Metrics:
+    """In-process metrics exported in the Prometheus text format.
+
+    Histograms, counters and gauges are kept per label set. Observations are
+    plain Python operations on the event loop thread (no locks, no I/O); values
+    owned by other components (queue depths, clients...) are read at scrape time
+    through collectors instead of being copied on every change.
+    """
+
+    def __init__(self, namespace: str = "ppg", buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._help: dict[str, tuple[str, str]] = {}
+        self._histograms: dict[str, dict[Labels, Histogram]] = {}
+        self._counters: dict[str, dict[Labels, float]] = {}
+        self._gauges: dict[str, dict[Labels, float]] = {}
+        self._collectors: list[Callable[[], Iterable[Sample]]] = []
+
+    def _name(self, name: str, kind: str, help: str) -> str:
+        full = f"{self.namespace}_{name}"
+        self._help.setdefault(full, (kind, help))
+        return full
+
+    def observe(self, name: str, value: float, help: str = "", **labels) -> None:
+        family = self._histograms.setdefault(self._name(name, "histogram", help), {})
+        key = _labels(labels)
+        histogram = family.get(key)
+        if histogram is None:
+            histogram = family[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels) -> None:
+        family = self._counters.setdefault(self._name(name, "counter", help), {})
+        key = _labels(labels)
+        family[key] = family.get(key, 0) + value
+
+    def set(self, name: str, value: float, help: str = "", **labels) -> None:
+        self._gauges.setdefault(self._name(name, "gauge", help), {})[_labels(labels)] = value
+
+    def timer(self, device: str = "", start: Optional[float] = None) -> "StageTimer":
+        """Timer for consecutive stages of one request, without nesting ``with`` blocks.
+
+        ``start`` is a ``time.perf_counter()`` value taken before the first stage.
+        """
+        return StageTimer(self, device, start)
+
+    def forget(self, **labels) -> None:
+        """Drops every series carrying these labels (e.g. an evicted device)."""
+        wanted = set(_labels(labels))
+        for families in (self._histograms, self._counters, self._gauges):
+            for family in families.values():
+                for key in [k for k in family if wanted <= set(k)]:
+                    del family[key]
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        """Registers a callable returning ``(name, type, help, [(labels, value)])`` at scrape time."""
+        self._collectors.append(collector)
+
+    def summary(self, name: str) -> dict[str, dict[str, float | int | None]]:
+        """p50/p99 (bucket upper bounds) and count per label set of a histogram, for JSON stats."""
+        family = self._histograms.get(f"{self.namespace}_{name}", {})
+        return {
+            ",".join(f"{k}={v}" for k, v in key): {"count": h.count, "p50": h.quantile(0.5), "p99": h.quantile(0.99)}
+            for key, h in family.items()
+        }
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        lines: list[str] = []
+
+        def header(name: str, kind: str, help: str):
+            if help:
+                lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name, family in self._histograms.items():
+            header(name, "histogram", self._help[name][1])
+            for key, h in family.items():
+                cumulative = 0
+                for bound, count in zip(h.bounds + (math.inf,), h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f"{name}_bucket{_format(key + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format(key)} {h.sum!r}")
+                lines.append(f"{name}_count{_format(key)} {h.count}")
+        for families, kind in ((self._counters, "counter"), (self._gauges, "gauge")):
+            for name, family in families.items():
+                header(name, kind, self._help[name][1])
+                for key, value in family.items():
+                    lines.append(f"{name}{_format(key)} {_number(value)}")
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                print(f"Error in metrics collector: {e}")
+                continue
+            for name, kind, help, values in samples:
+                full = f"{self.namespace}_{name}"
+                header(full, kind, help)
+                for labels, value in values:
+                    if value is not None:
+                        lines.append(f"{full}{_format(_labels(labels))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Records the time since the previous mark as the duration of the stage just finished."""
+
+    def __init__(self, metrics: Metrics, device: str = "", start: Optional[float] = None):
+        self.metrics = metrics
+        self.device = device
+        self.start = self.last = time.perf_counter() if start is None else start
+
+    def mark(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.last = now
+        self.metrics.observe("stage_seconds", elapsed, "Time spent per ingest stage.",
+                             stage=stage, device=self.device)
+        return elapsed
+
+    def total(self, stage: str = "total") -> float:
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe("stage_seconds", elapsed, "Time spent per ingest stage.",
+                             stage=stage, device=self.device)
+        return elapsed
+
+
+async def monitor_event_loop(metrics: Metrics, interval: float = 0.5) -> None:
+    """Measures how late the event loop wakes up from a sleep of ``interval`` seconds.
+
+    Blocking work on the loop (CPU-bound handlers, synchronous I/O) shows up as lag.
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        metrics.set("event_loop_lag_seconds", lag, "Delay of the last event loop wake-up.")
+        metrics.observe("event_loop_lag_seconds_hist", lag, "Event loop wake-up delays.")
+
+
+class SamplingProfiler:
+    """Statistical profiler of every Python thread of the process.
+
+    Samples ``sys._current_frames()`` every ``interval`` seconds from a background
+    thread and counts identical stacks. The result is in the folded format
+    (``root;caller;callee count`` per line) read by flamegraph.pl, speedscope and
+    similar tools. Only one capture runs at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def capture(self, seconds: float, interval: float = 0.005) -> str:
+        """Blocks for ``seconds`` while sampling and returns the folded stacks."""
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already being captured")
+        try:
+            stacks: Counter[str] = Counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            me = threading.get_ident()
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f"thread-{ident}"))
+                    stacks[";".join(reversed(stack))] += 1
+                time.sleep(interval)
+            return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        finally:
+            self._lock.release()
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
@@ -0,0 +1,177 @@
+import json
+import struct
+from typing import Optional, Union
+import numpy
+
+from downsample import budget_for, downsample
+
+# Binary WebSocket frame (all little-endian, sections padded to 8 bytes so the
+# browser can read them as typed-array views without copying):
+#   header      <4sBBBBIHH: magic b"PPGW", version, flags, channel count C,
+#               device id length, row count N, inference result count R, window length
+#   names       device id bytes, then C x (u8 length + utf-8 channel name), padding
+#   timestamps  N x float64 (ms)
+#   values      C x N x int32 (float32 with FLAG_FLOAT_VALUES), channel-major, padding
+#   results     R x (result header <BBHHHff: channel index, label length, shift,
+#               sample count, SQI x 10000 (0xFFFF: not computed), confidence, scale;
+#               label bytes; padding to 4; samples as
+#               float32, or int16 multiplied by scale with FLAG_INT16; padding to 8)
+# Unless FLAG_FULL_WINDOW is set, results carry only the end of each processed
+# window: clients shift their copy left by ``shift`` (the new samples) and overwrite
+# its last ``sample count`` samples. The count includes TAIL_OVERLAP older samples,
+# which refreshes the end of the window where zero-phase filtering changes the
+# previous values most. Older samples keep the values of the window they were
+# sent with, so tails approximate the server window (each window is normalized on
+# its own); clients needing exact windows subscribe with window "full".
+FRAME_MAGIC = b"PPGW"
+FRAME_VERSION = 1
+FLAG_INFERENCE = 0x01
+FLAG_INT16 = 0x02
+FLAG_FULL_WINDOW = 0x04
+FLAG_FLOAT_VALUES = 0x08
+FRAME_HEADER = struct.Struct("<4sBBBBIHH")
+RESULT_HEADER = struct.Struct("<BBHHHff")
+SQI_SCALE = 10000
+SQI_MISSING = 0xFFFF
+TAIL_OVERLAP = 50
+
+FORMATS = ("json", "binary")
+PROCESSED_DTYPES = ("float32", "int16")
+WINDOW_MODES = ("tail", "full")
+
+
+def _padding(size: int, alignment: int = 8) -> bytes:
+    return b"\0" * (-size % alignment)
+
+
+class LiveUpdate:
+    """One broadcast of a device: the raw batch plus optional inference results.
+
+    Messages are encoded lazily and cached per distinct client subscription, so a
+    broadcast is serialized at most once per (format, channels, options) in use.
+    """
+
+    def __init__(self,
+                 device_id: str,
+                 timestamps: numpy.ndarray,
+                 columns: list[str],
+                 values: numpy.ndarray,
+                 inference: Optional[dict[str, dict]] = None,
+                 new_samples: int = 0):
+        """
+        Args:
+            device_id: Device the batch belongs to.
+            timestamps: Batch timestamps in ms, shape (N,).
+            columns: Channel names, one per row of ``values``.
+            values: Raw samples of shape (C, N).
+            inference: Per channel ``{"signal", "label", "confidence"}`` and optionally
+                ``"sqi"`` (signal-quality index), where ``signal`` is the processed
+                window, or None when no classification ran.
+            new_samples: Samples of the processed windows that are new since the
+                previous inference broadcast of this device.
+        """
+        self.device_id = device_id
+        self.timestamps = timestamps
+        self.columns = list(columns)
+        self.values = values
+        self.inference = inference
+        self.new_samples = int(new_samples)
+        self._cache: dict[tuple, Optional[Union[str, bytes]]] = {}
+
+    def encode(self, fmt: str = "json", channels: Optional[frozenset] = None, processed: str = "float32",
+               full_window: bool = True, points_per_second: Optional[float] = None,
+               method: str = "minmax") -> Optional[Union[str, bytes]]:
+        """The message for a client subscription, or None if it selects no data.
+
+        With ``points_per_second`` the raw batch is downsampled (``method``) to that
+        budget; processed windows are always sent at full rate.
+        """
+        n_out = None if points_per_second is None else budget_for(self.timestamps, points_per_second)
+        key = (fmt, channels, n_out, method) if fmt == "json" else (fmt, channels, processed, full_window, n_out, method)
+        if key not in self._cache:
+            timestamps, values = self._raw(n_out, method)
+            if fmt == "json":
+                self._cache[key] = self._encode_json(timestamps, values, channels)
+            else:
+                self._cache[key] = self._encode_binary(timestamps, values, channels, processed, full_window)
+        return self._cache[key]
+
+    def _raw(self, n_out: Optional[int], method: str) -> tuple[numpy.ndarray, numpy.ndarray]:
+        if n_out is None:
+            return self.timestamps, self.values
+        key = ("raw", n_out, method)
+        if key not in self._cache:
+            self._cache[key] = downsample(self.timestamps, self.values, n_out, method)
+        return self._cache[key]
+
+    def _selected(self, channels: Optional[frozenset]) -> list[int]:
+        return [i for i, c in enumerate(self.columns) if channels is None or c in channels]
+
+    def _encode_json(self, timestamps: numpy.ndarray, values: numpy.ndarray,
+                     channels: Optional[frozenset]) -> Optional[str]:
+        rows = self._selected(channels)
+        if not rows:
+            return None
+        # Same layout as DataFrame.to_dict(orient="split")
+        raw = {"index": timestamps.tolist(), "columns": [self.columns[i] for i in rows],
+               "data": values[rows].T.tolist()}
+        payload = {"device": self.device_id, "raw": raw}
+        if self.inference is not None:
+            payload["inference"] = {
+                channel: {"signal": numpy.asarray(result["signal"]).tolist(), "label": result["label"],
+                          "confidence": float(result["confidence"]),
+                          **({"sqi": float(result["sqi"])} if result.get("sqi") is not None else {})}
+                for channel, result in self.inference.items() if channels is None or channel in channels
+            }
+        return json.dumps(payload)
+
+    def _encode_binary(self, timestamps: numpy.ndarray, values: numpy.ndarray, channels: Optional[frozenset],
+                       processed: str, full_window: bool) -> Optional[bytes]:
+        rows = self._selected(channels)
+        if not rows:
+            return None
+        names = [self.columns[i] for i in rows]
+        results = [] if self.inference is None else [(k, self.inference[c]) for k, c in enumerate(names)
+                                                     if c in self.inference]
+        window = len(results[0][1]["signal"]) if results else 0
+        float_values = values.dtype.kind == "f"
+
+        flags = FLAG_INFERENCE if results else 0
+        flags |= FLAG_INT16 if processed == "int16" else 0
+        flags |= FLAG_FULL_WINDOW if full_window else 0
+        flags |= FLAG_FLOAT_VALUES if float_values else 0
+        device = self.device_id.encode("utf-8")
+        n_rows = timestamps.shape[0]
+
+        parts = [FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, flags, len(names), len(device), n_rows,
+                                   len(results), window), device]
+        for name in names:
+            encoded = name.encode("utf-8")
+            parts.append(bytes([len(encoded)]) + encoded)
+        size = sum(len(p) for p in parts)
+        parts.append(_padding(size))
+        parts.append(timestamps.astype("<f8").tobytes())
+        block = values[rows].astype("<f4" if float_values else "<i4").tobytes()
+        parts.append(block)
+        parts.append(_padding(len(block)))
+
+        shift = min(self.new_samples, window)
+        count = window if full_window else min(shift + TAIL_OVERLAP, window)
+        for index, result in results:
+            signal = numpy.asarray(result["signal"], dtype=numpy.float32)[window - count:]
+            scale = 1.0
+            if processed == "int16":
+                peak = float(numpy.max(numpy.abs(signal))) if count else 0.0
+                scale = peak / 32767.0 if peak > 0 else 1.0
+                samples = numpy.round(signal / scale).astype("<i2").tobytes()
+            else:
+                samples = signal.astype("<f4").tobytes()
+            label = str(result["label"]).encode("utf-8")
+            sqi = result.get("sqi")
+            sqi = SQI_MISSING if sqi is None else int(round(min(max(float(sqi), 0.0), 1.0) * SQI_SCALE))
+            head = RESULT_HEADER.pack(index, len(label), shift, count, sqi, float(result["confidence"]), scale) + label
+            parts.append(head)
+            parts.append(_padding(len(head), 4))
+            parts.append(samples)
+            parts.append(_padding(len(head) + (-len(head) % 4) + len(samples)))
+        return b"".join(parts)
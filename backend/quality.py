@@ -0,0 +1,68 @@
+"""Signal-quality index (SQI) of raw PPG windows, computed before inference.
+
+Windows from a watch that is off-wrist, saturated, flat or dominated by motion
+cannot be classified meaningfully, so their channels skip the model. Every
+measure is vectorized along the last axis of a (channels x samples) or
+(windows x samples) array:
+
+- ``clipping``: fraction of samples sitting at the window minimum or maximum
+  (saturated ADC, clipped pulses)
+- ``flat``: fraction of consecutive samples that do not change (disconnected or
+  stuck sensor)
+- ``band_power``: share of the cardiac band (0.5-8 Hz by default) in the power
+  above ``lowcut``. Baseline wander and respiration, which the bandpass removes
+  anyway, are left out of the total, so real windows with drift still score
+  about 1 while white noise (off-wrist ambient light), spikes and other
+  broadband artifacts score 0.6-0.8 at 25 Hz
+- ``perfusion``: pulsatile (5th-95th percentile range) over mean level, the
+  perfusion index; near zero when the sensor sees no pulse
+
+The combined ``sqi`` in [0, 1] is ``band_power * (1 - clipping) * (1 - flat)``,
+set to 0 when the perfusion is below ``min_perfusion``.
+"""
+import numpy
+
+QUALITY_FIELDS = ("sqi", "clipping", "flat", "band_power", "perfusion")
+
+
+def signal_quality(signals: numpy.ndarray, fs: float = 25.0, lowcut: float = 0.5, highcut: float = 8.0,
+                   min_perfusion: float = 0.0) -> dict[str, numpy.ndarray]:
+    """Quality measures of raw windows along the last axis.
+
+    Args:
+        signals: Raw samples of shape (..., N).
+        fs: Sampling rate in Hz.
+        lowcut, highcut: Cardiac band in Hz.
+        min_perfusion: Perfusion index below which ``sqi`` is 0.
+
+    Returns:
+        One float32 array of shape ``signals.shape[:-1]`` per name in ``QUALITY_FIELDS``.
+    """
+    x = numpy.asarray(signals, dtype=numpy.float64)
+    n = x.shape[-1]
+
+    high = x.max(axis=-1, keepdims=True)
+    low = x.min(axis=-1, keepdims=True)
+    clipping = numpy.mean((x == high) | (x == low), axis=-1)
+    flat = numpy.mean(numpy.diff(x, axis=-1) == 0, axis=-1)
+
+    # Mean and linear trend removed and a Hann taper: drift would otherwise leak into every frequency bin
+    mean = x.mean(axis=-1, keepdims=True)
+    t = numpy.arange(n, dtype=numpy.float64) - (n - 1) / 2.0
+    slope = ((x - mean) @ t)[..., None] / float(t @ t)
+    detrended = (x - mean - slope * t) * numpy.hanning(n)
+    power = numpy.abs(numpy.fft.rfft(detrended, axis=-1)) ** 2
+    freqs = numpy.fft.rfftfreq(n, 1.0 / fs)
+    in_band = (freqs >= lowcut) & (freqs <= highcut)
+    total = power[..., freqs >= lowcut].sum(axis=-1)
+    band_power = numpy.divide(power[..., in_band].sum(axis=-1), total,
+                              out=numpy.zeros_like(total), where=total > 0)
+
+    p5, p95 = numpy.percentile(x, (5, 95), axis=-1)
+    level = numpy.abs(mean[..., 0])
+    perfusion = numpy.divide(p95 - p5, level, out=numpy.zeros_like(level), where=level > 0)
+
+    sqi = band_power * (1.0 - clipping) * (1.0 - flat)
+    sqi = numpy.where(perfusion < min_perfusion, 0.0, sqi)
+    return {name: value.astype(numpy.float32) for name, value in zip(
+        QUALITY_FIELDS, (sqi, clipping, flat, band_power, perfusion))}
@@ -0,0 +1,297 @@
+"""Offline batch reclassification of archived recordings.
+
+Re-runs a model over stored PPG (segment store and/or ``*.csv`` recordings) in
+strided 250-sample windows. Each recording is split into work units (one per
+stored segment, i.e. a time range, or one per CSV file) that are spread across a
+process pool. Each worker loads the model once, cuts every window of a unit out
+of a sliding-window view, preprocesses them all as one 2-D array and classifies
+them in large batches.
+
+Results go to one ``.npz`` per unit under ``<out>/<device>/``, named after its
+segment or CSV file and written atomically. An interrupted run resumes by
+skipping the units whose result matches their current input; a segment that grew
+since (a live recording) is classified again and its file overwritten. Each file
+holds ``start_ms`` (W,), ``channels`` (C,), ``label`` (C, W) as indices into
+``LABELS``, ``confidence`` (C, W) float32 and the unit ``revision``.
+
+Usage (from ``backend``):
+    python reclassify.py <data root> <model.keras or .tflite> <out folder> [--devices a,b] [--start ms] [--end ms]
+                         [--stride 125] [--workers 4] [--batch-size 4096] [--csv results.csv]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import NamedTuple, Optional
+import numpy
+import pandas
+from numpy.lib.stride_tricks import sliding_window_view
+
+from infer import Inferer, WINDOW_SIZE, SAMPLING_RATE, preprocess_windows
+from inference_backends import model_version
+from storage import SegmentStore, read_segments, SEGMENT_SUFFIX
+
+LABELS = ("SR", "AF")
+RUN_FILE = "run.json"
+PERIOD_MS = 1000.0 / SAMPLING_RATE
+WINDOW_MS = int(round(WINDOW_SIZE * PERIOD_MS))
+
+
+class WorkUnit(NamedTuple):
+    """Windows starting in [start_ms, end_ms] of a device, read from ``paths``.
+
+    ``revision`` describes the input (range and extent of the data); a result
+    written for another revision is out of date.
+    """
+    device_id: str
+    name: str
+    paths: tuple[str, ...]
+    start_ms: Optional[int] = None
+    end_ms: Optional[int] = None
+    revision: str = ""
+
+
+def find_units(root: str | Path, devices: Optional[list[str]] = None,
+               start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> list[WorkUnit]:
+    """Work units of the recordings under ``root``.
+
+    Device folders holding segment files (``SegmentStore`` layout, in ``root`` or
+    ``root/segments``) give one unit per segment, clipped to ``[start_ms, end_ms]``;
+    its paths extend one window past the segment so windows crossing into the next
+    one are complete. ``*.csv`` files directly in ``root`` (``ppg.csv`` layout) give
+    one unit each, as device "csv". Units are named after their segment or CSV file.
+    """
+    root = Path(root)
+    units = []
+    # a data folder keeps its segment store in "segments"
+    store = SegmentStore(root / "segments" if (root / "segments").is_dir() else root)
+    for device in store.devices():
+        if devices is not None and device not in devices:
+            continue
+        if not any(p.suffix == SEGMENT_SUFFIX for p in (store.root / device).iterdir()):
+            continue
+        for entry in store.index(device).overlapping(start_ms, end_ms):
+            first = entry["min_ts"] if start_ms is None else max(entry["min_ts"], start_ms)
+            last = entry["max_ts"] if end_ms is None else min(entry["max_ts"], end_ms)
+            paths = tuple(str(p) for p in store.segments(device, first, last + WINDOW_MS))
+            # the data end (lookahead included) moves while a live segment grows
+            data_end = store.time_range(device, first, last + WINDOW_MS)[1]
+            units.append(WorkUnit(device, Path(entry["segment"]).stem, paths, first, last, f"{first}-{last}-{data_end}"))
+    if devices is None or "csv" in devices:
+        for path in sorted(root.glob("*.csv")):
+            revision = f"{start_ms}-{end_ms}-{path.stat().st_size}"
+            units.append(WorkUnit("csv", path.stem, (str(path),), start_ms, end_ms, revision))
+    return units
+
+
+def load_unit(unit: WorkUnit) -> tuple[list[str], numpy.ndarray, numpy.ndarray]:
+    """``(channels, timestamps (N,), values (C, N))`` of a unit, including its lookahead."""
+    if unit.paths and unit.paths[0].endswith(".csv"):
+        df = pandas.read_csv(unit.paths[0], index_col=0).sort_index()
+        return list(df.columns), df.index.to_numpy(dtype=numpy.int64), df.to_numpy(dtype=numpy.float32).T
+    end = None if unit.end_ms is None else unit.end_ms + WINDOW_MS
+    columns, timestamps, values = [], [], []
+    for columns, ts, vals in read_segments([Path(p) for p in unit.paths], unit.start_ms, end):
+        timestamps.append(ts)
+        values.append(vals)
+    if not timestamps:
+        return columns, numpy.empty(0, dtype=numpy.int64), numpy.empty((len(columns), 0), dtype=numpy.float32)
+    return columns, numpy.concatenate(timestamps), numpy.concatenate(values, axis=1).astype(numpy.float32)
+
+
+def windows_of(timestamps: numpy.ndarray, values: numpy.ndarray, stride: int = WINDOW_SIZE,
+               start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """Strided 250-sample windows of contiguous 25 Hz stretches.
+
+    The recording is split wherever consecutive timestamps are not one sample
+    period apart (gaps, restarts), and windows never cross a split. Only windows
+    starting inside ``[start_ms, end_ms]`` are kept.
+
+    Returns:
+        ``(start timestamps (W,), windows (C, W, 250))``. The windows are gathered
+        from a sliding-window view, so only the selected ones are copied.
+    """
+    diffs = numpy.diff(timestamps)
+    breaks = numpy.flatnonzero((diffs < PERIOD_MS * 0.5) | (diffs > PERIOD_MS * 1.5)) + 1
+    edges = numpy.concatenate(([0], breaks, [timestamps.shape[0]]))
+    starts, windows = [], []
+    for a, b in zip(edges[:-1], edges[1:]):
+        if b - a < WINDOW_SIZE:
+            continue
+        first = timestamps[a:b - WINDOW_SIZE + 1:stride]
+        keep = numpy.ones(first.shape[0], dtype=bool)
+        if start_ms is not None:
+            keep &= first >= start_ms
+        if end_ms is not None:
+            keep &= first <= end_ms
+        view = sliding_window_view(values[:, a:b], WINDOW_SIZE, axis=1)[:, ::stride]
+        starts.append(first[keep])
+        windows.append(view[:, keep])
+    if not starts:
+        return numpy.empty(0, dtype=numpy.int64), numpy.empty((values.shape[0], 0, WINDOW_SIZE), dtype=values.dtype)
+    return numpy.concatenate(starts), numpy.concatenate(windows, axis=1)
+
+
+_inferer: Optional[Inferer] = None
+
+
+def _init_worker(model_path: str) -> None:
+    global _inferer
+    _inferer = Inferer(model_path, warmup=False)
+
+
+def classify_unit(unit: WorkUnit, out_path: str, stride: int = WINDOW_SIZE, batch_size: int = 4096,
+                  channels: Optional[list[str]] = None) -> int:
+    """Classifies every window of ``unit`` and writes its result table; returns the window count."""
+    columns, timestamps, values = load_unit(unit)
+    if channels is not None:
+        rows = [columns.index(c) for c in channels if c in columns]
+        columns, values = [columns[i] for i in rows], values[rows]
+    starts, windows = windows_of(timestamps, values, stride, unit.start_ms, unit.end_ms)
+
+    # (C, W, 250) -> (C * W, 250), channel-major like the live path
+    flat = windows.reshape(-1, WINDOW_SIZE)
+    labels = numpy.empty(flat.shape[0], dtype=numpy.uint8)
+    confidence = numpy.empty(flat.shape[0], dtype=numpy.float32)
+    for i in range(0, flat.shape[0], batch_size):
+        predictions = _inferer.predict(preprocess_windows(flat[i:i + batch_size]))
+        labels[i:i + batch_size] = numpy.argmax(predictions, axis=1)
+        confidence[i:i + batch_size] = numpy.max(predictions, axis=1)
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        numpy.savez(f, start_ms=starts, channels=numpy.array(columns),
+                    label=labels.reshape(len(columns), -1), confidence=confidence.reshape(len(columns), -1),
+                    revision=numpy.array(unit.revision))
+    os.replace(tmp, out_path)
+    return int(starts.shape[0])
+
+
+def is_done(unit: WorkUnit, out_path: Path) -> bool:
+    """True if ``out_path`` holds the result of ``unit`` for its current revision."""
+    if not out_path.exists():
+        return False
+    with numpy.load(out_path) as table:
+        return "revision" in table.files and str(table["revision"]) == unit.revision
+
+
+def reclassify(root: str | Path, model_path: str, out: str | Path, devices: Optional[list[str]] = None,
+               start_ms: Optional[int] = None, end_ms: Optional[int] = None, stride: int = WINDOW_SIZE,
+               workers: Optional[int] = None, batch_size: int = 4096,
+               channels: Optional[list[str]] = None) -> dict[str, int | float]:
+    """Reclassifies the recordings under ``root`` with ``model_path`` into ``out``.
+
+    Args:
+        root: Segment store root and/or folder of CSV recordings (see ``find_units``).
+        model_path: Model to run: a Keras model or a ``.tflite`` file (see ``load_backend``).
+        out: Output folder; units whose result there is up to date are skipped (resume).
+        devices: Devices to process (all when None).
+        start_ms: Only windows starting at or after this time.
+        end_ms: Only windows starting at or before this time.
+        stride: Samples between window starts (250 = back-to-back windows).
+        workers: Worker processes (CPU count when None); 0 runs in this process.
+        batch_size: Windows per model call.
+        channels: Channels to classify (all when None).
+
+    Returns:
+        Counts of units done and skipped, windows classified and elapsed seconds.
+
+    Raises:
+        ValueError: If ``out`` holds results of a run with different settings.
+    """
+    if stride < 1:
+        raise ValueError("stride must be >= 1")
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    # the version (content hash) catches a model replaced at the same path
+    settings = {"model": str(Path(model_path).resolve()), "model_version": model_version(model_path),
+                "stride": stride, "channels": channels}
+    run_file = out / RUN_FILE
+    if run_file.exists():
+        previous = json.loads(run_file.read_text())
+        if previous != settings:
+            raise ValueError(f"{out} holds results for {previous}; use another output folder")
+    else:
+        run_file.write_text(json.dumps(settings))
+
+    units = find_units(root, devices, start_ms, end_ms)
+    pending = [(u, out / u.device_id / f"{u.name}.npz") for u in units]
+    pending = [(u, p) for u, p in pending if not is_done(u, p)]
+    skipped = len(units) - len(pending)
+    print(f"{len(units)} unit(s), {skipped} already done, {len(pending)} to classify.")
+
+    start = time.perf_counter()
+    windows = 0
+    if workers == 0:
+        _init_worker(model_path)
+        for i, (unit, path) in enumerate(pending, 1):
+            windows += classify_unit(unit, str(path), stride, batch_size, channels)
+            print(f"[{i}/{len(pending)}] {unit.device_id}/{unit.name}")
+    elif pending:
+        # spawn: TensorFlow does not survive fork
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(model_path,)) as pool:
+            futures = {pool.submit(classify_unit, unit, str(path), stride, batch_size, channels): unit
+                       for unit, path in pending}
+            for i, future in enumerate(as_completed(futures), 1):
+                unit = futures[future]
+                windows += future.result()
+                print(f"[{i}/{len(pending)}] {unit.device_id}/{unit.name}")
+    elapsed = time.perf_counter() - start
+    return {"units": len(pending), "skipped_units": skipped, "windows": windows, "seconds": round(elapsed, 3)}
+
+
+def load_results(out: str | Path) -> pandas.DataFrame:
+    """All unit results of ``out`` as one table: device, channel, start_ms, label, confidence."""
+    frames = []
+    for path in sorted(Path(out).glob("*/*.npz")):
+        with numpy.load(path) as table:
+            channels, starts = table["channels"], table["start_ms"]
+            frames.append(pandas.DataFrame({
+                "device": path.parent.name,
+                "channel": numpy.repeat(channels, starts.shape[0]),
+                "start_ms": numpy.tile(starts, channels.shape[0]),
+                "label": numpy.asarray(LABELS)[table["label"].ravel()],
+                "confidence": table["confidence"].ravel(),
+            }))
+    if not frames:
+        return pandas.DataFrame(columns=["device", "channel", "start_ms", "label", "confidence"])
+    return pandas.concat(frames, ignore_index=True).sort_values(["device", "start_ms", "channel"], ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root")
+    parser.add_argument("model")
+    parser.add_argument("out")
+    parser.add_argument("--devices", help="comma-separated device ids (default: all)")
+    parser.add_argument("--channels", help="comma-separated channels (default: all)")
+    parser.add_argument("--start", type=int, help="epoch ms")
+    parser.add_argument("--end", type=int, help="epoch ms")
+    parser.add_argument("--stride", type=int, default=WINDOW_SIZE, help="samples between windows")
+    parser.add_argument("--workers", type=int, help="worker processes (0 = in process, default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=4096, help="windows per model call")
+    parser.add_argument("--csv", help="also write the merged results to this CSV file")
+    args = parser.parse_args()
+
+    summary = reclassify(
+        args.root, args.model, args.out,
+        devices=args.devices.split(",") if args.devices else None,
+        start_ms=args.start, end_ms=args.end, stride=args.stride, workers=args.workers,
+        batch_size=args.batch_size,
+        channels=[c.strip().upper() for c in args.channels.split(",")] if args.channels else None,
+    )
+    print(json.dumps(summary))
+    if args.csv:
+        load_results(args.out).to_csv(args.csv, index=False)
+        print(f"Results written to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import numpy
+
+
+class RingBuffer:
+    """Fixed-size, array-backed ring buffer of multi-channel samples with timestamps.
+
+    Storage is preallocated as (channels, 2 * capacity) with every sample written
+    twice (at ``i`` and ``i + capacity``), so the most recent ``len(self)`` samples
+    are always one contiguous slice and ``view`` never copies. Appending a batch
+    costs O(batch) regardless of the capacity.
+    """
+
+    def __init__(self,
+                 channels: int,
+                 capacity: int,
+                 dtype=numpy.float32,
+                 timestamp_dtype=numpy.int64):
+        """
+        Args:
+            channels: Number of channels (rows).
+            capacity: Number of samples kept per channel.
+            dtype: Sample dtype.
+            timestamp_dtype: Timestamp dtype (e.g. int64 milliseconds or float64 seconds).
+        """
+        if channels < 1 or capacity < 1:
+            raise ValueError("channels and capacity must be >= 1")
+        self.channels = int(channels)
+        self.capacity = int(capacity)
+        self._values = numpy.zeros((self.channels, 2 * self.capacity), dtype=dtype)
+        self._timestamps = numpy.zeros(2 * self.capacity, dtype=timestamp_dtype)
+        self._end = 0   # next write position in [0, capacity)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def is_full(self) -> bool:
+        return self._size == self.capacity
+
+    def clear(self) -> None:
+        self._end = 0
+        self._size = 0
+
+    def append(self, timestamps, values) -> None:
+        """Appends a batch of samples.
+
+        Args:
+            timestamps: 1-D array-like of length n.
+            values: Array-like of shape (channels, n), or (n,) for a single channel.
+        """
+        timestamps = numpy.asarray(timestamps)
+        values = numpy.asarray(values)
+        if values.ndim == 1:
+            values = values.reshape(1, -1)
+        n = timestamps.shape[0]
+        if values.shape != (self.channels, n):
+            raise ValueError(f"Expected values of shape ({self.channels}, {n}), got {values.shape}")
+        if n == 0:
+            return
+
+        cap = self.capacity
+        if n >= cap:
+            # Only the newest `capacity` samples survive.
+            self._values[:, :cap] = values[:, n - cap:]
+            self._values[:, cap:] = values[:, n - cap:]
+            self._timestamps[:cap] = timestamps[n - cap:]
+            self._timestamps[cap:] = timestamps[n - cap:]
+            self._end = 0
+            self._size = cap
+            return
+
+        start = self._end
+        first = min(n, cap - start)  # samples before wrapping around
+        self._write(start, timestamps[:first], values[:, :first])
+        if first < n:
+            self._write(0, timestamps[first:], values[:, first:])
+        self._end = (start + n) % cap
+        self._size = min(cap, self._size + n)
+
+    def _write(self, pos: int, timestamps: numpy.ndarray, values: numpy.ndarray) -> None:
+        n = timestamps.shape[0]
+        mirror = pos + self.capacity
+        self._values[:, pos:pos + n] = values
+        self._values[:, mirror:mirror + n] = values
+        self._timestamps[pos:pos + n] = timestamps
+        self._timestamps[mirror:mirror + n] = timestamps
+
+    def view(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        """Returns ``(timestamps, values)`` of the buffered samples, oldest first.
+
+        Both are read-only views into the buffer (no copy): ``timestamps`` has shape
+        (n,) and ``values`` shape (channels, n), each row contiguous in memory. They
+        are only valid until the next ``append``.
+        """
+        start = (self._end - self._size) % self.capacity if self._size else 0
+        stop = start + self._size
+        timestamps = self._timestamps[start:stop]
+        values = self._values[:, start:stop]
+        timestamps.flags.writeable = False
+        values.flags.writeable = False
+        return timestamps, values
+
+    def first_timestamp(self):
+        """Timestamp of the oldest buffered sample, or None if empty."""
+        if not self._size:
+            return None
+        return self._timestamps[(self._end - self._size) % self.capacity]
@@ -0,0 +1,235 @@
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Hashable, Optional
+import numpy
+
+
+class SchedulerFull(RuntimeError):
+    """Raised when the scheduler queue already holds ``max_queue_depth`` windows."""
+
+
+class InferenceScheduler:
+    """Collects preprocessed windows from many devices and runs them as one model call.
+
+    Each caller submits a (C, 250) block of windows and awaits its own (C, n_classes)
+    predictions. The scheduler flushes a batch as soon as ``max_batch_size`` windows
+    are pending or ``max_wait_ms`` has passed since the oldest pending submission.
+    The model call runs on a dedicated thread so the event loop stays responsive.
+    """
+
+    def __init__(self,
+                 predict: Callable[[numpy.ndarray], numpy.ndarray],
+                 max_batch_size: int = 64,
+                 max_wait_ms: float = 20.0,
+                 max_queue_depth: int = 1024):
+        """
+        Args:
+            predict: Function mapping an (N, 250) array to (N, n_classes) probabilities.
+            max_batch_size: Maximum number of windows per model call.
+            max_wait_ms: Maximum time the oldest window waits for the batch to fill.
+            max_queue_depth: Maximum number of windows pending; ``submit`` raises
+                ``SchedulerFull`` beyond it.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        if max_queue_depth < max_batch_size:
+            raise ValueError("max_queue_depth must be >= max_batch_size")
+
+        self.predict = predict
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = float(max_wait_ms) / 1000.0
+        self.max_queue_depth = int(max_queue_depth)
+
+        # pending items: (windows, future, enqueue_time)
+        self._pending: deque[tuple[numpy.ndarray, asyncio.Future, float]] = deque()
+        self._pending_windows = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.batches_run = 0
+        self.windows_run = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        """Starts the batching loop on the running event loop."""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the batching loop and fails any pending submissions."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for _, future, _ in self._pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Inference scheduler stopped"))
+        self._pending.clear()
+        self._pending_windows = 0
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    async def submit(self, windows: numpy.ndarray) -> numpy.ndarray:
+        """Queues a (C, 250) block of windows and waits for its (C, n_classes) predictions."""
+        if self._task is None:
+            raise RuntimeError("Inference scheduler is not running")
+        windows = numpy.asarray(windows, dtype=numpy.float32)
+        if windows.ndim == 1:
+            windows = windows.reshape(1, -1)
+        if self._pending_windows + windows.shape[0] > self.max_queue_depth:
+            self.rejected += windows.shape[0]
+            raise SchedulerFull(f"Inference queue is full ({self._pending_windows} windows pending)")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((windows, future, time.perf_counter()))
+        self._pending_windows += windows.shape[0]
+        self._wakeup.set()
+        return await future
+
+    def stats(self) -> dict[str, float | int | None]:
+        """Returns batching counters and the current queue depth."""
+        mean = (self.windows_run / self.batches_run) if self.batches_run else None
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_queue_depth": self.max_queue_depth,
+            "queue_depth": self._pending_windows,
+            "batches_run": self.batches_run,
+            "windows_run": self.windows_run,
+            "mean_batch_size": mean,
+            "rejected_windows": self.rejected,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # Wait until the batch is full or the oldest item hits its deadline.
+            deadline = self._pending[0][2] + self.max_wait
+            while self._pending_windows < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            items = self._take_batch()
+            batch = numpy.concatenate([windows for windows, _, _ in items], axis=0)
+            try:
+                predictions = await loop.run_in_executor(self._executor, self.predict, batch)
+            except Exception as e:
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.windows_run += batch.shape[0]
+            offset = 0
+            for windows, future, _ in items:
+                n = windows.shape[0]
+                if not future.done():
+                    future.set_result(predictions[offset:offset + n])
+                offset += n
+
+    def _take_batch(self) -> list[tuple[numpy.ndarray, asyncio.Future, float]]:
+        """Pops whole submissions from the queue up to ``max_batch_size`` windows (at least one)."""
+        taken = []
+        count = 0
+        while self._pending:
+            n = self._pending[0][0].shape[0]
+            if taken and count + n > self.max_batch_size:
+                break
+            taken.append(self._pending.popleft())
+            count += n
+        self._pending_windows -= count
+        return taken
+
+
+class LatestJobDispatcher:
+    """Runs jobs in the background, one at a time per key, keeping only the newest pending job.
+
+    ``submit`` never waits: the first job of a key starts a task right away; jobs
+    arriving while it runs wait in a single slot per key, and a newer job replaces
+    the one in the slot (it would be stale by the time it ran). Live windows of a
+    device therefore never queue up behind a slow model: at most one runs and one
+    waits per device.
+    """
+
+    def __init__(self, run: Callable[[object], Awaitable[None]]):
+        """
+        Args:
+            run: Coroutine function processing one job; exceptions are logged and counted.
+        """
+        self.run = run
+        self._running: dict[Hashable, asyncio.Task] = {}
+        self._waiting: dict[Hashable, object] = {}
+
+        self.submitted = 0
+        self.superseded = 0
+        self.completed = 0
+        self.failed = 0
+
+    def submit(self, key: Hashable, job: object) -> bool:
+        """Schedules ``job`` for ``key``; returns True if it replaced a waiting job."""
+        self.submitted += 1
+        if key not in self._running:
+            self._running[key] = asyncio.get_running_loop().create_task(self._drain(key, job))
+            return False
+        replaced = key in self._waiting
+        if replaced:
+            self.superseded += 1
+        self._waiting[key] = job
+        return replaced
+
+    async def stop(self) -> None:
+        """Cancels running jobs and drops waiting ones."""
+        self._waiting.clear()
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._running.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "running": len(self._running),
+            "waiting": len(self._waiting),
+            "submitted": self.submitted,
+            "superseded": self.superseded,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    async def _drain(self, key: Hashable, job: object) -> None:
+        try:
+            while True:
+                try:
+                    await self.run(job)
+                    self.completed += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failed += 1
+                    print(f"Background job for '{key}' failed: {e}")
+                if key not in self._waiting:
+                    break
+                job = self._waiting.pop(key)
+        finally:
+            self._running.pop(key, None)
@@ -0,0 +1,261 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+import numpy
+from ringbuffer import RingBuffer
+from measurement import MeasurementLog
+from timebase import GridResampler
+
+DEFAULT_DEVICE_ID = "default"
+DEVICE_ID_HEADER = "X-Device-Id"
+
+
+def sanitize_device_id(device_id) -> str:
+    """Returns a device id safe to use in file names and as a dictionary key.
+
+    A leading dot becomes "_", so "." and ".." (and hidden names) never reach a path.
+    """
+    if device_id is None:
+        return DEFAULT_DEVICE_ID
+    cleaned = re.sub(r"[^A-Za-z0-9_.-]", "_", str(device_id).strip())[:64]
+    cleaned = re.sub(r"^\.", "_", cleaned)
+    return cleaned or DEFAULT_DEVICE_ID
+
+
+class DeviceSession:
+    """Holds the streaming state of a single device: inference window, GREEN buffers and recorder."""
+
+    def __init__(self,
+                 device_id: str,
+                 window_size: int = 250,
+                 video_window: int = 250,
+                 measurement: Optional[MeasurementLog] = None,
+                 recorder_factory: Optional[Callable[[str], object]] = None,
+                 green_preprocessor=None,
+                 inference_stride: int = 1,
+                 dedupe_batches: int = 64,
+                 resampler: Optional[GridResampler] = None):
+        """
+        Args:
+            device_id: Sanitized device/session id.
+            window_size: Number of samples in the inference window.
+            video_window: Number of GREEN samples kept for the video window.
+            measurement: Whole-session GREEN accumulator for the session image
+                (``MeasurementLog``); None when session images are disabled.
+            recorder_factory: Callable building a video recorder for this device; the
+                recorder is created lazily on the first GREEN sample.
+            green_preprocessor: Optional stateful preprocessor (``StreamingPreprocessor``)
+                for the GREEN channel; when given, processed samples are kept in
+                ``green_processed`` instead of re-filtering the window per sample.
+            inference_stride: Minimum number of new samples between two inference
+                windows (windows overlap when it is below ``window_size``); 1 returns
+                a window on every batch once it is full.
+            dedupe_batches: Number of recent batches remembered by ``is_duplicate_batch``;
+                0 disables the check.
+            resampler: Grid resampler placing this device's samples on the exact
+                sampling grid before inference and the GREEN path; None keeps the
+                received timestamps.
+        """
+        self.device_id = device_id
+        self.window_size = int(window_size)
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+
+        # Ventana de inferencia (últimas window_size muestras de todos los canales)
+        self.columns: Optional[list[str]] = None
+        self.window: Optional[RingBuffer] = None
+        self.inference_stride = max(1, int(inference_stride))
+        # Muestras recibidas desde la última ventana entregada (la primera ventana completa siempre se entrega)
+        self.samples_since_window = self.inference_stride
+        # Último timestamp de ventana ya difundido con resultados (los clientes binarios reciben solo lo nuevo)
+        self.last_broadcast_ts: Optional[int] = None
+
+        self.resampler = resampler
+
+        # Últimos lotes recibidos (primer/último timestamp, longitud): reintentos y reenvíos idénticos
+        self.dedupe_batches = int(dedupe_batches)
+        self.recent_batches: "OrderedDict[tuple[int, int, int], None]" = OrderedDict()
+
+        # Ring buffer GREEN (valores y timestamps en epoch seconds) — para ventana de video
+        self.green = RingBuffer(1, video_window, timestamp_dtype=numpy.float64)
+        self.green_preprocessor = green_preprocessor
+        self.green_processed = RingBuffer(1, video_window, timestamp_dtype=numpy.float64) if green_preprocessor is not None else None
+
+        # Medición completa GREEN: envolvente min/max de tamaño fijo (None si las imágenes están desactivadas)
+        self.measurement = measurement
+
+        self._recorder_factory = recorder_factory
+        self._recorder = None
+
+    def touch(self) -> None:
+        """Marks the session as active now."""
+        self.last_seen = time.time()
+
+    def is_duplicate_batch(self, timestamps: numpy.ndarray) -> bool:
+        """True if a batch with the same first/last timestamp and length was received recently.
+
+        New batches are remembered (up to ``dedupe_batches``) so that a retried or
+        replayed POST is recognized.
+        """
+        if not self.dedupe_batches or not len(timestamps):
+            return False
+        key = (int(timestamps[0]), int(timestamps[-1]), len(timestamps))
+        if key in self.recent_batches:
+            return True
+        self.recent_batches[key] = None
+        if len(self.recent_batches) > self.dedupe_batches:
+            self.recent_batches.popitem(last=False)
+        return False
+
+    def add_inference_data(self, timestamps: numpy.ndarray, columns: list[str],
+                           values: numpy.ndarray) -> Optional[tuple[numpy.ndarray, numpy.ndarray]]:
+        """Appends a batch (timestamps (N,), values (C, N)) to the inference window.
+
+        Returns:
+            ``(timestamps, signals)`` views of the window once it is full and at least
+            ``inference_stride`` samples arrived since the previous window, otherwise None.
+            Signals have shape (C, window_size) following ``self.columns``.
+        """
+        if self.window is None:
+            self.columns = list(columns)
+            self.window = RingBuffer(len(self.columns), self.window_size)
+        self.window.append(timestamps, values)
+        self.samples_since_window += len(timestamps)
+
+        if not self.window.is_full():
+            print(f"[{self.device_id}] Insufficient data for classification: {len(self.window)} samples (need {self.window_size}).")
+            return None
+        if self.samples_since_window < self.inference_stride:
+            return None
+        self.samples_since_window = 0
+        return self.window.view()
+
+    def restart_inference_window(self) -> None:
+        """Empties the inference window (after a gap), so no window spans a discontinuity."""
+        if self.window is not None:
+            self.window.clear()
+        self.samples_since_window = self.inference_stride
+
+    def take_new_window_samples(self, timestamps: numpy.ndarray) -> int:
+        """Number of samples of the window ``timestamps`` not yet broadcast, marking them as broadcast."""
+        last = self.last_broadcast_ts
+        self.last_broadcast_ts = int(timestamps[-1])
+        if last is None:
+            return timestamps.shape[0]
+        return int(timestamps.shape[0] - numpy.searchsorted(timestamps, last, side="right"))
+
+    @property
+    def recorder(self):
+        """The video recorder of this session (created on first access), or None without a factory."""
+        if self._recorder is None and self._recorder_factory is not None:
+            self._recorder = self._recorder_factory(self.device_id)
+        return self._recorder
+
+    def has_recorder(self) -> bool:
+        return self._recorder is not None
+
+    def close(self) -> None:
+        """Releases the recorder of this session (the measurement envelope is kept for the image)."""
+        if self._recorder is not None:
+            try:
+                self._recorder.close()
+            except Exception as e:
+                print(f"[{self.device_id}] Error closing recorder: {e}")
+
+
+class SessionManager:
+    """Keeps one ``DeviceSession`` per device, evicting idle sessions with an LRU/TTL policy."""
+
+    def __init__(self,
+                 session_factory: Callable[[str], DeviceSession],
+                 max_sessions: int = 256,
+                 ttl_seconds: float = 300.0,
+                 on_evict: Optional[Callable[[DeviceSession], None]] = None):
+        """
+        Args:
+            session_factory: Callable building a new session for a device id.
+            max_sessions: Maximum concurrent sessions; the least recently used one is
+                evicted when a new device appears beyond it.
+            ttl_seconds: Sessions idle for longer than this are evicted by ``evict_idle``.
+            on_evict: Called with each evicted session after it is closed.
+        """
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be >= 1")
+        self.session_factory = session_factory
+        self.max_sessions = int(max_sessions)
+        self.ttl_seconds = float(ttl_seconds)
+        self.on_evict = on_evict
+        self._sessions: "OrderedDict[str, DeviceSession]" = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def find(self, device_id) -> Optional[DeviceSession]:
+        """Returns the session of ``device_id`` if it exists, without creating or touching it."""
+        return self._sessions.get(sanitize_device_id(device_id))
+
+    def get(self, device_id) -> DeviceSession:
+        """Returns the session of ``device_id``, creating it (and evicting LRU sessions) if needed."""
+        device_id = sanitize_device_id(device_id)
+        session = self._sessions.get(device_id)
+        if session is None:
+            while len(self._sessions) >= self.max_sessions:
+                _, oldest = self._sessions.popitem(last=False)
+                self._evict(oldest)
+            session = self.session_factory(device_id)
+            self._sessions[device_id] = session
+            print(f"New session for device '{device_id}' ({len(self._sessions)} active).")
+        else:
+            self._sessions.move_to_end(device_id)
+        session.touch()
+        return session
+
+    def evict_idle(self, now: Optional[float] = None) -> list[DeviceSession]:
+        """Evicts every session idle for longer than ``ttl_seconds`` and returns them."""
+        now = time.time() if now is None else now
+        evicted = []
+        # Sessions are ordered by last use, so stop at the first fresh one.
+        while self._sessions:
+            device_id, session = next(iter(self._sessions.items()))
+            if now - session.last_seen <= self.ttl_seconds:
+                break
+            del self._sessions[device_id]
+            self._evict(session)
+            evicted.append(session)
+        return evicted
+
+    def close_all(self) -> None:
+        """Evicts every session (used at shutdown)."""
+        while self._sessions:
+            _, session = self._sessions.popitem(last=False)
+            self._evict(session)
+
+    def stats(self) -> dict[str, int | float]:
+        resamplers = [s.resampler for s in self._sessions.values() if s.resampler is not None]
+        return {
+            "active_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "evicted_sessions": self.evicted,
+            "measurement_samples": sum(len(s.measurement) for s in self._sessions.values()
+                                       if s.measurement is not None),
+            # Timestamp normalization of the active sessions (see timebase.GridResampler)
+            "timestamp_gaps": sum(r.gaps for r in resamplers),
+            "dropped_samples": sum(r.dropped for r in resamplers),
+            "max_jitter_ms": max((r.max_jitter_ms for r in resamplers), default=None),
+        }
+
+    def _evict(self, session: DeviceSession) -> None:
+        self.evicted += 1
+        print(f"Evicting session for device '{session.device_id}'.")
+        session.close()
+        if self.on_evict is not None:
+            try:
+                self.on_evict(session)
+            except Exception as e:
+                print(f"[{session.device_id}] Error in session eviction hook: {e}")
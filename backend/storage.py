@@ -0,0 +1,534 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Iterator, Optional
+import numpy
+
+SEGMENT_SUFFIX = ".ppgseg"
+MANIFEST_NAME = "manifest.jsonl"
+FILE_MAGIC = b"PPGS"
+BLOCK_MAGIC = b"BLK1"
+FORMAT_VERSION = 1
+
+# File header: magic, version, number of channels; then each channel name as (u8 length, utf-8 bytes).
+FILE_HEADER = struct.Struct("<4sBB")
+# Block header: magic, rows, compressed payload length, first timestamp, last timestamp.
+BLOCK_HEADER = struct.Struct("<4sIIqq")
+
+FSYNC_POLICIES = ("never", "close", "flush")
+# Range of the stored channel values (int32 blocks).
+INT32_MIN, INT32_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def integer_samples(values) -> numpy.ndarray:
+    """``values`` as int64 if every sample is an integer within int32; ValueError otherwise."""
+    values = numpy.asarray(values)
+    if values.dtype.kind == "f":
+        if not numpy.array_equal(values, numpy.trunc(values)):
+            raise ValueError("Segment store only holds integer samples; got non-integer channel values")
+    elif values.dtype.kind not in "iub":
+        raise ValueError(f"Segment store only holds integer samples; got dtype {values.dtype}")
+    if values.size and (values.min() < INT32_MIN or values.max() > INT32_MAX):
+        raise ValueError("Channel values do not fit in int32")
+    return values.astype(numpy.int64, copy=False)
+
+
+def encode_block(timestamps: numpy.ndarray, values: numpy.ndarray, level: int = 1) -> bytes:
+    """Encodes one block: header + zlib(int32 timestamp deltas | int32 delta-encoded channels).
+
+    Args:
+        timestamps: int64 timestamps (ms), shape (n,), non-empty.
+        values: integer samples, shape (C, n).
+        level: zlib compression level.
+    """
+    timestamps = numpy.asarray(timestamps, dtype=numpy.int64)
+    values = numpy.asarray(values, dtype=numpy.int64)
+    n = timestamps.shape[0]
+    first = int(timestamps[0])
+    # Timestamps relative to the first one of the block; channels as first value + deltas.
+    ts_deltas = numpy.diff(timestamps, prepend=first).astype("<i4")
+    ch_deltas = numpy.diff(values, axis=1, prepend=0).astype("<i4")
+    payload = zlib.compress(ts_deltas.tobytes() + ch_deltas.tobytes(), level)
+    header = BLOCK_HEADER.pack(BLOCK_MAGIC, n, len(payload), first, int(timestamps[-1]))
+    return header + payload
+
+
+def decode_block(buffer, offset: int, channels: int) -> tuple[numpy.ndarray, numpy.ndarray, int]:
+    """Decodes the block starting at ``offset`` of ``buffer`` (bytes, memoryview or mmap).
+
+    Returns:
+        ``(timestamps int64 (n,), values int32 (C, n), next_offset)``.
+    """
+    magic, n, length, first, _ = BLOCK_HEADER.unpack_from(buffer, offset)
+    if magic != BLOCK_MAGIC:
+        raise ValueError(f"Corrupt segment: bad block magic at offset {offset}")
+    start = offset + BLOCK_HEADER.size
+    raw = zlib.decompress(memoryview(buffer)[start:start + length])
+    deltas = numpy.frombuffer(raw, dtype="<i4").reshape(channels + 1, n)
+    timestamps = numpy.cumsum(deltas[0], dtype=numpy.int64)
+    timestamps += first
+    values = numpy.cumsum(deltas[1:], axis=1, dtype=numpy.int64).astype(numpy.int32)
+    return timestamps, values, start + length
+
+
+def read_segment_header(buffer) -> tuple[list[str], int]:
+    """Parses a segment file header, returning ``(channels, header_size)``."""
+    magic, version, count = FILE_HEADER.unpack_from(buffer, 0)
+    if magic != FILE_MAGIC:
+        raise ValueError("Not a PPG segment file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported segment version {version}")
+    offset = FILE_HEADER.size
+    channels = []
+    for _ in range(count):
+        length = buffer[offset]
+        channels.append(bytes(buffer[offset + 1:offset + 1 + length]).decode("utf-8"))
+        offset += 1 + length
+    return channels, offset
+
+
+def iter_segment_blocks(path: str | Path, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                        channels: Optional[list[str]] = None
+                        ) -> Iterator[tuple[list[str], numpy.ndarray, numpy.ndarray]]:
+    """Yields ``(channels, timestamps, values)`` for each block of a segment file.
+
+    The file is read through a memory map. Blocks entirely outside
+    ``[start_ms, end_ms]`` are skipped from their header alone (no decompression),
+    and overlapping blocks are trimmed to the range. If ``channels`` is given only
+    those present in the segment are returned, in the requested order.
+    """
+    path = Path(path)
+    if path.stat().st_size == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        names, offset = read_segment_header(data)
+        rows = None
+        if channels is not None:
+            rows = [names.index(c) for c in channels if c in names]
+            selected = [names[i] for i in rows]
+        else:
+            selected = names
+        size = len(data)
+        while offset + BLOCK_HEADER.size <= size:
+            _, _, length, first, last = BLOCK_HEADER.unpack_from(data, offset)
+            block_end = offset + BLOCK_HEADER.size + length
+            if block_end > size:
+                break  # truncated trailing block (e.g. crash while writing)
+            if (start_ms is not None and last < start_ms) or (end_ms is not None and first > end_ms):
+                offset = block_end
+                continue
+            timestamps, values, offset = decode_block(data, offset, len(names))
+            if start_ms is not None or end_ms is not None:
+                mask = numpy.ones(timestamps.shape[0], dtype=bool)
+                if start_ms is not None:
+                    mask &= timestamps >= start_ms
+                if end_ms is not None:
+                    mask &= timestamps <= end_ms
+                timestamps, values = timestamps[mask], values[:, mask]
+            if rows is not None:
+                values = values[rows]
+            if timestamps.shape[0]:
+                yield selected, timestamps, values
+
+
+def read_segments(paths: list[Path], start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+                  channels: Optional[list[str]] = None) -> Iterator[tuple[list[str], numpy.ndarray, numpy.ndarray]]:
+    """``iter_segment_blocks`` over several segment files, in order.
+
+    Touches only the files, so it can run on a worker thread once ``paths`` has
+    been resolved (``SegmentStore.segments``) on the writer's thread.
+    """
+    for path in paths:
+        yield from iter_segment_blocks(path, start_ms, end_ms, channels)
+
+
+class SegmentIndex:
+    """Manifest of one device's segments: time range, row count and channels of each file.
+
+    Stored as ``manifest.jsonl`` next to the segments and appended to on every block
+    write, so opening an archive reads one file instead of scanning the directory.
+    The latest line of a segment wins; the file is compacted when it grows well
+    beyond one line per segment.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self.path = self.folder / MANIFEST_NAME
+        self.entries: dict[str, dict] = {}
+        self._lines = 0
+        if self.path.exists():
+            self._load()
+        elif self.folder.is_dir() and any(self.folder.glob(f"*{SEGMENT_SUFFIX}")):
+            # Archive written before the manifest existed: index it once.
+            self.rebuild()
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # partially written trailing line
+                self.entries[entry["segment"]] = entry
+                self._lines += 1
+
+    def record(self, segment: str, channels: list[str], min_ts: int, max_ts: int, rows: int) -> None:
+        """Merges a newly written block into the entry of ``segment`` and appends it to the manifest."""
+        entry = self.entries.get(segment)
+        if entry is None:
+            entry = {"segment": segment, "channels": list(channels), "min_ts": min_ts, "max_ts": max_ts, "rows": 0}
+            self.entries[segment] = entry
+        entry["min_ts"] = min(entry["min_ts"], min_ts)
+        entry["max_ts"] = max(entry["max_ts"], max_ts)
+        entry["rows"] += rows
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self._lines += 1
+        if self._lines > 4 * len(self.entries) + 64:
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrites the manifest with one line per segment."""
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self.ordered():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp, self.path)
+        self._lines = len(self.entries)
+
+    def rebuild(self) -> None:
+        """Rebuilds the manifest by reading the block headers of every segment file."""
+        self.entries = {}
+        if not self.folder.is_dir():
+            return
+        for path in self.folder.glob(f"*{SEGMENT_SUFFIX}"):
+            if path.stat().st_size == 0:
+                continue
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                channels, offset = read_segment_header(data)
+                entry = {"segment": path.name, "channels": channels, "min_ts": None, "max_ts": None, "rows": 0}
+                while offset + BLOCK_HEADER.size <= len(data):
+                    _, n, length, first, last = BLOCK_HEADER.unpack_from(data, offset)
+                    offset += BLOCK_HEADER.size + length
+                    if offset > len(data):
+                        break
+                    entry["min_ts"] = first if entry["min_ts"] is None else min(entry["min_ts"], first)
+                    entry["max_ts"] = last if entry["max_ts"] is None else max(entry["max_ts"], last)
+                    entry["rows"] += n
+            if entry["rows"]:
+                self.entries[path.name] = entry
+        self.compact()
+
+    def ordered(self) -> list[dict]:
+        return sorted(self.entries.values(), key=lambda e: (e["min_ts"], e["segment"]))
+
+    def overlapping(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> list[dict]:
+        """Entries whose time range intersects ``[start_ms, end_ms]``, in chronological order."""
+        return [e for e in self.ordered()
+                if (start_ms is None or e["max_ts"] >= start_ms) and (end_ms is None or e["min_ts"] <= end_ms)]
+
+
+class SegmentWriter:
+    """Appends blocks to one open segment file."""
+
+    def __init__(self, path: Path, channels: list[str], segment_id: int, fsync: str = "close"):
+        self.path = path
+        self.channels = list(channels)
+        self.segment_id = segment_id
+        self.fsync = fsync
+        new_file = not path.exists() or path.stat().st_size == 0
+        if not new_file:
+            with open(path, "rb") as f:
+                existing, _ = read_segment_header(f.read(FILE_HEADER.size + 256 * len(self.channels)))
+            if existing != self.channels:
+                raise ValueError(f"Segment {path.name} has channels {existing}, expected {self.channels}")
+        self._file = open(path, "ab")
+        if new_file:
+            header = FILE_HEADER.pack(FILE_MAGIC, FORMAT_VERSION, len(self.channels))
+            for name in self.channels:
+                encoded = name.encode("utf-8")
+                header += bytes([len(encoded)]) + encoded
+            self._file.write(header)
+
+    def write_block(self, block: bytes) -> None:
+        self._file.write(block)
+        self._file.flush()
+        if self.fsync == "flush":
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+        self._file.flush()
+        if self.fsync in ("flush", "close"):
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+
+class DeviceStream:
+    """Buffered, time-rolled writer of one device's samples."""
+
+    def __init__(self, folder: Path, channels: list[str], segment_ms: int, flush_rows: int,
+                 flush_seconds: float, fsync: str, level: int, index: SegmentIndex):
+        self.folder = folder
+        self.index = index
+        self.channels = list(channels)
+        self.segment_ms = segment_ms
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.fsync = fsync
+        self.level = level
+        self.writer: Optional[SegmentWriter] = None
+        self._ts: list[numpy.ndarray] = []
+        self._values: list[numpy.ndarray] = []
+        self._rows = 0
+        self._buffer_since: Optional[float] = None
+        self.bytes_written = 0
+
+    def append(self, timestamps: numpy.ndarray, values: numpy.ndarray) -> None:
+        segment_ids = timestamps // self.segment_ms
+        # Split the batch where it crosses a segment boundary.
+        cuts = numpy.flatnonzero(numpy.diff(segment_ids)) + 1
+        start = 0
+        for stop in list(cuts) + [timestamps.shape[0]]:
+            segment_id = int(segment_ids[start])
+            if self.writer is None or self.writer.segment_id != segment_id:
+                self.flush()
+                self._open(segment_id)
+            self._ts.append(timestamps[start:stop])
+            self._values.append(values[:, start:stop])
+            self._rows += stop - start
+            start = stop
+
+        if self._buffer_since is None:
+            self._buffer_since = time.monotonic()
+        if self._rows >= self.flush_rows or time.monotonic() - self._buffer_since >= self.flush_seconds:
+            self.flush()
+
+    def _open(self, segment_id: int) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.folder.mkdir(parents=True, exist_ok=True)
+        name = f"{segment_id * self.segment_ms}{SEGMENT_SUFFIX}"
+        self.writer = SegmentWriter(self.folder / name, self.channels, segment_id, self.fsync)
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        timestamps = numpy.concatenate(self._ts)
+        block = encode_block(timestamps, numpy.concatenate(self._values, axis=1), self.level)
+        self.writer.write_block(block)
+        self.bytes_written += len(block)
+        self.index.record(self.writer.path.name, self.channels, int(timestamps.min()), int(timestamps.max()),
+                          int(timestamps.shape[0]))
+        self._ts.clear()
+        self._values.clear()
+        self._rows = 0
+        self._buffer_since = None
+
+    def flush_if_idle(self, now: float, seconds: float) -> None:
+        """Flushes the buffered rows if the oldest was buffered at least ``seconds`` before ``now`` (monotonic)."""
+        if self._buffer_since is not None and now - self._buffer_since >= seconds:
+            self.flush()
+
+    def close(self) -> None:
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class SegmentStore:
+    """Storage engine writing PPG samples to per-device, time-rolled binary segment files.
+
+    Layout: ``<root>/<device>/<segment start ms>.ppgseg``. Each segment holds a
+    header with the channel names followed by zlib-compressed blocks of int32
+    timestamp deltas and delta-encoded int32 channels. Writes are buffered per
+    device and flushed as one block every ``flush_rows`` rows or ``flush_seconds``.
+    """
+
+    def __init__(self, root: str | Path, segment_seconds: int = 3600, flush_rows: int = 1500,
+                 flush_seconds: float = 5.0, fsync: str = "close", compression_level: int = 1):
+        """
+        Args:
+            root: Folder holding one sub-folder of segments per device.
+            segment_seconds: Time span covered by each segment file.
+            flush_rows: Buffered rows per device that trigger a block write.
+            flush_seconds: Maximum age of buffered rows before a block write.
+            fsync: 'never' (leave it to the OS), 'close' (fsync when a segment is closed)
+                or 'flush' (fsync after every block).
+            compression_level: zlib level (1 = fastest).
+        """
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.segment_ms = int(segment_seconds) * 1000
+        self.flush_rows = int(flush_rows)
+        self.flush_seconds = float(flush_seconds)
+        self.fsync = fsync
+        self.level = int(compression_level)
+        self._streams: dict[str, DeviceStream] = {}
+        self._indexes: dict[str, SegmentIndex] = {}
+        self.rows_written = 0
+        self._closed_bytes = 0
+
+    def append(self, device_id: str, timestamps, columns: list[str], values) -> None:
+        """Buffers a batch of samples.
+
+        Args:
+            device_id: Sanitized device id (used as folder name).
+            timestamps: Integer timestamps in milliseconds, shape (n,).
+            columns: Channel names, one per row of ``values``.
+            values: Integer samples of shape (C, n); float arrays are accepted when
+                every value is integral.
+
+        Raises:
+            ValueError: If a value is not an integer or does not fit in int32 (the
+                store is lossless, so such batches are rejected instead of truncated).
+        """
+        timestamps = numpy.asarray(timestamps, dtype=numpy.int64)
+        values = integer_samples(values)
+        if timestamps.shape[0] == 0:
+            return
+        stream = self._streams.get(device_id)
+        if stream is not None and stream.channels != list(columns):
+            # Channel layout changed: close the current segment and start a new stream.
+            stream.close()
+            self._closed_bytes += stream.bytes_written
+            stream = None
+        if stream is None:
+            stream = DeviceStream(self.device_folder(device_id), columns, self.segment_ms, self.flush_rows,
+                                  self.flush_seconds, self.fsync, self.level, self.index(device_id, create=True))
+            self._streams[device_id] = stream
+        stream.append(timestamps, values)
+        self.rows_written += timestamps.shape[0]
+
+    def flush(self) -> None:
+        for stream in self._streams.values():
+            stream.flush()
+
+    def flush_idle(self) -> None:
+        """Flushes devices whose buffered rows are older than ``flush_seconds`` (call periodically)."""
+        now = time.monotonic()
+        for stream in self._streams.values():
+            stream.flush_if_idle(now, self.flush_seconds)
+
+    def close_device(self, device_id: str) -> None:
+        """Flushes and closes the open segment of one device (e.g. when its session is evicted)."""
+        stream = self._streams.pop(device_id, None)
+        if stream is not None:
+            stream.close()
+            self._closed_bytes += stream.bytes_written
+
+    def close(self) -> None:
+        for device_id in list(self._streams):
+            self.close_device(device_id)
+
+    def device_folder(self, device_id: str) -> Path:
+        """Folder of a device's segments; ValueError unless it is a direct child of ``root``."""
+        folder = self.root / device_id
+        if folder.resolve().parent != self.root.resolve():
+            raise ValueError(f"Invalid device id for the segment store: {device_id!r}")
+        return folder
+
+    def index(self, device_id: str, create: bool = False) -> SegmentIndex:
+        """The manifest of a device (loaded once and kept up to date by the writer).
+
+        Only devices with a manifest on disk, or written through this store
+        (``create``), are cached. Any other id (e.g. a client asking for an unknown
+        device) gets an empty, uncached index, so lookups cannot grow the cache.
+        """
+        index = self._indexes.get(device_id)
+        if index is None:
+            index = SegmentIndex(self.device_folder(device_id))
+            if create or index.path.exists():
+                self._indexes[device_id] = index
+        return index
+
+    def devices(self) -> list[str]:
+        """Device ids with stored data."""
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir())
+
+    def time_range(self, device_id: str, start_ms: Optional[int] = None,
+                   end_ms: Optional[int] = None) -> Optional[tuple[int, int]]:
+        """Stored time range of a device clipped to ``[start_ms, end_ms]``, or None without data in it."""
+        entries = self.index(device_id).overlapping(start_ms, end_ms)
+        if not entries:
+            return None
+        first = min(e["min_ts"] for e in entries)
+        last = max(e["max_ts"] for e in entries)
+        return (first if start_ms is None else max(first, start_ms), last if end_ms is None else min(last, end_ms))
+
+    def flush_device(self, device_id: str) -> None:
+        """Writes the buffered rows of a device so readers see them."""
+        stream = self._streams.get(device_id)
+        if stream is not None:
+            stream.flush()
+
+    def segments(self, device_id: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> list[Path]:
+        """Segment files of a device overlapping ``[start_ms, end_ms]``, in chronological order."""
+        folder = self.device_folder(device_id)
+        return [folder / e["segment"] for e in self.index(device_id).overlapping(start_ms, end_ms)]
+
+    def query(self, device_id: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None,
+              channels: Optional[list[str]] = None) -> Iterator[tuple[list[str], numpy.ndarray, numpy.ndarray]]:
+        """Yields ``(channels, timestamps, values)`` chunks of a device within ``[start_ms, end_ms]``.
+
+        Only segments overlapping the range (according to the manifest) are opened,
+        and they are read through memory mapping one block at a time.
+        """
+        self.flush_device(device_id)  # make buffered rows visible to the reader
+        yield from read_segments(self.segments(device_id, start_ms, end_ms), start_ms, end_ms, channels)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "open_streams": len(self._streams),
+            "rows_written": self.rows_written,
+            "bytes_written": self._closed_bytes + sum(s.bytes_written for s in self._streams.values()),
+        }
+
+
+def export_csv(segment_paths: list[str | Path], out_path: str | Path,
+               start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> str:
+    """Converts segment files to a single CSV with the same layout as ``ppg.csv``."""
+    out_path = Path(out_path)
+    header_written = False
+    with open(out_path, "w", newline="") as out:
+        for path in segment_paths:
+            for channels, timestamps, values in iter_segment_blocks(path, start_ms, end_ms):
+                if not header_written:
+                    out.write("," + ",".join(channels) + "\n")
+                    header_written = True
+                table = numpy.column_stack((timestamps, values.T.astype(numpy.int64)))
+                numpy.savetxt(out, table, fmt="%d", delimiter=",")
+    return str(out_path)
+
+
+if __name__ == "__main__":
+    # python storage.py export <segments root> <device> <out.csv> [<start ms> <end ms>]
+    # python storage.py reindex <segments root> <device>
+    usage = ("Usage: python storage.py export <segments root> <device> <out.csv> [<start ms> <end ms>]\n"
+             "       python storage.py reindex <segments root> <device>")
+    if len(sys.argv) == 4 and sys.argv[1] == "reindex":
+        index = SegmentStore(sys.argv[2]).index(sys.argv[3])
+        index.rebuild()
+        print(f"Indexed {len(index.entries)} segment(s) in {index.path}")
+        sys.exit(0)
+    if len(sys.argv) not in (5, 7) or sys.argv[1] != "export":
+        print(usage)
+        sys.exit(2)
+    start, end = (int(sys.argv[5]), int(sys.argv[6])) if len(sys.argv) == 7 else (None, None)
+    store = SegmentStore(sys.argv[2])
+    paths = store.segments(sys.argv[3], start, end)
+    if not paths:
+        print(f"No segments found for device '{sys.argv[3]}'")
+        sys.exit(1)
+    print(f"Exported {len(paths)} segment(s) to {export_csv(paths, sys.argv[4], start, end)}")
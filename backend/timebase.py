@@ -0,0 +1,194 @@
+"""Timestamp normalization and resampling onto an exact sampling grid.
+
+Devices send timestamps as epoch milliseconds, epoch seconds or datetime
+strings, with jitter from their clocks and radio, and with gaps when the link
+drops. The processing path (inference windows, GREEN video, session image)
+expects samples exactly ``1 / fs`` apart, so each batch goes through:
+
+- ``to_epoch_ms``: the whole index converted to int64 epoch milliseconds in one
+  vectorized call
+- ``GridResampler``: samples linearly interpolated onto a ``period_ms`` grid that
+  continues across batches; interpolation never spans more than ``max_gap_ms``,
+  so a longer gap ends the current run and restarts the grid at the next sample
+
+Stored and broadcast raw data keep the received samples; only their timestamps
+are normalized.
+"""
+import time
+from typing import NamedTuple, Optional
+import numpy
+
+# Epoch values above these are milliseconds / seconds (2001-09-09 in either unit)
+EPOCH_MS_MIN = 1e11
+EPOCH_S_MIN = 1e9
+
+
+def to_epoch_ms(timestamps, now: Optional[float] = None) -> tuple[numpy.ndarray, numpy.ndarray]:
+    """Converts a batch index to int64 epoch milliseconds in one operation.
+
+    Numbers are read as epoch milliseconds or seconds, the unit being chosen
+    per batch from its median. Smaller numbers are not epochs (e.g. a counter since
+    boot) and are taken as milliseconds relative to ``now``, with the last sample
+    arriving now. Strings are parsed as ISO 8601 datetimes (UTC unless they carry an
+    offset).
+
+    Returns:
+        ``(timestamps_ms, valid)``: int64 timestamps of the valid samples and the
+        boolean mask of the input samples that could be parsed.
+    """
+    ts = numpy.asarray(timestamps)
+    if ts.dtype.kind in "iuf":
+        ms = ts.astype(numpy.float64)
+        valid = numpy.isfinite(ms)
+        ms = ms[valid]
+        if ms.size:
+            median = float(numpy.median(ms))
+            if median > EPOCH_MS_MIN:
+                pass
+            elif median > EPOCH_S_MIN:
+                ms = ms * 1000.0
+            else:
+                ms = (time.time() if now is None else now) * 1000.0 - (ms[-1] - ms)
+        return numpy.round(ms).astype(numpy.int64), valid
+    if ts.dtype.kind == "M":
+        ms = ts.astype("datetime64[ms]")
+    else:
+        ms = _parse_datetimes(ts.astype(str))
+    valid = ~numpy.isnat(ms)
+    return ms[valid].astype(numpy.int64), valid
+
+
+def _parse_datetimes(values: numpy.ndarray) -> numpy.ndarray:
+    """datetime64[ms] of ISO strings; numpy first, pandas (imported lazily) for other layouts or offsets."""
+    try:
+        if not any(v.endswith("Z") or "+" in v[10:] for v in values[:1]):
+            return values.astype("datetime64[ms]")
+    except ValueError:
+        pass
+    import pandas
+    parsed = pandas.to_datetime(pandas.Series(values), utc=True, errors="coerce", format="mixed")
+    return parsed.dt.tz_localize(None).to_numpy(dtype="datetime64[ms]")
+
+
+class Run(NamedTuple):
+    """Consecutive grid samples: ``restart`` is True when a gap separates them from the previous run."""
+    timestamps: numpy.ndarray
+    values: numpy.ndarray
+    restart: bool
+
+
+class GridResampler:
+    """Resamples a stream of batches onto an exact grid with bounded linear interpolation.
+
+    The grid is anchored at the first sample of the stream and advances by
+    ``period_ms``; each batch yields the grid points up to its last sample, the
+    remainder coming with the next batch (so output lags input by less than one
+    period). Samples at or before the previous sample time (duplicates, clock steps
+    backwards) are dropped. A step between samples longer than ``max_gap_ms`` is a
+    gap: nothing is interpolated across it and the grid restarts at the sample after
+    it.
+    """
+
+    def __init__(self, period_ms: float = 40.0, max_gap_ms: float = 200.0):
+        """
+        Args:
+            period_ms: Grid step in milliseconds (40 for 25 Hz).
+            max_gap_ms: Longest step between samples that is still interpolated.
+        """
+        if period_ms <= 0 or max_gap_ms < period_ms:
+            raise ValueError("period_ms must be > 0 and max_gap_ms >= period_ms")
+        self.period_ms = float(period_ms)
+        self.max_gap_ms = float(max_gap_ms)
+        # last input sample (interpolation continues from it) and next grid time
+        self._last_ts: Optional[float] = None
+        self._last_values: Optional[numpy.ndarray] = None
+        self._next_ts: Optional[float] = None
+
+        self.samples_in = 0
+        self.samples_out = 0
+        self.dropped = 0
+        self.gaps = 0
+        self.max_jitter_ms = 0.0
+
+    def process(self, timestamps: numpy.ndarray, values: numpy.ndarray) -> list[Run]:
+        """Resamples a batch (timestamps (N,) in ms, values (C, N)).
+
+        Returns:
+            The grid runs of the batch, usually one; each gap starts a new run.
+            Timestamps are int64 ms and values float32 of shape (C, n).
+        """
+        ts = numpy.asarray(timestamps, dtype=numpy.float64)
+        values = numpy.asarray(values, dtype=numpy.float64)
+        self.samples_in += ts.shape[0]
+        if ts.shape[0] == 0:
+            return []
+
+        # Fast path: a batch continuing the grid exactly (well-behaved clock) passes through
+        if ts[0] == self._next_ts and (ts.shape[0] == 1 or numpy.all(numpy.diff(ts) == self.period_ms)):
+            self._last_ts = self._next_ts = float(ts[-1])
+            self._next_ts += self.period_ms
+            self._last_values = values[:, -1].copy()
+            self.samples_out += ts.shape[0]
+            return [Run(ts.astype(numpy.int64), values.astype(numpy.float32), False)]
+
+        # Strictly increasing timestamps only (interpolation needs them sorted)
+        previous = -numpy.inf if self._last_ts is None else self._last_ts
+        keep = ts > numpy.maximum.accumulate(numpy.concatenate(([previous], ts[:-1])))
+        self.dropped += int(ts.shape[0] - keep.sum())
+        ts, values = ts[keep], values[:, keep]
+        if ts.shape[0] == 0:
+            return []
+
+        restart = self._last_ts is None
+        if restart:
+            src_ts, src_values = ts, values
+            self._next_ts = ts[0]
+        else:
+            src_ts = numpy.concatenate(([self._last_ts], ts))
+            src_values = numpy.concatenate((self._last_values[:, None], values), axis=1)
+        self._last_ts = float(src_ts[-1])
+        self._last_values = src_values[:, -1].copy()
+
+        steps = numpy.diff(src_ts)
+        if steps.size:
+            self.max_jitter_ms = max(self.max_jitter_ms, float(numpy.max(numpy.abs(steps[steps <= self.max_gap_ms]
+                                                                                   - self.period_ms), initial=0.0)))
+        # One run per stretch without gaps (a Python loop over gaps, not over samples)
+        cuts = numpy.flatnonzero(steps > self.max_gap_ms) + 1
+        self.gaps += cuts.size
+        runs = []
+        start = 0
+        for stop in list(cuts) + [src_ts.shape[0]]:
+            if start > 0:
+                restart = True
+                self._next_ts = src_ts[start]
+            run = self._interpolate(src_ts[start:stop], src_values[:, start:stop], restart)
+            if run is not None:
+                runs.append(run)
+            start = stop
+        return runs
+
+    def _interpolate(self, src_ts: numpy.ndarray, src_values: numpy.ndarray, restart: bool) -> Optional[Run]:
+        n = int(numpy.floor((src_ts[-1] - self._next_ts) / self.period_ms)) + 1
+        if n <= 0:
+            return None
+        grid = self._next_ts + self.period_ms * numpy.arange(n)
+        self._next_ts = float(grid[-1] + self.period_ms)
+        # Bracketing source samples of every grid point, all channels at once
+        right = numpy.clip(numpy.searchsorted(src_ts, grid, side="right"), 1, src_ts.shape[0] - 1) \
+            if src_ts.shape[0] > 1 else numpy.zeros(n, dtype=numpy.intp)
+        left = numpy.maximum(right - 1, 0)
+        span = src_ts[right] - src_ts[left]
+        weight = numpy.divide(grid - src_ts[left], span, out=numpy.zeros(n), where=span > 0)
+        out = src_values[:, left] + (src_values[:, right] - src_values[:, left]) * weight
+        self.samples_out += n
+        return Run(numpy.round(grid).astype(numpy.int64), out.astype(numpy.float32), restart)
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "samples_in": self.samples_in,
+            "samples_out": self.samples_out,
+            "dropped": self.dropped,
+            "gaps": self.gaps,
+            "max_jitter_ms": self.max_jitter_ms,
+        }
@@ -4,6 +4,9 @@
 # Conserva soporte para límites Y fijos o dinámicos suavizados.
 
 import os
+import asyncio
+import threading
+from collections import deque
 from datetime import datetime
 from typing import Optional, Tuple
 import numpy as np
@@ -262,3 +265,342 @@ class GreenChannelVideoRecorder:
 
     def get_video_path(self):
         return self.video_path
+
+
+class RasterGreenChannelVideoRecorder(GreenChannelVideoRecorder):
+    """
+    Variante rápida del recorder: no redibuja la figura de matplotlib en cada frame.
+
+    El "chrome" estático (fondo, grid, ejes) se dibuja una sola vez y se cachea como imagen
+    BGR uint8. Cada frame parte de esa imagen (más las etiquetas actuales), dibuja la traza
+    directamente con cv2.polylines y solo redibuja las etiquetas de los ticks que cambiaron.
+    Las líneas del grid están en posiciones fijas; las etiquetas Y muestran el valor de cada
+    línea según los límites Y (fijos o suavizados) del frame.
+    """
+
+    GRID_COLOR = (240, 240, 240)   # lightgray con alpha 0.35 sobre blanco (BGR)
+    AXIS_COLOR = (17, 17, 17)      # '#111111'
+    TRACE_COLOR = (255, 144, 30)   # '#1E90FF' en BGR
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    FONT_SCALE = 0.35
+    N_YTICKS = 5
+    SHIFT = 4                      # bits de precisión subpíxel para cv2.polylines
+
+    def _init_figure(self):
+        # Márgenes del área de trazado (en píxeles)
+        self.left = 44
+        self.right = self.width - 8
+        self.top = 8
+        self.bottom = self.height - 20
+        self.plot_w = self.right - self.left
+        self.plot_h = self.bottom - self.top
+
+        self._display_window = None
+        self._chrome: Optional[np.ndarray] = None   # fondo + grid + ejes
+        self._base: Optional[np.ndarray] = None     # chrome + etiquetas actuales
+        self._frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self._x_labels: list = []
+        self._y_labels: list = []
+        self._y_tick_px = np.linspace(self.bottom, self.top, self.N_YTICKS)
+
+    def _build_chrome(self, display_window_seconds: float):
+        img = np.full((self.height, self.width, 3), 255, dtype=np.uint8)
+
+        ticks = np.arange(0.0, display_window_seconds + 0.001, 1.0)
+        self._x_tick_px = self.left + ticks / display_window_seconds * self.plot_w
+        for x in self._x_tick_px:
+            xi = int(round(x))
+            cv2.line(img, (xi, self.top), (xi, self.bottom), self.GRID_COLOR, 1)
+            cv2.line(img, (xi, self.bottom), (xi, self.bottom + 3), self.AXIS_COLOR, 1)
+        for y in self._y_tick_px:
+            yi = int(round(y))
+            cv2.line(img, (self.left, yi), (self.right, yi), self.GRID_COLOR, 1)
+            cv2.line(img, (self.left - 3, yi), (self.left, yi), self.AXIS_COLOR, 1)
+
+        # Ejes visibles: left & bottom
+        cv2.line(img, (self.left, self.top), (self.left, self.bottom), self.AXIS_COLOR, 1)
+        cv2.line(img, (self.left, self.bottom), (self.right, self.bottom), self.AXIS_COLOR, 1)
+
+        self._chrome = img
+        self._base = img.copy()
+        self._display_window = display_window_seconds
+        self._x_labels = [None] * len(self._x_tick_px)
+        self._y_labels = [None] * len(self._y_tick_px)
+
+    def _label_box(self, text: str, anchor: Tuple[int, int], align: str):
+        (tw, th), baseline = cv2.getTextSize(text, self.FONT, self.FONT_SCALE, 1)
+        ax, ay = anchor
+        if align == 'x':     # centrado bajo el tick
+            org = (ax - tw // 2, ay + th + 6)
+        else:                # alineado a la derecha del tick Y
+            org = (ax - tw - 6, ay + th // 2)
+        return org, (org[0] - 1, org[1] - th - 1, org[0] + tw + 1, org[1] + baseline + 1)
+
+    def _set_label(self, labels: list, i: int, text: str, anchor: Tuple[int, int], align: str):
+        """Redibuja una etiqueta en la imagen base solo si su texto cambió."""
+        current = labels[i]
+        if current is not None and current[0] == text:
+            return
+        if current is not None:
+            # restaurar la zona de la etiqueta anterior desde el chrome
+            x0, y0, x1, y1 = current[1]
+            x0, y0 = max(x0, 0), max(y0, 0)
+            self._base[y0:y1, x0:x1] = self._chrome[y0:y1, x0:x1]
+        org, box = self._label_box(text, anchor, align)
+        cv2.putText(self._base, text, org, self.FONT, self.FONT_SCALE, self.AXIS_COLOR, 1, cv2.LINE_AA)
+        labels[i] = (text, box)
+
+    def write_frame_from_arrays_with_timestamps(self,
+                                               processed: np.ndarray,
+                                               timestamps: np.ndarray,
+                                               display_window_seconds: float = 6.0):
+        """Misma interfaz que GreenChannelVideoRecorder, pero rasteriza directamente con OpenCV."""
+        if self._closed:
+            raise RuntimeError("Recorder already closed")
+        if processed is None or timestamps is None:
+            return
+        if processed.shape[0] != self.window or timestamps.shape[0] != self.window:
+            raise ValueError("processed/timestamps must have length == recorder.window")
+
+        if self.start_time is None:
+            self.start_time = float(timestamps[0])
+        if self._display_window != display_window_seconds:
+            self._build_chrome(display_window_seconds)
+
+        t_now = float(timestamps[-1])
+        t0 = t_now - float(display_window_seconds)
+        x_all = timestamps - t0
+        mask = (x_all >= 0.0) & (x_all <= display_window_seconds)
+        x_disp = x_all[mask]
+        proc_disp = processed[mask]
+
+        self._ensure_writer()
+        if x_disp.size == 0:
+            self._frame.fill(255)
+            self.writer.write(self._frame)
+            return
+
+        ymin = float(np.min(proc_disp))
+        ymax = float(np.max(proc_disp))
+        if ymax == ymin:
+            ymax += 1.0
+            ymin -= 1.0
+        ymin_use, ymax_use = self._compute_smoothed_ylim(ymin, ymax)
+
+        # Etiquetas X: segundos enteros transcurridos; Y: valor de cada línea del grid
+        elapsed_start_int = max(int(np.floor(t0 - self.start_time)), 0)
+        for i, x in enumerate(self._x_tick_px):
+            self._set_label(self._x_labels, i, str(elapsed_start_int + i), (int(round(x)), self.bottom), 'x')
+        for i, y in enumerate(self._y_tick_px):
+            value = ymin_use + (ymax_use - ymin_use) * i / (self.N_YTICKS - 1)
+            self._set_label(self._y_labels, i, f"{value:.1f}", (self.left, int(round(y))), 'y')
+
+        np.copyto(self._frame, self._base)
+
+        # Traza: coordenadas de datos -> píxeles (con precisión subpíxel), recortada al área
+        scale = float(1 << self.SHIFT)
+        px = (self.left + x_disp * (self.plot_w / display_window_seconds)) * scale
+        py = (self.top + (ymax_use - proc_disp) * (self.plot_h / (ymax_use - ymin_use))) * scale
+        np.clip(py, self.top * scale, self.bottom * scale, out=py)
+        pts = np.stack((px, py), axis=1).astype(np.int32).reshape(-1, 1, 2)
+        cv2.polylines(self._frame, [pts], False, self.TRACE_COLOR, 2, cv2.LINE_AA, self.SHIFT)
+
+        self.writer.write(self._frame)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.writer is not None:
+            try:
+                self.writer.release()
+            except Exception:
+                pass
+
+class FrameRenderWorker:
+    """
+    Renderiza y codifica frames de los recorders en un hilo dedicado, alimentado por una
+    cola acotada. Así el handler HTTP solo encola las ventanas y no bloquea el event loop.
+
+    Políticas de desborde (cuando la cola está llena):
+      - 'drop_oldest': descarta el frame más antiguo de la cola.
+      - 'coalesce': reemplaza el último frame pendiente del mismo recorder por el nuevo
+        (si no hay ninguno, descarta el más antiguo).
+      - 'block': espera hasta que haya sitio (ver submit_async para no bloquear el event loop).
+    """
+
+    POLICIES = ('drop_oldest', 'coalesce', 'block')
+
+    def __init__(self, max_queue: int = 500, policy: str = 'drop_oldest'):
+        if max_queue < 1:
+            raise ValueError("max_queue must be >= 1")
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}")
+        self.max_queue = int(max_queue)
+        self.policy = policy
+
+        # items: ('frame', recorder, processed, timestamps, display_window_seconds) | ('close', recorder)
+        self._queue = deque()
+        self._frames_pending = 0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+        self.frames_coalesced = 0
+        self.render_errors = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="green-video-render", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Procesa lo que queda en la cola (incluidos los cierres) y detiene el hilo."""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, recorder: "GreenChannelVideoRecorder", frames, display_window_seconds: float = 6.0):
+        """
+        Encola frames (lista de (processed, timestamps)) para un recorder.
+        Los arrays deben ser propiedad del llamador (no vistas que vayan a cambiar).
+        """
+        with self._cond:
+            for processed, timestamps in frames:
+                item = ('frame', recorder, processed, timestamps, display_window_seconds)
+                if self.policy == 'block':
+                    while self._frames_pending >= self.max_queue and not self._stopping:
+                        self._cond.wait()
+                if self._frames_pending >= self.max_queue:
+                    if self.policy == 'coalesce' and self._replace_last_frame(recorder, item):
+                        self.frames_coalesced += 1
+                        continue
+                    self._drop_oldest_frame()
+                self._queue.append(item)
+                self._frames_pending += 1
+            self._cond.notify_all()
+
+    async def submit_async(self, recorder: "GreenChannelVideoRecorder", frames, display_window_seconds: float = 6.0):
+        """Como submit, pero con la política 'block' espera en un hilo para no bloquear el event loop."""
+        if self.policy == 'block':
+            await asyncio.to_thread(self.submit, recorder, frames, display_window_seconds)
+        else:
+            self.submit(recorder, frames, display_window_seconds)
+
+    def close_recorder(self, recorder: "GreenChannelVideoRecorder"):
+        """Encola el cierre del recorder tras sus frames pendientes (nunca se descarta)."""
+        with self._cond:
+            self._queue.append(('close', recorder))
+            self._cond.notify_all()
+        if self._thread is None:
+            # sin hilo (p.ej. ya detenido): cerrar directamente lo pendiente
+            self._drain()
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "max_queue": self.max_queue,
+            "queue_depth": self._frames_pending,
+            "frames_rendered": self.frames_rendered,
+            "frames_dropped": self.frames_dropped,
+            "frames_coalesced": self.frames_coalesced,
+            "render_errors": self.render_errors,
+        }
+
+    def _replace_last_frame(self, recorder, item) -> bool:
+        for i in range(len(self._queue) - 1, -1, -1):
+            queued = self._queue[i]
+            if queued[1] is recorder:
+                if queued[0] != 'frame':
+                    return False
+                self._queue[i] = item
+                return True
+        return False
+
+    def _drop_oldest_frame(self):
+        for i, queued in enumerate(self._queue):
+            if queued[0] == 'frame':
+                del self._queue[i]
+                self._frames_pending -= 1
+                self.frames_dropped += 1
+                return
+
+    def _next_item(self):
+        with self._cond:
+            while not self._queue and not self._stopping:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            item = self._queue.popleft()
+            if item[0] == 'frame':
+                self._frames_pending -= 1
+            self._cond.notify_all()
+            return item
+
+    def _process(self, item):
+        try:
+            if item[0] == 'frame':
+                _, recorder, processed, timestamps, display_window_seconds = item
+                recorder.write_frame_from_arrays_with_timestamps(
+                    processed, timestamps, display_window_seconds=display_window_seconds
+                )
+                self.frames_rendered += 1
+            else:
+                item[1].close()
+        except Exception as e:
+            self.render_errors += 1
+            print(f"Error rendering GREEN frame: {e}")
+
+    def _run(self):
+        while True:
+            item = self._next_item()
+            if item is None:
+                return
+            self._process(item)
+
+    def _drain(self):
+        while True:
+            with self._cond:
+                if not self._queue:
+                    return
+                item = self._queue.popleft()
+                if item[0] == 'frame':
+                    self._frames_pending -= 1
+            self._process(item)
+
+
+class BackgroundRecorder:
+    """
+    Fachada de un GreenChannelVideoRecorder cuyos frames se renderizan en un FrameRenderWorker.
+    Expone start_time / get_video_path como el recorder y encola escrituras y cierre.
+    """
+
+    def __init__(self, recorder: GreenChannelVideoRecorder, worker: FrameRenderWorker):
+        self.recorder = recorder
+        self.worker = worker
+
+    @property
+    def start_time(self):
+        return self.recorder.start_time
+
+    @start_time.setter
+    def start_time(self, value):
+        self.recorder.start_time = value
+
+    async def write_frames(self, frames, display_window_seconds: float = 6.0):
+        """Encola los frames (lista de (processed, timestamps)) y retorna sin esperar al render."""
+        await self.worker.submit_async(self.recorder, frames, display_window_seconds)
+
+    def close(self):
+        self.worker.close_recorder(self.recorder)
+
+    def get_video_path(self):
+        return self.recorder.get_video_path()
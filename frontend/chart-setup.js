@@ -165,7 +165,10 @@ export function updateProcessedCharts(inferenceData) {
 
        // Update title with inference result
        const baseTitle = channel.toUpperCase() + ' (Procesado)';
-       const inferenceText = `${data.label} (${(data.confidence * 100).toFixed(1)}%)`;
+       // Low-quality windows skip the model: show their signal-quality index instead
+       const inferenceText = data.label === 'LOW_QUALITY'
+         ? `Baja calidad (SQI ${(data.sqi ?? 0).toFixed(2)})`
+         : `${data.label} (${(data.confidence * 100).toFixed(1)}%)`;
        chart.options.plugins.title.text = `${baseTitle} - ${inferenceText}`;
 
        chart.update();
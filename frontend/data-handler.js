@@ -1,6 +1,102 @@
 // data-handler.js
 // Parse incoming payloads and normalize to { columns, timestampsSec, columnsData }
+
+// Binary frames (?format=binary, see backend/protocol.py for the layout)
+const FRAME_VERSION = 1;
+const FLAG_INFERENCE = 0x01;
+const FLAG_INT16 = 0x02;
+const FLAG_FULL_WINDOW = 0x04;
+const FLAG_FLOAT_VALUES = 0x08;
+const SQI_SCALE = 10000;
+const SQI_MISSING = 0xffff;
+const textDecoder = new TextDecoder();
+
+// Processed windows per `${device}/${channel}`, rebuilt from the tails sent in binary frames
+const processedWindows = new Map();
+
+const align = (offset, n) => offset + ((n - (offset % n)) % n);
+
+export function decodeBinaryFrame(buffer, pageLoadTs) {
+  const bytes = new Uint8Array(buffer);
+  const view = new DataView(buffer);
+  if (buffer.byteLength < 16 || textDecoder.decode(bytes.subarray(0, 4)) !== 'PPGW' || bytes[4] !== FRAME_VERSION) {
+    return null;
+  }
+  const flags = bytes[5];
+  const nChannels = bytes[6];
+  const deviceLength = bytes[7];
+  const nRows = view.getUint32(8, true);
+  const nResults = view.getUint16(12, true);
+  const windowLength = view.getUint16(14, true);
+
+  let offset = 16;
+  const device = textDecoder.decode(bytes.subarray(offset, offset + deviceLength));
+  offset += deviceLength;
+  const columns = [];
+  for (let c = 0; c < nChannels; c++) {
+    const length = bytes[offset];
+    columns.push(textDecoder.decode(bytes.subarray(offset + 1, offset + 1 + length)));
+    offset += 1 + length;
+  }
+  offset = align(offset, 8);
+
+  // Sample blocks are aligned, so they are read as typed-array views
+  const timestamps = new Float64Array(buffer, offset, nRows);
+  offset += 8 * nRows;
+  const ValueArray = flags & FLAG_FLOAT_VALUES ? Float32Array : Int32Array;
+  const columnsData = [];
+  for (let c = 0; c < nChannels; c++) {
+    columnsData.push(Array.from(new ValueArray(buffer, offset, nRows)));
+    offset += 4 * nRows;
+  }
+  offset = align(offset, 8);
+  const timestampsSec = Array.from(timestamps, (ms) => (ms - pageLoadTs) / 1000);
+
+  let inference = null;
+  if (flags & FLAG_INFERENCE) {
+    inference = {};
+    for (let r = 0; r < nResults; r++) {
+      const channel = columns[bytes[offset]];
+      const labelLength = bytes[offset + 1];
+      const shift = view.getUint16(offset + 2, true);
+      const count = view.getUint16(offset + 4, true);
+      const sqiRaw = view.getUint16(offset + 6, true);
+      const confidence = view.getFloat32(offset + 8, true);
+      const scale = view.getFloat32(offset + 12, true);
+      const label = textDecoder.decode(bytes.subarray(offset + 16, offset + 16 + labelLength));
+      offset = align(offset + 16 + labelLength, 4);
+      let samples;
+      if (flags & FLAG_INT16) {
+        samples = Float32Array.from(new Int16Array(buffer, offset, count), (v) => v * scale);
+        offset += 2 * count;
+      } else {
+        samples = new Float32Array(buffer, offset, count);
+        offset += 4 * count;
+      }
+      offset = align(offset, 8);
+
+      // Full windows replace the stored one; tails shift the window and overwrite its end
+      const key = `${device}/${channel}`;
+      let window = processedWindows.get(key);
+      if (flags & FLAG_FULL_WINDOW) {
+        window = Float32Array.from(samples);
+        processedWindows.set(key, window);
+      } else if (window && window.length === windowLength) {
+        window.copyWithin(0, shift);
+        window.set(samples, windowLength - count);
+      } else {
+        continue;  // no full window yet for this device/channel
+      }
+      const sqi = sqiRaw === SQI_MISSING ? undefined : sqiRaw / SQI_SCALE;
+      inference[channel] = { signal: Array.from(window), label, confidence, sqi };
+    }
+  }
+
+  return { device, columns, timestampsSec, columnsData, inference };
+}
+
 export function parsePayload(payload, pageLoadTs) {
+  if (payload instanceof ArrayBuffer) return decodeBinaryFrame(payload, pageLoadTs);
   if (!payload || typeof payload !== 'object') return null;
 
   let rawPayload = payload;
@@ -69,7 +69,7 @@ if (stopButton) {
 }
 
 // start websocket and feed parsed payloads into the chart
-connect('ws://localhost:8000/ws', (payload) => {
+connect('ws://localhost:8000/ws?format=binary', (payload) => {
   const parsed = parsePayload(payload, pageLoadTs);
   if (!parsed) {
     console.warn('Unhandled payload format', payload);
@@ -1,13 +1,15 @@
 // ws-client.js
 export function connect(url, onPayload) {
   const ws = new WebSocket(url);
+  // binary frames (?format=binary) arrive as ArrayBuffer and are decoded by data-handler.js
+  ws.binaryType = 'arraybuffer';
   ws.onopen = () => console.log('ws open');
   ws.onerror = (e) => console.error('WebSocket error', e);
   ws.onclose = (e) => console.log('ws closed', e);
   ws.onmessage = (e) => {
     let payload = null;
     try {
-      payload = JSON.parse(e.data);
+      payload = e.data instanceof ArrayBuffer ? e.data : JSON.parse(e.data);
     } catch (err) {
       console.error('Failed to parse WS message', err);
       return;
@@ -20,3 +22,9 @@ export function connect(url, onPayload) {
   };
   return ws;
 }
+
+// Change the subscription of an open connection, e.g.
+// subscribe(ws, { format: 'binary', devices: ['watch-1'], channels: ['GREEN'], processed: 'int16' })
+export function subscribe(ws, options) {
+  ws.send(JSON.stringify({ type: 'subscribe', ...options }));
+}